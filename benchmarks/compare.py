@@ -0,0 +1,53 @@
+"""
+Compare two benchmark result files written by run_benchmarks.
+
+    python -m benchmarks.compare baseline.json current.json [--threshold 1.2] [--check]
+
+Prints the wall time and peak memory ratio (current / baseline) of every
+scenario, size and stage found in both files. With `--check` the exit status
+is 1 if any wall time ratio is above `--threshold`. Stages under 5 ms are
+reported but never fail the check; their timings are mostly noise.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Tuple
+
+NOISE_FLOOR_S = 0.005
+
+Key = Tuple[str, int, str]
+
+
+def load(path: str) -> Dict[Key, Dict]:
+    with open(path) as f:
+        report = json.load(f)
+    return {(row["scenario"], row["size"], row["stage"]): row for row in report["results"]}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument("--check", action="store_true", help="fail on a wall time regression")
+    args = parser.parse_args(argv)
+
+    baseline, current = load(args.baseline), load(args.current)
+    regressions = []
+    print(f"{'scenario':<20} {'size':>7} {'stage':<11} {'base s':>9} {'now s':>9} {'time x':>7} {'mem x':>7}")
+    for key in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[key], current[key]
+        time_ratio = after["wall_s"] / before["wall_s"] if before["wall_s"] else float("inf")
+        memory_ratio = after["peak_mb"] / before["peak_mb"] if before["peak_mb"] else float("inf")
+        regressed = time_ratio > args.threshold and max(before["wall_s"], after["wall_s"]) >= NOISE_FLOOR_S
+        if regressed:
+            regressions.append(key)
+        scenario, size, stage = key
+        print(f"{scenario:<20} {size:>7} {stage:<11} {before['wall_s']:>9.4f} {after['wall_s']:>9.4f} "
+              f"{time_ratio:>7.2f} {memory_ratio:>7.2f}{'  REGRESSION' if regressed else ''}")
+    print(f"{len(regressions)} regression(s) over {args.threshold:.2f}x")
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Import time of each Lambda entry point, per module, against a budget.
+
+Every run imports the entry point in a fresh interpreter with `-X importtime`,
+like a cold start does, and keeps the median of `--runs` runs.
+
+    python -m benchmarks.import_budget [--runs 5] [--top 10] [--check]
+
+With `--check` the exit status is 1 if an entry point is over its budget.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# Cumulative import time budget per entry point, in milliseconds, on a
+# developer machine; Lambda CPUs at low memory sizes are slower.
+BUDGETS_MS = {
+    "pycontrollers.lambdas.building_clash_lambda_handler": 60,
+    "pycontrollers.lambdas.handle_post_sqs_lambda_handler": 120,
+    # Answers interactive checks synchronously, so its cold starts are user-visible.
+    "pycontrollers.lambdas.project_check_lambda_handler": 120,
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str) -> Dict[str, Tuple[int, int, int]]:
+    """{module: (self us, cumulative us, nesting depth)} for one fresh import of `module`."""
+    env = dict(os.environ, SQS_QUEUE_URL="https://sqs.local/queue", PYTHONPATH=ROOT)
+    env.setdefault("AWS_DEFAULT_REGION", "eu-west-1")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return times
+
+
+def measure(module: str, runs: int) -> Dict[str, Tuple[float, float, int]]:
+    samples: Dict[str, List[Tuple[int, int, int]]] = defaultdict(list)
+    for _ in range(runs):
+        for name, timing in import_times(module).items():
+            samples[name].append(timing)
+    return {
+        name: (statistics.median(t[0] for t in timings) / 1000,
+               statistics.median(t[1] for t in timings) / 1000,
+               timings[0][2])
+        for name, timings in samples.items()
+    }
+
+
+def report(module: str, timings: Dict[str, Tuple[float, float, int]], top: int) -> float:
+    total = timings[module][1]
+    budget = BUDGETS_MS.get(module)
+    verdict = "" if budget is None else f" (budget {budget} ms{', OVER' if total > budget else ''})"
+    print(f"{module}: {total:.1f} ms{verdict}")
+    # Direct imports of the entry point and of its first-party modules.
+    shown = [
+        (name, t) for name, t in timings.items()
+        if name != module and (t[2] <= 2 or name.startswith(("pypackages", "pycontrollers")))
+    ]
+    shown.sort(key=lambda item: item[1][1], reverse=True)
+    print(f"  {'cumulative ms':>13}  {'self ms':>8}  module")
+    for name, (self_ms, cumulative_ms, _) in shown[:top]:
+        print(f"  {cumulative_ms:13.1f}  {self_ms:8.1f}  {name}")
+    return total
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--check", action="store_true", help="fail if an entry point is over budget")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS_MS))
+    args = parser.parse_args(argv)
+
+    over = []
+    for module in args.modules:
+        total = report(module, measure(module, args.runs), args.top)
+        if module in BUDGETS_MS and total > BUDGETS_MS[module]:
+            over.append(module)
+        print()
+    return 1 if args.check and over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
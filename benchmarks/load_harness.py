@@ -0,0 +1,324 @@
+"""
+Load and latency harness for the whole POST -> SQS -> worker -> DynamoDB path.
+
+    python -m benchmarks.load_harness [--jobs 200] [--concurrency 8] [--workers 2] [--batch-size 10]
+                                      [--mix 100=0.8,2000=0.2] [--duplicates 0.2] [--rate 0]
+                                      [--wait 0] [--aws-latency-ms 0] [--output report.json]
+
+Client threads submit synthetic sites (see synthetic_city.py) to
+BuildingClashHandler and poll GET /detect-clash/{task_id} until the result
+is there. Worker threads, each with its own PostSqsLambdaHandler, drain the
+queue in batches like the SQS event source. SQS and DynamoDB are the
+in-process fakes of pypackages/common/local_aws.py, each call optionally
+delayed by `--aws-latency-ms`.
+
+- `--mix`: building counts of the jobs and their weights
+- `--duplicates`: fraction of submissions repeating an earlier job, which
+  exercises the dedup lookup (200 once it is done, 202 while it is pending)
+- `--rate`: jobs per second (open loop; latencies count from each job's
+  scheduled start, so a backlog shows up in them). 0 submits a new job as
+  soon as a client is free.
+
+The report holds throughput, the POST 200/202 counts, and p50/p95/p99
+latencies per stage: the API calls, the time a message waits in the queue,
+the worker's batches and the stages it logs for every record (parse,
+validate, detect, format, store), and end to end from submission to
+result. Everything runs in one process, so CPU-bound stages share the GIL;
+compare reports of the same configuration between commits rather than
+reading them as Lambda timings.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from unittest.mock import patch
+
+import numpy as np
+
+from benchmarks.synthetic_city import GENERATORS
+from pypackages.common import aws_clients
+from pypackages.common.cache import shared_cache
+from pypackages.common.local_aws import InMemoryDynamoDB, InMemoryQueue, InMemoryTable
+
+WORKER_STAGES = ("parse", "validate", "detect", "format", "store")
+# Seconds a client keeps polling for one job before counting it as timed out.
+JOB_TIMEOUT_S = 300.0
+QUEUE_URL = "local-queue"
+
+
+class TimedQueue(InMemoryQueue):
+    """InMemoryQueue that remembers when each message was sent."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent_at: Dict[str, float] = {}
+
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs) -> Dict:
+        sent_at = time.perf_counter()
+        response = super().send_message(QueueUrl, MessageBody, **kwargs)
+        self.sent_at[response["MessageId"]] = sent_at
+        return response
+
+
+class _Delayed:
+    """Proxy sleeping `seconds` before every call, like a network round trip; tables it returns are delayed too."""
+
+    def __init__(self, target, seconds: float):
+        self._target = target
+        self._seconds = seconds
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._seconds)
+            result = attr(*args, **kwargs)
+            return _Delayed(result, self._seconds) if isinstance(result, InMemoryTable) else result
+
+        return call
+
+
+class _MetricsCapture(logging.Handler):
+    """Collects the per-record metrics lines the worker logs."""
+
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.records: List[Dict] = []
+
+    def emit(self, record: logging.LogRecord):
+        message = record.getMessage()
+        if message.startswith('{"metric": "clash_detection"'):
+            self.records.append(json.loads(message))
+
+
+class Recorder:
+    """Latencies by stage and POST status codes, shared by every thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.post_status: Counter = Counter()
+        self.outcomes: Counter = Counter()
+
+    def latency(self, stage: str, seconds: float):
+        with self.lock:
+            self.latencies[stage].append(seconds * 1000)
+
+    def count(self, counter: Counter, key):
+        with self.lock:
+            counter[key] += 1
+
+
+def parse_mix(text: str) -> List[Tuple[int, float]]:
+    """`100=0.8,2000=0.2` -> [(100, 0.8), (2000, 0.2)]."""
+    mix = []
+    for part in text.split(","):
+        size, _, weight = part.partition("=")
+        mix.append((int(size), float(weight or 1)))
+    if not mix or any(size < 1 or weight < 0 for size, weight in mix) or sum(w for _, w in mix) <= 0:
+        raise argparse.ArgumentTypeError(f"invalid job mix: {text}")
+    return mix
+
+
+def make_jobs(count: int, mix: List[Tuple[int, float]], duplicates: float, scenario: str, seed: int) -> List[str]:
+    """Request bodies of `count` submissions, some repeating earlier ones."""
+    rng = random.Random(seed)
+    sizes, weights = zip(*mix)
+    bodies: List[str] = []
+    for index in range(count):
+        if bodies and rng.random() < duplicates:
+            bodies.append(rng.choice(bodies))
+            continue
+        size = rng.choices(sizes, weights)[0]
+        bodies.append(json.dumps({"type": "FeatureCollection",
+                                  "features": GENERATORS[scenario](size, seed=seed * 100003 + index)}))
+    return bodies
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": round(float(p50), 3), "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3), "max": round(max(values), 3)}
+
+
+def _client(api, bodies: List[str], next_job, recorder: Recorder, start: float, rate: float, wait: float,
+            poll_interval: float):
+    query = {"wait": str(wait)} if wait > 0 else None
+    while True:
+        index = next_job()
+        if index is None:
+            return
+        submitted = time.perf_counter()
+        if rate > 0:
+            scheduled = start + index / rate
+            if scheduled > submitted:
+                time.sleep(scheduled - submitted)
+            submitted = scheduled
+        sent = time.perf_counter()
+        response = api.handle({"httpMethod": "POST", "body": bodies[index], "queryStringParameters": query}, None)
+        recorder.latency("api_post", time.perf_counter() - sent)
+        recorder.count(recorder.post_status, response["statusCode"])
+
+        deadline = submitted + JOB_TIMEOUT_S
+        while response["statusCode"] == 202 and time.perf_counter() < deadline:
+            time.sleep(poll_interval)
+            task_id = json.loads(response["body"])["task_id"]
+            sent = time.perf_counter()
+            response = api.handle({"httpMethod": "GET", "pathParameters": {"task_id": task_id}}, None)
+            recorder.latency("api_get", time.perf_counter() - sent)
+        if response["statusCode"] in (200, 303):
+            recorder.latency("end_to_end", time.perf_counter() - submitted)
+            recorder.count(recorder.outcomes, "completed")
+        else:
+            recorder.count(recorder.outcomes, "timed_out" if response["statusCode"] == 202 else "failed")
+
+
+def _worker(handler, queue: TimedQueue, batch_size: int, recorder: Recorder, stop: threading.Event):
+    while not stop.is_set():
+        records = queue.drain(batch_size)
+        if not records:
+            time.sleep(0.002)
+            continue
+        picked_up = time.perf_counter()
+        for record in records:
+            recorder.latency("queue_wait", picked_up - queue.sent_at[record["messageId"]])
+        handler.handle({"Records": records}, None)
+        recorder.latency("worker_batch", time.perf_counter() - picked_up)
+
+
+def run_load(bodies: List[str], concurrency: int, workers: int, batch_size: int = 10, rate: float = 0.0,
+             wait: float = 0.0, poll_interval: float = 0.05, aws_latency_ms: float = 0.0) -> Dict:
+    """Drive the API and worker handlers with `bodies` and return the report."""
+    os.environ.setdefault("SQS_QUEUE_URL", QUEUE_URL)
+    from pycontrollers.lambdas.building_clash_lambda_handler import BuildingClashHandler
+    from pycontrollers.lambdas.handle_post_sqs_lambda_handler import PROJECT_TABLE_NAME, PostSqsLambdaHandler
+
+    queue = TimedQueue()
+    dynamodb = InMemoryDynamoDB({PROJECT_TABLE_NAME: "project_id"})
+    delay = aws_latency_ms / 1000
+    sqs_client = _Delayed(queue, delay) if delay else queue
+    dynamodb_resource = _Delayed(dynamodb, delay) if delay else dynamodb
+    recorder = Recorder()
+    capture = _MetricsCapture()
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+
+    lock = threading.Lock()
+    jobs = iter(range(len(bodies)))
+
+    def next_job() -> Optional[int]:
+        with lock:
+            return next(jobs, None)
+
+    with patch.object(aws_clients, "client", return_value=sqs_client), \
+            patch.object(aws_clients, "resource", return_value=dynamodb_resource):
+        shared_cache.cache_clear()
+        root.handlers[:] = [capture]
+        root.setLevel(logging.INFO)
+        try:
+            api = BuildingClashHandler()
+            stop = threading.Event()
+            worker_threads = [
+                threading.Thread(target=_worker, args=(PostSqsLambdaHandler(), queue, batch_size, recorder, stop))
+                for _ in range(workers)
+            ]
+            start = time.perf_counter()
+            client_threads = [
+                threading.Thread(target=_client,
+                                 args=(api, bodies, next_job, recorder, start, rate, wait, poll_interval))
+                for _ in range(concurrency)
+            ]
+            for thread in worker_threads + client_threads:
+                thread.start()
+            for thread in client_threads:
+                thread.join()
+            wall = time.perf_counter() - start
+            stop.set()
+            for thread in worker_threads:
+                thread.join()
+        finally:
+            root.handlers[:] = saved_handlers
+            root.setLevel(saved_level)
+            shared_cache.cache_clear()
+
+    for metrics in capture.records:
+        for stage in WORKER_STAGES:
+            if stage in metrics["stages_ms"]:
+                recorder.latencies[f"worker_{stage}"].append(metrics["stages_ms"][stage])
+        recorder.latencies["worker_total"].append(metrics["total_ms"])
+
+    completed = recorder.outcomes["completed"]
+    posted = sum(recorder.post_status.values())
+    return {
+        "jobs": len(bodies),
+        "distinct_jobs": len(set(bodies)),
+        "completed": completed,
+        "failed": recorder.outcomes["failed"],
+        "timed_out": recorder.outcomes["timed_out"],
+        "tasks_processed": len(capture.records),
+        "wall_s": round(wall, 3),
+        "throughput_jobs_per_s": round(completed / wall, 3) if wall > 0 else None,
+        "post_status": {str(code): count for code, count in sorted(recorder.post_status.items())},
+        "post_200_ratio": round(recorder.post_status[200] / posted, 3) if posted else None,
+        "latency_ms": {stage: percentiles(values) for stage, values in recorder.latencies.items() if values},
+        # Peak resident memory of the whole process, including job generation.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def print_report(report: Dict, out=sys.stdout):
+    out.write(f"{report['completed']}/{report['jobs']} jobs completed ({report['failed']} failed, "
+              f"{report['timed_out']} timed out) in {report['wall_s']:.2f} s: "
+              f"{report['throughput_jobs_per_s']} jobs/s\n")
+    out.write(f"POST status {report['post_status']}, 200 ratio {report['post_200_ratio']}, "
+              f"{report['tasks_processed']} tasks processed, peak RSS {report['peak_rss_mb']} MB\n")
+    out.write(f"{'stage':<16} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}\n")
+    order = ["api_post", "api_get", "queue_wait", "worker_batch"] + [f"worker_{s}" for s in WORKER_STAGES]
+    order += ["worker_total", "end_to_end"]
+    for stage in order:
+        row = report["latency_ms"].get(stage)
+        if row:
+            out.write(f"{stage:<16} {row['count']:>7} {row['p50']:>10.2f} {row['p95']:>10.2f} "
+                      f"{row['p99']:>10.2f} {row['max']:>10.2f}\n")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the API and worker handlers against local fakes.")
+    parser.add_argument("--jobs", type=int, default=200, help="submissions in total")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--workers", type=int, default=2, help="worker threads, i.e. concurrent worker Lambdas")
+    parser.add_argument("--batch-size", type=int, default=10, help="SQS records per worker invocation")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("100=0.8,2000=0.2"),
+                        help="building counts and weights of the jobs, e.g. 100=0.8,2000=0.2")
+    parser.add_argument("--scenario", choices=sorted(GENERATORS), default="dense_grid")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="fraction of repeated submissions")
+    parser.add_argument("--rate", type=float, default=0.0, help="jobs per second; 0 for a closed loop")
+    parser.add_argument("--wait", type=float, default=0.0, help="?wait= seconds on every POST")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="seconds between status polls")
+    parser.add_argument("--aws-latency-ms", type=float, default=0.0, help="delay added to every SQS/DynamoDB call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report, with its configuration, as JSON")
+    args = parser.parse_args(argv)
+
+    bodies = make_jobs(args.jobs, args.mix, args.duplicates, args.scenario, args.seed)
+    report = run_load(bodies, args.concurrency, args.workers, args.batch_size, args.rate, args.wait,
+                      args.poll_interval, args.aws_latency_ms)
+    print_report(report)
+    if args.output:
+        config = {name: value for name, value in vars(args).items() if name != "output"}
+        with open(args.output, "w") as f:
+            json.dump({"config": config, **report}, f, indent=2)
+    return 0 if report["completed"] == report["jobs"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+End-to-end and per-stage benchmarks of BuildingClashDetectService on
+synthetic sites (see synthetic_city.py).
+
+    python -m benchmarks.run_benchmarks [--scenarios dense_grid ...] [--sizes 10 100 ...]
+                                        [--repeat 3] [--output results.json]
+
+Stages, timed separately on the same input:
+
+- validate: stream the task message into a FootprintStore and build and
+  validate its polygons
+- validate_packed: the same from the site in the packed binary format (see
+  binary_input.py); its payload_bytes are those of the packed input
+- detect: candidate search and exact intersection
+- format: format the clashes and serialize the stored result
+- end_to_end: process_record, with results written to an in-memory table
+
+Wall time is the best of `--repeat` runs. Peak memory is measured in a
+separate run under tracemalloc, so it covers Python and numpy allocations
+but not GEOS's own. The JSON written to `--output` can be compared between
+commits with `python -m benchmarks.compare`.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest.mock import patch
+
+from benchmarks.synthetic_city import GENERATORS
+from pypackages.common.local_aws import InMemoryTable
+from pypackages.common.result_storage import ResultStore, dump_result
+from pypackages.detect_building_clash import building_clash_detect_service
+from pypackages.detect_building_clash.binary_input import pack_footprints, read_packed
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStoreBuilder
+from pypackages.detect_building_clash.geojson_stream import ingest_message
+
+SIZES = (10, 100, 1000, 10000, 100000)
+STAGES = ("validate", "validate_packed", "detect", "format", "end_to_end")
+
+
+def _timed(run: Callable[[], object], repeat: int) -> Tuple[object, float]:
+    best, value = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = run()
+        best = min(best, time.perf_counter() - start)
+    return value, best
+
+
+def _peak_mb(run: Callable[[], object]) -> float:
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_site(scenario: str, size: int, repeat: int, seed: int = 0) -> List[Dict]:
+    """One result row per stage for a `size`-building site of `scenario`."""
+    body = json.dumps({"task_id": f"{scenario}-{size}", "input": {"features": GENERATORS[scenario](size, seed)}})
+    record = {"messageId": "benchmark", "body": body}
+    service = BuildingClashDetectService()
+
+    def validate():
+        builder = FootprintStoreBuilder()
+        ingest_message(body, builder)
+        return builder.build()
+
+    store = validate()
+    clashes = service._process_store(store)
+    stats = service.candidate_stats
+    packed = pack_footprints(store.ids, store.elevations, store.heights, store.coords, store.offsets)
+
+    def validate_packed():
+        builder = FootprintStoreBuilder()
+        builder.add_columns(read_packed(packed))
+        return builder.build()
+
+    def end_to_end():
+        results = ResultStore(InMemoryTable())
+        with patch.object(building_clash_detect_service, "get_result_store", return_value=results):
+            return service.process_record(record)
+
+    stages = {
+        "validate": validate,
+        "validate_packed": validate_packed,
+        "detect": lambda: service._process_store(store),
+        "format": lambda: dump_result({"type": "FeatureCollection", "features": service.format_results(clashes)}),
+        "end_to_end": end_to_end,
+    }
+    rows = []
+    for stage, run in stages.items():
+        _, wall = _timed(run, repeat)
+        row = {
+            "scenario": scenario,
+            "size": size,
+            "stage": stage,
+            "wall_s": round(wall, 6),
+            "peak_mb": round(_peak_mb(run), 3),
+            "payload_bytes": len(packed) if stage == "validate_packed" else len(body),
+            "clashes": len(clashes),
+        }
+        if stage in ("detect", "end_to_end"):
+            row["total_pairs"] = stats.total_pairs
+            row["candidate_pairs"] = stats.candidate_pairs
+            row["pairs_per_s"] = round(stats.total_pairs / wall) if wall > 0 else None
+            row["candidate_pairs_per_s"] = round(stats.candidate_pairs / wall) if wall > 0 else None
+        rows.append(row)
+    return rows
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark clash detection on synthetic sites.")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(GENERATORS), default=list(GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    rows = []
+    print(f"{'scenario':<20} {'size':>7} {'stage':<11} {'wall s':>9} {'peak MB':>9} {'pairs/s':>12}")
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            for row in benchmark_site(scenario, size, args.repeat, args.seed):
+                rows.append(row)
+                pairs_per_s = row.get("pairs_per_s")
+                print(f"{scenario:<20} {size:>7} {row['stage']:<11} {row['wall_s']:>9.4f} {row['peak_mb']:>9.2f} "
+                      f"{pairs_per_s if pairs_per_s is not None else '':>12}")
+
+    if args.output:
+        report = {
+            "commit": _commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "results": rows,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
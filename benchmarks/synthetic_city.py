@@ -0,0 +1,106 @@
+"""
+Seeded generators of synthetic building sites for benchmarks.
+
+Each generator returns `count` GeoJSON features (plain dicts, as they arrive
+in a task message) on a site that grows with `count`, so the density and the
+share of clashing pairs stay roughly the same at every size.
+"""
+import math
+import random
+from typing import Callable, Dict, List
+
+
+def feature(building_id: str, ring: List[List[float]], elevation: float, height: float) -> Dict:
+    ring = [[round(x, 3), round(y, 3)] for x, y in ring]
+    ring.append(ring[0])
+    return {
+        "type": "Feature",
+        "id": building_id,
+        "properties": {"elevation": round(elevation, 2), "height": round(height, 2)},
+        "geometry": {"type": "Polygon", "coordinates": [ring]},
+    }
+
+
+def _lots(count: int, pitch: float):
+    """Lot origins on a square grid, row by row."""
+    columns = max(1, math.ceil(math.sqrt(count)))
+    for n in range(count):
+        yield n, (n % columns) * pitch, (n // columns) * pitch
+
+
+def dense_grid(count: int, seed: int = 0) -> List[Dict]:
+    """Axis-aligned blocks on 20 m lots, a little wider than their lots, on the ground."""
+    rng = random.Random(seed)
+    features = []
+    for n, x, y in _lots(count, 20.0):
+        x, y = x + rng.uniform(-1.5, 1.5), y + rng.uniform(-1.5, 1.5)
+        w, h = rng.uniform(16, 23), rng.uniform(16, 23)
+        ring = [[x, y], [x + w, y], [x + w, y + h], [x, y + h]]
+        features.append(feature(f"grid_{n}", ring, 0.0, rng.uniform(3, 30)))
+    return features
+
+
+def stacked_towers(count: int, seed: int = 0, floors: int = 20) -> List[Dict]:
+    """
+    Towers of `floors` slabs, one building per slab. Slabs shift slightly in
+    plan and overlap the slab below by a few centimetres, so every tower is a
+    stack of elevation bands that clash pairwise with their neighbours only.
+    """
+    rng = random.Random(seed)
+    features = []
+    towers = math.ceil(count / floors)
+    for tower, x, y in _lots(towers, 45.0):
+        size = rng.uniform(20, 35)
+        for floor in range(min(floors, count - len(features))):
+            dx, dy = rng.uniform(-1, 1), rng.uniform(-1, 1)
+            ring = [[x + dx, y + dy], [x + dx + size, y + dy], [x + dx + size, y + dy + size], [x + dx, y + dy + size]]
+            elevation = floor * 3.5 + rng.uniform(-0.02, 0.02)
+            features.append(feature(f"tower_{tower}_{floor}", ring, elevation, 3.55))
+    return features
+
+
+def concave_footprints(count: int, seed: int = 0, vertices: int = 64) -> List[Dict]:
+    """Star-shaped footprints with `vertices` points, each overlapping its neighbours' spikes."""
+    rng = random.Random(seed)
+    features = []
+    for n, x, y in _lots(count, 22.0):
+        cx, cy = x + rng.uniform(-2, 2), y + rng.uniform(-2, 2)
+        ring = []
+        for k in range(vertices):
+            angle = 2 * math.pi * k / vertices
+            radius = rng.uniform(5, 9) if k % 2 else rng.uniform(11, 15)
+            ring.append([cx + radius * math.cos(angle), cy + radius * math.sin(angle)])
+        features.append(feature(f"star_{n}", ring, rng.uniform(0, 10), rng.uniform(3, 10)))
+    return features
+
+
+def many_part_overlaps(count: int, seed: int = 0, teeth: int = 5) -> List[Dict]:
+    """
+    Pairs of a comb-shaped building and a bar crossing all of its teeth, so
+    each clash is a MultiPolygon of `teeth` parts.
+    """
+    rng = random.Random(seed)
+    features = []
+    for n, x, y in _lots(math.ceil(count / 2), 40.0):
+        tooth, gap = rng.uniform(2, 4), rng.uniform(2, 4)
+        width = teeth * tooth + (teeth - 1) * gap
+        # Comb: a spine along the bottom with teeth pointing up.
+        comb = [[x, y], [x + width, y]]
+        for k in reversed(range(teeth)):
+            left = x + k * (tooth + gap)
+            comb += [[left + tooth, y + 4], [left + tooth, y + 25], [left, y + 25], [left, y + 4]]
+        bar_y = y + rng.uniform(10, 18)
+        bar = [[x - 2, bar_y], [x + width + 2, bar_y], [x + width + 2, bar_y + 4], [x - 2, bar_y + 4]]
+        elevation = rng.uniform(0, 5)
+        features.append(feature(f"comb_{n}", comb, elevation, rng.uniform(5, 20)))
+        if len(features) < count:
+            features.append(feature(f"bar_{n}", bar, elevation + rng.uniform(0, 4), rng.uniform(3, 10)))
+    return features
+
+
+GENERATORS: Dict[str, Callable[..., List[Dict]]] = {
+    "dense_grid": dense_grid,
+    "stacked_towers": stacked_towers,
+    "concave_footprints": concave_footprints,
+    "many_part_overlaps": many_part_overlaps,
+}
@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks import compare, load_harness, run_benchmarks
+from benchmarks.synthetic_city import GENERATORS
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStoreBuilder
+from pypackages.detect_building_clash.geojson_stream import read_feature
+
+
+class TestSyntheticCity(unittest.TestCase):
+    def test_generators_make_valid_clashing_sites(self):
+        for name, generate in GENERATORS.items():
+            with self.subTest(name):
+                features = generate(200, seed=3)
+                self.assertEqual(len(features), 200)
+                self.assertEqual(features, generate(200, seed=3))
+                builder = FootprintStoreBuilder()
+                for index, feature in enumerate(features):
+                    builder.add(*read_feature(feature, index))
+                self.assertGreater(len(BuildingClashDetectService()._process_store(builder.build())), 0)
+
+    def test_many_part_overlaps_clash_in_several_parts(self):
+        builder = FootprintStoreBuilder()
+        for index, feature in enumerate(GENERATORS["many_part_overlaps"](2)):
+            builder.add(*read_feature(feature, index))
+        store = builder.build()
+        self.assertEqual(store.polygon(0).intersection(store.polygon(1)).geom_type, "MultiPolygon")
+
+
+class TestBenchmarkRunner(unittest.TestCase):
+    def test_run_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            run_benchmarks.main(["--scenarios", "dense_grid", "--sizes", "10", "--repeat", "1", "--output", output])
+            with open(output) as f:
+                rows = json.load(f)["results"]
+            self.assertEqual([row["stage"] for row in rows], list(run_benchmarks.STAGES))
+            self.assertGreater(rows[list(run_benchmarks.STAGES).index("detect")]["total_pairs"], 0)
+            self.assertEqual(compare.main([output, output, "--check"]), 0)
+
+
+class TestLoadHarness(unittest.TestCase):
+    def test_every_job_completes_and_is_reported(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "load.json")
+            status = load_harness.main(["--jobs", "16", "--concurrency", "4", "--workers", "2", "--mix", "20=1,80=1",
+                                        "--duplicates", "0.3", "--poll-interval", "0.005", "--output", output])
+            with open(output) as f:
+                report = json.load(f)
+        self.assertEqual(status, 0)
+        self.assertEqual(report["completed"], 16)
+        self.assertEqual(sum(report["post_status"].values()), 16)
+        self.assertEqual(report["tasks_processed"], report["distinct_jobs"])
+        for stage in ("api_post", "queue_wait", "worker_detect", "worker_total", "end_to_end"):
+            self.assertLessEqual(report["latency_ms"][stage]["p50"], report["latency_ms"][stage]["p99"])
+        self.assertEqual(report["latency_ms"]["end_to_end"]["count"], 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,26 +1,69 @@
-import hashlib
 import json
-from decimal import Decimal
-import boto3
 import uuid
 import os
 import time
 
-# Initialize DynamoDB and SQS clients
-sqs = boto3.client('sqs')
-dynamodb = boto3.resource('dynamodb')
+from pypackages.common import aws_clients
+from pypackages.common.cache import result_key, shared_cache
+from pypackages.common.canonical_hash import canonical_task_id
+from pypackages.common.payload_store import (
+    ENCODING,
+    ENCODINGS,
+    FORMAT_GEOJSON,
+    INPUT_FORMATS,
+    INPUT_PREFIX,
+    UPLOAD_PREFIX,
+    offload_message,
+    payload_store_from_env,
+)
+from pypackages.common.result_storage import (
+    STATUS_COMPLETE,
+    STATUS_FAILED,
+    STATUS_PENDING,
+    ResultStore,
+    StoredResult,
+)
 
 SQS_QUEUE_URL = os.environ['SQS_QUEUE_URL']
 TABLE_NAME = "BuildingClashResults"
+PROJECT_TABLE_NAME = "BuildingClashProjects"
+# Seconds a request may wait for its result when it asks to (?wait=N); the API lambda times out at 10.
+MAX_WAIT_SECONDS = 8
+# Backoff between result lookups while waiting: starts short so small jobs return quickly.
+POLL_INITIAL_DELAY = 0.025
+POLL_MAX_DELAY = 1.0
+# A task still pending after this long is assumed lost and is queued again on resubmission. Failing
+# tasks stay pending while SQS retries them: up to max_receive_count (3) x the visibility timeout (720 s).
+RESUBMIT_PENDING_AFTER_SECONDS = 2400
 
 class BuildingClashHandler:
     def __init__(self):
-        """self.redis_url = os.getenv("REDIS_URL")
-        if not self.redis_url:
-            raise ValueError("REDIS_URL environment variable missing")
-        self.service = BuildingClashDetectService(redis_url=self.redis_url)"""
+        """Results are cached in front of DynamoDB; set REDIS_URL to share them between instances."""
 
     def handle(self,event, context):
+        if event.get("httpMethod") == "GET":
+            return self.handle_status(event)
+        if (event.get("resource") or event.get("path") or "").endswith("/uploads"):
+            return self.handle_upload(event)
+        return self.handle_submit(event)
+
+    def handle_upload(self, event):
+        """
+        Presigned URL to upload an input too large for the API (POST
+        /detect-clash/uploads). The client PUTs the input there, then submits
+        `{"payload": {"key": ..., "sha256": ..., "encoding"?: ..., "format"?: ...}}`.
+        """
+        store = payload_store_from_env()
+        if store is None:
+            return {"statusCode": 501, "body": json.dumps({"error": "Uploads are not enabled"})}
+        key = f"{UPLOAD_PREFIX}{uuid.uuid4().hex}"
+        return {"statusCode": 200, "body": json.dumps({"upload_url": store.upload_url(key), "payload": {"key": key}})}
+
+    def handle_submit(self, event):
+        """
+        Queue a detection job and return its task id without waiting, unless the
+        result is already stored or the caller asks to wait (`?wait=<seconds>`).
+        """
         # Validate and parse the input data
         data = self.parse_input_data(event)
         if not data:
@@ -28,27 +71,107 @@ class BuildingClashHandler:
                 'statusCode': 400,
                 'body': json.dumps({'error': 'Invalid JSON input'})
             }
+        if isinstance(data, dict) and not isinstance(data.get("project_id", ""), str):
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': "'project_id' must be a string"})
+            }
+        if isinstance(data, dict) and "payload" in data:
+            data = self.uploaded_payload(data["payload"], data.get("query"), data.get("project_id"))
+            if data is None:
+                return {
+                    'statusCode': 400,
+                    'body': json.dumps({'error': 'Invalid payload reference'})
+                }
 
         task_id = self.generate_task_id(data)
 
         # Attempt to retrieve the result from DynamoDB
         result = self.fetch_result_from_dynamodb(task_id)
         if result:
+            # A project's index and incremental state follow its latest submission,
+            # so a known result is queued again when another model was submitted since.
+            if "project_id" in data and self.latest_project_task(data["project_id"]) != task_id:
+                self.send_task_to_sqs(task_id, data)
             return self.generate_response(200, result)
 
-        # Send the task to SQS for processing
-        self.send_task_to_sqs(task_id, data)
+        if self.claim_task(task_id):
+            self.send_task_to_sqs(task_id, data)
+
+        wait_seconds = self.requested_wait(event)
+        if wait_seconds > 0:
+            result = self.poll_for_result(task_id, wait_seconds)
+            if result:
+                return self.generate_response(200, result)
+
+        return self.generate_pending_response(task_id)
 
-        # Poll for the result for up to 10 seconds
-        result = self.poll_for_result(task_id)
+    def handle_status(self, event):
+        """Result or status of a task: GET /detect-clash/{task_id}[?wait=<seconds>]."""
+        task_id = (event.get("pathParameters") or {}).get("task_id")
+        if not task_id:
+            return {"statusCode": 400, "body": json.dumps({"error": "Missing task_id"})}
+
+        wait_seconds = self.requested_wait(event)
+        result = (
+            self.poll_for_result(task_id, wait_seconds) if wait_seconds > 0
+            else self.fetch_result_from_dynamodb(task_id)
+        )
         if result:
             return self.generate_response(200, result)
 
+        status = self.result_store().status(task_id)
+        if status is None:
+            return {"statusCode": 404, "body": json.dumps({"error": "Unknown task_id", "task_id": task_id})}
+        if status["status"] == STATUS_FAILED:
+            return {
+                "statusCode": 500,
+                "body": json.dumps({"task_id": task_id, "status": STATUS_FAILED, "error": status.get("error")}),
+            }
+        return self.generate_pending_response(task_id)
+
+    def generate_pending_response(self, task_id):
         return {
             "statusCode": 202,
-            "body": json.dumps({"message": "Processing, please try again later", "task_id": task_id})
+            "body": json.dumps({
+                "message": "Processing, please try again later",
+                "task_id": task_id,
+                "status": STATUS_PENDING,
+            })
         }
 
+    def requested_wait(self, event):
+        """Seconds to wait for a result, from the `wait` query parameter (default 0)."""
+        try:
+            wait = float((event.get("queryStringParameters") or {}).get("wait", 0))
+        except (TypeError, ValueError):
+            return 0
+        return min(max(wait, 0), MAX_WAIT_SECONDS)
+
+    def claim_task(self, task_id):
+        """
+        Mark the task pending; False if an identical job is already queued and
+        not stale. FAILED tasks are claimed again: the worker only marks a task
+        FAILED once SQS stops retrying it.
+        """
+        store = self.result_store()
+        if store.mark_pending(task_id):
+            return True
+        status = store.status(task_id) or {}
+        if status.get("status") == STATUS_COMPLETE:
+            return False
+        stale = time.time() - int(status.get("submitted_at", 0)) > RESUBMIT_PENDING_AFTER_SECONDS
+        if status.get("status") == STATUS_FAILED or stale:
+            return store.mark_pending(task_id, overwrite=True)
+        return False
+
+    def latest_project_task(self, project_id):
+        """Task id of the project's stored index (see project_index.py), None if it has none."""
+        item = aws_clients.resource("dynamodb").Table(PROJECT_TABLE_NAME).get_item(
+            Key={"project_id": f"{project_id}#index"}, ProjectionExpression="task_id",
+        ).get("Item")
+        return (item or {}).get("task_id")
+
     def parse_input_data(self, event):
         """Parse and validate the JSON input from the event."""
         try:
@@ -56,54 +179,103 @@ class BuildingClashHandler:
         except json.JSONDecodeError:
             return None
 
+    def uploaded_payload(self, payload, query=None, project_id=None):
+        """
+        Submission of an uploaded input, `{"payload": <reference>, "query"?: ..., "project_id"?: ...}`,
+        or None if the reference does not name an upload. The upload's sha256
+        stands in for its content, so identical uploads share a task id.
+        """
+        if not isinstance(payload, dict) or payload_store_from_env() is None:
+            return None
+        key, sha256 = payload.get("key"), payload.get("sha256")
+        if not isinstance(key, str) or not key.startswith(UPLOAD_PREFIX) or ".." in key:
+            return None
+        if not isinstance(sha256, str) or len(sha256) != 64:
+            return None
+        encoding, input_format = payload.get("encoding", ENCODING), payload.get("format", FORMAT_GEOJSON)
+        if encoding not in ENCODINGS or input_format not in INPUT_FORMATS:
+            return None
+        data = {"payload": {"key": key, "sha256": sha256.lower(), "encoding": encoding, "format": input_format}}
+        if query is not None:
+            data["query"] = query
+        if project_id is not None:
+            data["project_id"] = project_id
+        return data
+
     def generate_task_id(self, data):
-        """Generate a task_id by hashing the input data."""
-        input_string = json.dumps(data, sort_keys=True)  # Ensure consistent JSON order
-        return hashlib.sha256(input_string.encode('utf-8')).hexdigest()
+        """Generate a task_id from a canonical hash of the input; feature order does not matter."""
+        if "payload" in data:
+            content = {name: data["payload"][name] for name in ("sha256", "encoding", "format")}
+            submission = {"payload": content, "query": data.get("query")}
+            if "project_id" in data:
+                submission["project_id"] = data["project_id"]
+            return canonical_task_id(submission)
+        return canonical_task_id(data)
+
+    def result_store(self):
+        return ResultStore(aws_clients.resource("dynamodb").Table(TABLE_NAME), payload_store=payload_store_from_env())
 
     def fetch_result_from_dynamodb(self,task_id):
-        """Fetch the result from DynamoDB if it exists."""
-        table = dynamodb.Table(TABLE_NAME)
-        response = table.get_item(Key={"task_id": task_id})
-        return response.get('Item')
+        """
+        The stored result if it exists: from the cache when it holds it,
+        otherwise from DynamoDB, reassembling chunked results, and then cached.
+        Results in the payload store are returned by reference, never read here.
+        """
+        cache = shared_cache()
+        cached = cache.get(result_key(task_id))
+        if cached is not None:
+            return StoredResult(json=cached.decode("utf-8"))
+        result = self.result_store().locate(task_id)
+        if result is not None and result.json is not None:
+            cache.set(result_key(task_id), result.json.encode("utf-8"))
+        return result
 
     def send_task_to_sqs(self,task_id, data):
-        """Send the task to SQS for processing."""
-        sqs.send_message(
-            QueueUrl=SQS_QUEUE_URL,
-            MessageBody=json.dumps({
-                'task_id': task_id,
-                'input': data
-            })
-        )
+        """
+        Send the task to SQS for processing. Uploaded inputs, and inputs too
+        large for a message, travel as a reference to the payload store.
+        """
+        if "payload" in data:
+            body = json.dumps({'task_id': task_id, **data})
+        else:
+            body = offload_message(
+                {'task_id': task_id, 'input': data}, f"{INPUT_PREFIX}{task_id}.json.gz", payload_store_from_env()
+            )
+        aws_clients.client("sqs").send_message(QueueUrl=SQS_QUEUE_URL, MessageBody=body)
 
-    def poll_for_result(self,task_id):
-        """Poll DynamoDB for the result for up to 10 seconds."""
-        timeout = time.time() + 10
-        while time.time() < timeout:
+    def poll_for_result(self, task_id, wait_seconds):
+        """
+        Poll DynamoDB for the result for up to `wait_seconds`, with exponential
+        backoff from POLL_INITIAL_DELAY so quick jobs are picked up quickly.
+        """
+        deadline = time.monotonic() + wait_seconds
+        delay = POLL_INITIAL_DELAY
+        while True:
             result = self.fetch_result_from_dynamodb(task_id)
             if result:
                 return result
-            time.sleep(1)
-        return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, POLL_MAX_DELAY)
 
     def generate_response(self,status_code, result):
-        """Generate a consistent response format."""
+        """
+        Generate a consistent response format from the stored result. Results
+        in the payload store, too large for a Lambda response, redirect to it.
+        """
+        if result.payload is not None:
+            url = payload_store_from_env().url(result.payload["key"])
+            return {
+                "statusCode": 303,
+                "headers": {"Location": url},
+                "body": json.dumps({"result_url": url, "encoding": result.payload.get("encoding", ENCODING)}),
+            }
         return {
             "statusCode": status_code,
-            "body": json.dumps(self.convert_decimal_to_float(result.get("result", result)))
+            "body": result.json
         }
-
-    def convert_decimal_to_float(self,obj):
-        """Recursively converts Decimal values to float."""
-        if isinstance(obj, Decimal):
-            return float(obj)
-        elif isinstance(obj, dict):
-            return {key: self.convert_decimal_to_float(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self.convert_decimal_to_float(item) for item in obj]
-        else:
-            return obj
 # Initialize outside handler for cold-start optimization
 handler_instance = BuildingClashHandler()
 
@@ -1,12 +1,14 @@
-import json
 import os
-import boto3
-import uuid
 import logging
 from typing import Dict, Any
-dynamodb = boto3.resource('dynamodb')
 
+from pypackages.common import aws_clients
+from pypackages.common.cache import DEFAULT_TTL_SECONDS, LRUCache
+from pypackages.common.payload_store import payload_store_from_env
 from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.incremental import DynamoDBProjectStateStore
+from pypackages.detect_building_clash.project_index import ProjectIndexStore
+from pypackages.detect_building_clash.sharding import ShardQueue
 
 # Structured logging setup
 logger = logging.getLogger()
@@ -17,32 +19,48 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 TABLE_NAME = "BuildingClashResults"
+PROJECT_TABLE_NAME = "BuildingClashProjects"
+# Processes used for tiled detection of large sites; match the vCPUs of the memory size.
+CLASH_WORKERS = int(os.getenv("CLASH_WORKERS", "1"))
+# Memory for validated footprints kept between invocations.
+GEOMETRY_CACHE_BYTES = int(os.getenv("CLASH_GEOMETRY_CACHE_BYTES", str(128 * 1024 * 1024)))
+# Seconds a cached footprint is kept; defaults to the result cache's TTL.
+GEOMETRY_CACHE_TTL_SECONDS = int(
+    os.getenv("CLASH_GEOMETRY_CACHE_TTL_SECONDS", os.getenv("CLASH_CACHE_TTL_SECONDS", str(DEFAULT_TTL_SECONDS)))
+)
+# Optional coordinate grid (in model units) footprints are snapped to; unset keeps full precision.
+GRID_SIZE = float(os.getenv("CLASH_GRID_SIZE")) if os.getenv("CLASH_GRID_SIZE") else None
+# Queue large tasks are split onto as shard sub-tasks; unset runs every task in one invocation.
+SHARD_QUEUE_URL = os.getenv("SHARD_QUEUE_URL")
 
 class PostSqsLambdaHandler:
     def __init__(self):
-        """self.redis_url = os.getenv("REDIS_URL")
-        if not self.redis_url:
-            raise ValueError("REDIS_URL environment variable missing")
-        self.service = BuildingClashDetectService(redis_url=self.redis_url)"""
+        """Footprints validated by earlier invocations are kept for reuse while the instance is warm."""
+        self.geometry_cache = LRUCache(GEOMETRY_CACHE_BYTES, ttl_seconds=GEOMETRY_CACHE_TTL_SECONDS)
+        self.payload_store = payload_store_from_env()
+        self.shard_queue = ShardQueue(SHARD_QUEUE_URL, payload_store=self.payload_store) if SHARD_QUEUE_URL else None
 
     def handle(self, event: Dict[str, Any], context) -> Dict[str, Any]:
         """
-            Expects a GeoJSON FeatureCollection in `event`
+            Expects an SQS batch whose record bodies are clash detection tasks.
+            Returns the ids of failed records so SQS retries only those.
             """
-        try:
-            logger.info("Starting clash detection")
-            service = BuildingClashDetectService()
-            response = service.execute(event)
-            return {
-                "statusCode": 200,
-                "body": json.dumps(response)
-            }
-        except Exception as e:
-            logger.error(f"Lambda error: {str(e)}")
-            return {
-                "statusCode": 500,
-                "body": json.dumps({"error": str(e)})
-            }
+        logger.info("Starting clash detection")
+        project_table = aws_clients.resource("dynamodb").Table(PROJECT_TABLE_NAME)
+        # Project indexes live in the payload store, so they are only kept when one is configured.
+        project_indexes = (
+            ProjectIndexStore(project_table, self.payload_store, grid_size=GRID_SIZE) if self.payload_store else None
+        )
+        service = BuildingClashDetectService(
+            workers=CLASH_WORKERS,
+            project_states=DynamoDBProjectStateStore(project_table),
+            geometry_cache=self.geometry_cache,
+            grid_size=GRID_SIZE,
+            shard_queue=self.shard_queue,
+            payload_store=self.payload_store,
+            project_indexes=project_indexes,
+        )
+        return service.execute_batch(event, context)
 # Initialize outside handler for cold-start optimization
 handler_instance = PostSqsLambdaHandler()
 
@@ -0,0 +1,95 @@
+import json
+import os
+import logging
+from typing import Dict, Any
+
+from pypackages.common import aws_clients
+from pypackages.common.cache import LRUCache
+from pypackages.common.logger import PipelineMetrics
+from pypackages.common.payload_store import payload_store_from_env
+from pypackages.common.result_storage import STATUS_COMPLETE, STATUS_FAILED
+from pypackages.detect_building_clash import project_index
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStoreBuilder
+from pypackages.detect_building_clash.geojson_stream import ingest_message
+from pypackages.detect_building_clash.project_index import ProjectIndexStore
+from pypackages.detect_building_clash.query import MODE_FULL, ClashQuery
+
+# Structured logging setup
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('{"time": "%(asctime)s", "level": "%(levelname)s", "message": "%(message)s"}')
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+PROJECT_TABLE_NAME = "BuildingClashProjects"
+# Memory for project indexes kept between invocations.
+INDEX_CACHE_BYTES = int(os.getenv("CLASH_INDEX_CACHE_BYTES", str(project_index.INDEX_CACHE_BYTES)))
+# Must match the workers' grid, so candidates are snapped as the stored buildings were.
+GRID_SIZE = float(os.getenv("CLASH_GRID_SIZE")) if os.getenv("CLASH_GRID_SIZE") else None
+
+
+class ProjectCheckLambdaHandler:
+    def __init__(self):
+        """Project indexes loaded by earlier invocations are kept for reuse while the instance is warm."""
+        self.index_cache = LRUCache(INDEX_CACHE_BYTES, ttl_seconds=None)
+        self.payload_store = payload_store_from_env()
+
+    def handle(self, event: Dict[str, Any], context) -> Dict[str, Any]:
+        """
+        Check candidate buildings against a project's stored model:
+        POST /projects/{project_id}/check with a FeatureCollection, and
+        optionally a `query`. Answers synchronously with the clashes between
+        candidates and stored buildings, in the format of a detection result.
+        """
+        project_id = (event.get("pathParameters") or {}).get("project_id")
+        if not project_id:
+            return self.error(400, "Missing project_id")
+        if self.payload_store is None:
+            return self.error(501, "Project indexes are not enabled")
+        metrics = PipelineMetrics("project_check")
+        status = STATUS_FAILED
+        try:
+            builder = FootprintStoreBuilder()
+            with metrics.stage("parse"):
+                message = ingest_message(event.get("body") or "", builder)
+                query = ClashQuery.from_message(message)
+                candidates = builder.build(grid_size=GRID_SIZE)
+            metrics.count("features", len(candidates))
+            with metrics.stage("load"):
+                index = ProjectIndexStore(
+                    aws_clients.resource("dynamodb").Table(PROJECT_TABLE_NAME),
+                    self.payload_store,
+                    cache=self.index_cache,
+                    grid_size=GRID_SIZE,
+                ).load(project_id)
+            if index is None:
+                status = "NOT_FOUND"
+                return self.error(404, "Unknown project_id")
+            with metrics.stage("detect"):
+                result = index.check(candidates, query)
+            metrics.count("clashes", len(result.pairs))
+
+            service = BuildingClashDetectService()
+            if query.mode != MODE_FULL:
+                body = service.summarize(result.ids, result.pairs, query)
+            else:
+                body = {"type": "FeatureCollection", "features": service.format_results(result.clashes)}
+            status = STATUS_COMPLETE
+            return {"statusCode": 200, "body": json.dumps(body)}
+        except ValueError as e:
+            status = "INVALID"
+            return self.error(400, str(e))
+        finally:
+            metrics.emit(logger, project_id=project_id, status=status)
+
+    def error(self, status_code: int, message: str) -> Dict[str, Any]:
+        return {"statusCode": status_code, "body": json.dumps({"error": message})}
+
+
+# Initialize outside handler for cold-start optimization
+handler_instance = ProjectCheckLambdaHandler()
+
+def handler(event, context):
+    return handler_instance.handle(event, context)
@@ -0,0 +1,216 @@
+import functools
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("SQS_QUEUE_URL", "https://sqs.local/queue")
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-1")
+
+from pycontrollers.lambdas import building_clash_lambda_handler as module
+from pycontrollers.lambdas.building_clash_lambda_handler import BuildingClashHandler
+from pypackages.common import aws_clients
+from pypackages.common.cache import LRUCache, RedisCache, TieredCache, result_key, shared_cache
+from pypackages.common.local_aws import InMemoryDynamoDB, InMemoryQueue, InMemoryRedis
+from pypackages.common.payload_store import LocalPayloadStore, offload_message, put_payload, read_payload
+from pypackages.common.result_storage import ResultStore
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.incremental import InMemoryProjectStateStore
+from pypackages.detect_building_clash.project_index import ProjectIndexStore
+
+BODY = {"features": [{"id": "a", "properties": {"elevation": 0, "height": 1},
+                      "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}}]}
+RESULT = {"type": "FeatureCollection", "features": []}
+
+
+class TestBuildingClashHandler(unittest.TestCase):
+    def setUp(self):
+        self.dynamodb = InMemoryDynamoDB({module.PROJECT_TABLE_NAME: "project_id"})
+        self.queue = InMemoryQueue()
+        for name, fake in (("resource", self.dynamodb), ("client", self.queue)):
+            patcher = patch.object(aws_clients, name, return_value=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        shared_cache.cache_clear()
+        self.addCleanup(shared_cache.cache_clear)
+        self.handler = BuildingClashHandler()
+        self.store = ResultStore(self.dynamodb.Table(module.TABLE_NAME))
+
+    def submit(self, query=None):
+        return self.handler.handle({"httpMethod": "POST", "body": json.dumps(BODY),
+                                    "queryStringParameters": query}, None)
+
+    def status(self, task_id, query=None):
+        return self.handler.handle({"httpMethod": "GET", "pathParameters": {"task_id": task_id},
+                                    "queryStringParameters": query}, None)
+
+    def test_submit_returns_task_id_immediately(self):
+        with patch.object(module.time, "sleep") as sleep:
+            response = self.submit()
+        sleep.assert_not_called()
+        self.assertEqual(response["statusCode"], 202)
+        body = json.loads(response["body"])
+        self.assertEqual(body["status"], "PENDING")
+        self.assertEqual(len(self.queue.messages), 1)
+        self.assertEqual(json.loads(self.queue.messages[0]["body"])["task_id"], body["task_id"])
+
+        # A second identical submission does not queue the job again.
+        self.submit()
+        self.assertEqual(len(self.queue.messages), 1)
+
+    def test_project_submissions_reach_incremental_detection(self):
+        states = InMemoryProjectStateStore()
+        worker = BuildingClashDetectService(project_states=states)
+        body = dict(BODY, project_id="campus")
+        response = self.handler.handle({"httpMethod": "POST", "body": json.dumps(body)}, None)
+        self.assertEqual(worker.execute_batch({"Records": self.queue.drain()}), {"batchItemFailures": []})
+        self.assertIn("campus", states.states)
+        self.assertEqual(self.status(json.loads(response["body"])["task_id"])["statusCode"], 200)
+
+    def test_resubmitted_project_model_becomes_the_latest_again(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        indexes = ProjectIndexStore(self.dynamodb.Table(module.PROJECT_TABLE_NAME), LocalPayloadStore(directory.name))
+        worker = BuildingClashDetectService(project_indexes=indexes)
+        model_a = dict(BODY, project_id="campus")
+        model_b = dict(model_a, features=BODY["features"] * 2)
+        model_b["features"][1] = dict(model_b["features"][1], id="b")
+
+        def submit(model):
+            return self.handler.handle({"httpMethod": "POST", "body": json.dumps(model)}, None)["statusCode"]
+
+        statuses = []
+        for model in (model_a, model_b, model_a):
+            statuses.append(submit(model))
+            if statuses[-1] == 202:
+                # Polling by resubmission does not queue the model again, pending or done.
+                statuses.append(submit(model))
+            self.assertEqual(len(self.queue.messages), 1)
+            worker.execute_batch({"Records": self.queue.drain()})
+            statuses.append(submit(model))
+            self.assertEqual(self.queue.messages, [])
+        self.assertEqual(statuses, [202, 202, 200, 202, 202, 200, 200, 200])
+        self.assertEqual(indexes.load("campus").store.ids.tolist(), ["a"])
+
+    def test_status_lookup(self):
+        task_id = json.loads(self.submit()["body"])["task_id"]
+        self.assertEqual(self.status(task_id)["statusCode"], 202)
+        self.assertEqual(self.status("unknown")["statusCode"], 404)
+
+        self.store.save(task_id, RESULT)
+        response = self.status(task_id)
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(json.loads(response["body"]), RESULT)
+        self.assertEqual(self.submit()["statusCode"], 200)
+
+    def test_failed_task_is_reported_and_requeued(self):
+        task_id = json.loads(self.submit()["body"])["task_id"]
+        self.store.mark_failed(task_id, "boom")
+        response = self.status(task_id)
+        self.assertEqual(response["statusCode"], 500)
+        self.assertEqual(json.loads(response["body"])["error"], "boom")
+        self.submit()
+        self.assertEqual(len(self.queue.messages), 2)
+
+    def test_wait_polls_with_adaptive_backoff(self):
+        task_id = json.loads(self.submit()["body"])["task_id"]
+        delays = []
+
+        def sleep(seconds):
+            delays.append(seconds)
+            if len(delays) == 4:
+                self.store.save(task_id, RESULT)
+
+        with patch.object(module.time, "sleep", side_effect=sleep):
+            response = self.status(task_id, {"wait": "5"})
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(delays, [0.025, 0.05, 0.1, 0.2])
+
+    def test_results_are_served_from_the_cache(self):
+        task_id = json.loads(self.submit()["body"])["task_id"]
+        self.store.save(task_id, RESULT)
+        table = self.dynamodb.Table(module.TABLE_NAME)
+        self.assertEqual(self.submit()["statusCode"], 200)
+        reads = table.reads
+        for _ in range(3):
+            self.assertEqual(json.loads(self.submit()["body"]), RESULT)
+            self.assertEqual(json.loads(self.status(task_id)["body"]), RESULT)
+        self.assertEqual(table.reads, reads)
+
+    def test_results_shared_through_redis_skip_dynamodb(self):
+        redis = InMemoryRedis()
+        worker_cache = TieredCache(remote=RedisCache(redis))
+        api_cache = TieredCache(LRUCache(), RedisCache(redis))
+        task_id = json.loads(self.submit()["body"])["task_id"]
+        worker_cache.set(result_key(task_id), json.dumps(RESULT).encode("utf-8"), local=False)
+        table = self.dynamodb.Table(module.TABLE_NAME)
+        reads = table.reads
+        with patch.object(module, "shared_cache", return_value=api_cache):
+            response = self.status(task_id)
+        self.assertEqual(json.loads(response["body"]), RESULT)
+        self.assertEqual(table.reads, reads)
+
+    def use_payload_store(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        payloads = LocalPayloadStore(directory.name)
+        patcher = patch.object(module, "payload_store_from_env", return_value=payloads)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return payloads
+
+    def test_large_inputs_and_results_go_through_the_payload_store(self):
+        payloads = self.use_payload_store()
+        with patch.object(module, "offload_message", functools.partial(offload_message, max_inline_bytes=0)):
+            task_id = json.loads(self.submit()["body"])["task_id"]
+        message = json.loads(self.queue.messages[0]["body"])
+        self.assertEqual(message["payload"]["key"], f"inputs/{task_id}.json.gz")
+        self.assertEqual(json.loads(read_payload(payloads, message["payload"])), BODY)
+
+        ResultStore(self.dynamodb.Table(module.TABLE_NAME), payload_store=payloads, offload_bytes=0).save(
+            task_id, RESULT)
+        response = self.status(task_id)
+        self.assertEqual(response["statusCode"], 303)
+        self.assertEqual(response["headers"]["Location"], payloads.url(f"results/{task_id}.json.gz"))
+        self.assertEqual(self.submit()["statusCode"], 303)
+
+    def test_uploaded_inputs_are_submitted_by_reference(self):
+        payloads = self.use_payload_store()
+        upload = json.loads(self.handler.handle(
+            {"httpMethod": "POST", "resource": "/detect-clash/uploads", "body": None}, None)["body"])
+        self.assertTrue(upload["payload"]["key"].startswith("uploads/"))
+        ref = put_payload(payloads, upload["payload"]["key"], json.dumps(BODY).encode("utf-8"))
+
+        def submit(payload, **fields):
+            body = json.dumps({"payload": payload, **fields})
+            return self.handler.handle({"httpMethod": "POST", "body": body}, None)
+
+        response = submit({"key": ref["key"], "sha256": ref["sha256"]})
+        self.assertEqual(response["statusCode"], 202)
+        message = json.loads(self.queue.messages[0]["body"])
+        self.assertEqual(message, {"task_id": json.loads(response["body"])["task_id"],
+                                   "payload": {"key": ref["key"], "sha256": ref["sha256"], "encoding": "gzip",
+                                               "format": "geojson"}})
+
+        packed = {"key": ref["key"], "sha256": ref["sha256"], "encoding": "identity", "format": "packed"}
+        response = submit(packed, query={"mode": "count"})
+        self.assertEqual(response["statusCode"], 202)
+        self.assertEqual(json.loads(self.queue.messages[1]["body"])["query"], {"mode": "count"})
+        response = submit(packed, query={"mode": "count"}, project_id="campus")
+        self.assertEqual(response["statusCode"], 202)
+        self.assertEqual(json.loads(self.queue.messages[2]["body"])["project_id"], "campus")
+        self.assertEqual(submit(packed, project_id=7)["statusCode"], 400)
+        for payload in ({"key": "inputs/other.json.gz", "sha256": ref["sha256"]}, {"key": ref["key"]}, "x",
+                        dict(packed, format="shapefile"), dict(packed, encoding="br")):
+            with self.subTest(payload=payload):
+                self.assertEqual(submit(payload)["statusCode"], 400)
+
+    def test_wait_is_capped(self):
+        self.assertEqual(self.handler.requested_wait({"queryStringParameters": {"wait": "60"}}),
+                         module.MAX_WAIT_SECONDS)
+        self.assertEqual(self.handler.requested_wait({"queryStringParameters": {"wait": "x"}}), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
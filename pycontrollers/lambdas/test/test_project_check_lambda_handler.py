@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-1")
+
+from pycontrollers.lambdas import project_check_lambda_handler as module
+from pycontrollers.lambdas.project_check_lambda_handler import ProjectCheckLambdaHandler
+from pypackages.common import aws_clients
+from pypackages.common.local_aws import InMemoryDynamoDB
+from pypackages.common.payload_store import LocalPayloadStore
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.project_index import ProjectIndexStore
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+
+class TestProjectCheckHandler(unittest.TestCase):
+    def setUp(self):
+        self.dynamodb = InMemoryDynamoDB({module.PROJECT_TABLE_NAME: "project_id"})
+        patcher = patch.object(aws_clients, "resource", return_value=self.dynamodb)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        payloads = LocalPayloadStore(directory.name)
+        with patch.object(module, "payload_store_from_env", return_value=payloads):
+            self.handler = ProjectCheckLambdaHandler()
+
+        self.features = [f.model_dump() for f in random_features(200, seed=4)]
+        ProjectIndexStore(self.dynamodb.Table(module.PROJECT_TABLE_NAME), payloads).save(
+            "campus", FootprintStore.from_features(random_features(200, seed=4)[5:])
+        )
+
+    def check(self, project_id, body):
+        return self.handler.handle({"httpMethod": "POST", "pathParameters": {"project_id": project_id},
+                                    "body": json.dumps(body)}, None)
+
+    def test_candidates_are_checked_against_the_stored_project(self):
+        candidates = {"type": "FeatureCollection", "features": self.features[:5]}
+        response = self.check("campus", candidates)
+        self.assertEqual(response["statusCode"], 200)
+        features = json.loads(response["body"])["features"]
+        self.assertGreater(len(features), 0)
+        candidate_ids = {f["id"] for f in self.features[:5]}
+        for feature in features:
+            self.assertEqual(len(candidate_ids & set(feature["properties"]["buildings"])), 1)
+
+        summary = json.loads(self.check("campus", {**candidates, "query": {"mode": "count"}})["body"])
+        self.assertEqual(summary["clash_count"], len(features))
+
+    def test_unknown_project_and_invalid_input(self):
+        candidates = {"type": "FeatureCollection", "features": self.features[:1]}
+        self.assertEqual(self.check("unknown", candidates)["statusCode"], 404)
+        self.assertEqual(self.check("campus", {**candidates, "query": {"mode": "all"}})["statusCode"], 400)
+        response = self.handler.handle({"pathParameters": {"project_id": "campus"}, "body": "{"}, None)
+        self.assertEqual(response["statusCode"], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ aws_sqs as sqs,
     Duration,CfnOutput
 )
 from aws_cdk import aws_dynamodb as dynamodb
+from aws_cdk import aws_s3 as s3
 from aws_cdk.aws_lambda_event_sources import SqsEventSource  # <-- Correct import for event sources
 
 from constructs import Construct
@@ -14,10 +15,33 @@ class BuildingClashesStack(Stack):
     def __init__(self, scope: Construct, id: str, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
+        # Messages that keep failing, e.g. when DynamoDB or S3 errors persist,
+        # end up here instead of being redelivered until retention expires.
+        # Invalid inputs are not retried at all: the worker marks them FAILED,
+        # as it does other failures on their last receive (MAX_RECEIVE_COUNT).
+        self.dead_letter_queue = sqs.Queue(
+            self, "TaskDeadLetterQueue",
+            queue_name="TaskDeadLetterQueue",
+            retention_period=Duration.days(14),
+        )
         # SQS Queue for task submission
         self.sqs_queue = sqs.Queue(
             self, "TaskQueue",
-            queue_name="TaskQueue"
+            queue_name="TaskQueue",
+            # Six times the worker timeout, as AWS recommends for Lambda event sources.
+            visibility_timeout=Duration.seconds(720),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=self.dead_letter_queue),
+        )
+        # Claim-check payloads: inputs and results too large for SQS messages,
+        # DynamoDB items or API responses. Inputs are only needed until the
+        # task is processed.
+        self.payload_bucket = s3.Bucket(
+            self, "PayloadBucket",
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            lifecycle_rules=[
+                s3.LifecycleRule(prefix="inputs/", expiration=Duration.days(7)),
+                s3.LifecycleRule(prefix="uploads/", expiration=Duration.days(7)),
+            ],
         )
         # Simple Lambda to handle POST requests and SQS submission
         self.handle_post_sqs_lambda_fn = lambda_.DockerImageFunction(
@@ -32,17 +56,55 @@ class BuildingClashesStack(Stack):
             ),
             architecture=lambda_.Architecture.ARM_64,
             memory_size=1024,
-            timeout=Duration.seconds(30)
+            # A batch of up to 10 records shares one invocation; records are
+            # not started near the deadline but left for a retry instead.
+            timeout=Duration.seconds(120),
+            environment={
+                # Tasks too large for one invocation are split into shards queued back here.
+                "SHARD_QUEUE_URL": self.sqs_queue.queue_url,
+                "PAYLOAD_BUCKET": self.payload_bucket.bucket_name,
+            },
+        )
+
+        # Synchronous checks of candidate buildings against a project's stored
+        # index; same image as the worker, which stores the indexes.
+        self.project_check_lambda_fn = lambda_.DockerImageFunction(
+            self, "ProjectCheckLambda",
+            code=lambda_.DockerImageCode.from_image_asset(
+                directory=".",
+                file="Dockerfile",
+                exclude=["cdk.out", "node_modules"],
+                build_args={
+                    'PLATFORM': 'linux/amd64',
+                },
+                cmd=["pycontrollers.lambdas.project_check_lambda_handler.handler"],
+            ),
+            architecture=lambda_.Architecture.ARM_64,
+            memory_size=1024,
+            timeout=Duration.seconds(10),
+            environment={
+                "PAYLOAD_BUCKET": self.payload_bucket.bucket_name,
+            },
         )
 
         # Simple Lambda to handle POST requests and SQS submission
         self.building_clash_docker_lambda = lambda_.Function(
             self, "SimpleLambda",
             runtime=lambda_.Runtime.PYTHON_3_9,
-            handler="building_clash_lambda_handler.handler",  # Adjust this based on your function handler
-            code=lambda_.Code.from_asset("pycontrollers/lambdas"),  # Directory with the building_clash_docker_lambda.py code
+            handler="pycontrollers.lambdas.building_clash_lambda_handler.handler",
+            # Packaged from the repository root so the handler can import the
+            # shapely-free helpers in pypackages/common.
+            code=lambda_.Code.from_asset(
+                ".",
+                exclude=["cdk.out", "node_modules", "venv", ".git", "pypackages/cdk",
+                         "pypackages/detect_building_clash", "*.md", "Dockerfile"],
+            ),
+            # Leaves room next to the result cache for a decoded 5 MB result.
+            memory_size=256,
             environment={
                 "SQS_QUEUE_URL": self.sqs_queue.queue_url,
+                "PAYLOAD_BUCKET": self.payload_bucket.bucket_name,
+                "CLASH_CACHE_MAX_BYTES": str(64 * 1024 * 1024),
                 # "DYNAMODB_TABLE_NAME": self.dynamodb_table.table_name
             },
         timeout = Duration.seconds(10)
@@ -50,8 +112,20 @@ class BuildingClashesStack(Stack):
 
         # Allow the simple Lambda to write to SQS
         self.sqs_queue.grant_send_messages(self.building_clash_docker_lambda)
+        self.sqs_queue.grant_send_messages(self.handle_post_sqs_lambda_fn)
+        # Both write payloads; the API presigns client uploads and result downloads.
+        self.payload_bucket.grant_read_write(self.handle_post_sqs_lambda_fn)
+        self.payload_bucket.grant_read_write(self.building_clash_docker_lambda)
+        self.payload_bucket.grant_read(self.project_check_lambda_fn)
         # Create event source mapping to trigger the simple Lambda from the SQS queue
-        self.handle_post_sqs_lambda_fn.add_event_source(SqsEventSource(self.sqs_queue))
+        # Batches of up to 10 tasks per invocation; failed records are reported
+        # individually so only those are retried.
+        self.handle_post_sqs_lambda_fn.add_event_source(SqsEventSource(
+            self.sqs_queue,
+            batch_size=10,
+            max_batching_window=Duration.seconds(1),
+            report_batch_item_failures=True,
+        ))
 
         # API Gateway to expose the service
         api = apigateway.RestApi(self, "TaskApi",
@@ -61,7 +135,17 @@ class BuildingClashesStack(Stack):
 
         # POST method to submit a new task
         submit_task_integration = apigateway.LambdaIntegration(self.building_clash_docker_lambda)
-        api.root.add_resource("detect-clash").add_method("POST", submit_task_integration)
+        detect_clash = api.root.add_resource("detect-clash")
+        detect_clash.add_method("POST", submit_task_integration)
+        # GET to fetch the status or result of a submitted task
+        detect_clash.add_resource("{task_id}").add_method("GET", submit_task_integration)
+        # POST for a presigned URL to upload an input too large for the API
+        detect_clash.add_resource("uploads").add_method("POST", submit_task_integration)
+        # POST candidate buildings to check them against a project's stored model
+        projects = api.root.add_resource("projects")
+        projects.add_resource("{project_id}").add_resource("check").add_method(
+            "POST", apigateway.LambdaIntegration(self.project_check_lambda_fn)
+        )
 
         # Output the API endpoint URL
         CfnOutput(self, "ApiUrl", value=api.url)
@@ -76,4 +160,15 @@ class BuildingClashesStack(Stack):
         self.dynamodb_table.grant_read_write_data(self.handle_post_sqs_lambda_fn)
         self.dynamodb_table.grant_read_write_data(self.building_clash_docker_lambda)
 
+        # Per-project feature hashes and clashes for incremental re-detection
+        self.project_table = dynamodb.Table(
+            self, "BuildingClashProjects",
+            partition_key=dynamodb.Attribute(name="project_id", type=dynamodb.AttributeType.STRING),
+            table_name="BuildingClashProjects",
+            )
+        self.project_table.grant_read_write_data(self.handle_post_sqs_lambda_fn)
+        self.project_table.grant_read_data(self.project_check_lambda_fn)
+        # The API reads which task a project's index comes from.
+        self.project_table.grant_read_data(self.building_clash_docker_lambda)
+
 
@@ -0,0 +1,50 @@
+"""
+Process-wide AWS clients, created on first use instead of at import time.
+
+boto3 itself is only imported when the first client is needed, so modules
+that hold no more than a reference to this one import quickly, and code
+paths that never talk to a service (a status lookup never touches SQS) never
+pay for its client. Clients are thread-safe and shared by every thread;
+resources are not, so each thread gets its own.
+"""
+import threading
+from functools import lru_cache
+from typing import Any, Optional
+
+# Enough for execute_batch's threads plus DynamoDB batch writes.
+MAX_POOL_CONNECTIONS = 16
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+@lru_cache(maxsize=None)
+def _session():
+    import boto3.session
+
+    return boto3.session.Session()
+
+
+@lru_cache(maxsize=None)
+def _config():
+    from botocore.config import Config
+
+    return Config(max_pool_connections=MAX_POOL_CONNECTIONS, tcp_keepalive=True)
+
+
+@lru_cache(maxsize=None)
+def client(service_name: str, region_name: Optional[str] = None) -> Any:
+    """The shared client for `service_name`."""
+    # Creating clients from one session is not thread-safe.
+    with _lock:
+        return _session().client(service_name, region_name=region_name, config=_config())
+
+
+def resource(service_name: str, region_name: Optional[str] = None) -> Any:
+    """The calling thread's resource for `service_name`."""
+    resources = _local.__dict__.setdefault("resources", {})
+    key = (service_name, region_name)
+    if key not in resources:
+        with _lock:
+            resources[key] = _session().resource(service_name, region_name=region_name, config=_config())
+    return resources[key]
@@ -0,0 +1,193 @@
+"""
+Caches in front of DynamoDB: an in-process LRU tier and an optional Redis
+tier shared by every Lambda instance.
+
+Finished results are cached by task id. Task ids are content hashes of the
+input (see canonical_hash.py), so a cached result never goes stale; the TTL
+only bounds how long unused results occupy memory.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 3600
+# Sized for the API Lambda, which may run at 128 MB: results are up to 5 MB
+# and every hit decodes a copy on top of the cached bytes.
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+# A cache that is slow to answer must not slow requests down more than this.
+REDIS_TIMEOUT_SECONDS = 0.2
+KEY_PREFIX = "clash:"
+
+
+def result_key(task_id: str) -> str:
+    return f"result:{task_id}"
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache, evicting least recently used entries once
+    their total size exceeds `max_bytes`, and dropping entries older than
+    their TTL on access. Values may be any object; the size of anything but
+    bytes and str must be given when it is set.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _get(self, key: str, now: float) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, size, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            return self._get(key, self.clock())
+
+    def get_many(self, keys: Iterable[str]) -> List[Optional[Any]]:
+        """Values for `keys`, None for each miss, under a single lock acquisition."""
+        with self.lock:
+            now = self.clock()
+            return [self._get(key, now) for key in keys]
+
+    def set(self, key: str, value: Any, size: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        if size is None:
+            size = len(value)
+        if size > self.max_bytes:
+            return
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            expires_at = self.clock() + ttl_seconds if ttl_seconds is not None else None
+            self.entries[key] = (value, size, expires_at)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+
+class RedisCache:
+    """Byte values in Redis under `prefix`, expiring after their TTL."""
+
+    def __init__(self, client, ttl_seconds: int = DEFAULT_TTL_SECONDS, prefix: str = KEY_PREFIX):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[int] = None):
+        self.client.set(self.prefix + key, value, ex=ttl_seconds or self.ttl_seconds)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+
+class TieredCache:
+    """
+    Local LRU in front of an optional shared Redis tier. Hits in Redis are
+    copied into the local tier. Redis errors are logged and treated as misses,
+    so an unavailable cache only costs a DynamoDB read.
+    """
+
+    def __init__(self, local: Optional[LRUCache] = None, remote: Optional[RedisCache] = None):
+        self.local = local
+        self.remote = remote
+
+    def get(self, key: str) -> Optional[bytes]:
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not None:
+                return value
+        if self.remote is None:
+            return None
+        try:
+            value = self.remote.get(key)
+        except Exception:
+            logger.warning(f"Cache read of {key} failed", exc_info=True)
+            return None
+        if value is not None and self.local is not None:
+            self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: bytes, local: bool = True):
+        """Cache `value`; `local=False` only shares it, e.g. from a worker that never reads it back."""
+        if local and self.local is not None:
+            self.local.set(key, value)
+        if self.remote is not None:
+            try:
+                self.remote.set(key, value)
+            except Exception:
+                logger.warning(f"Cache write of {key} failed", exc_info=True)
+
+
+def cache_from_env() -> TieredCache:
+    """
+    Cache configured by environment variables: CLASH_CACHE_MAX_BYTES and
+    CLASH_CACHE_TTL_SECONDS size the local tier, and REDIS_URL (which may be
+    an ssm:// or sm:// reference) adds the Redis tier. If the Redis client
+    cannot be set up, e.g. `redis` is not installed, the error is logged and
+    only the local tier is used.
+    """
+    from pypackages.common.config_helper import resolve_env
+
+    ttl_seconds = int(os.getenv("CLASH_CACHE_TTL_SECONDS", str(DEFAULT_TTL_SECONDS)))
+    local = LRUCache(int(os.getenv("CLASH_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES))), ttl_seconds)
+    try:
+        redis_url = resolve_env("REDIS_URL", fallback_empty=True)
+        if not redis_url:
+            return TieredCache(local)
+
+        import redis
+
+        client = redis.Redis.from_url(
+            redis_url, socket_timeout=REDIS_TIMEOUT_SECONDS, socket_connect_timeout=REDIS_TIMEOUT_SECONDS
+        )
+    except Exception:
+        # shared_cache does not memoize errors: raising here would fail every request.
+        logger.warning("Redis cache unavailable, using the local cache only", exc_info=True)
+        return TieredCache(local)
+    return TieredCache(local, RedisCache(client, ttl_seconds))
+
+
+@lru_cache(maxsize=None)
+def shared_cache() -> TieredCache:
+    """The process-wide cache, created from the environment on first use."""
+    return cache_from_env()
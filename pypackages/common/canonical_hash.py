@@ -0,0 +1,112 @@
+"""
+Canonical content hashes of clash detection inputs, used as task ids.
+
+Two inputs describing the same buildings get the same id whatever the order
+of their features, of their object keys, or how their numbers are written
+(`1`, `1.0` and `1e0` are equal). Each feature is hashed on its own and the
+sorted feature digests are hashed together, so no canonical string of the
+whole payload is ever built.
+
+Building features (an id, elevation and height, and a polygon) are fed
+straight into their digest as packed float64s; any other feature is hashed
+through its canonical JSON.
+"""
+import hashlib
+import json
+import struct
+from decimal import Decimal
+from typing import Any, Optional
+
+# Bump when the canonical form changes, so old and new ids never collide.
+HASH_VERSION = b"clash-input-v2"
+
+_FEATURE_KEYS = {"type", "id", "properties", "geometry"}
+_PROPERTY_KEYS = {"elevation", "height"}
+_GEOMETRY_KEYS = {"type", "coordinates"}
+_COUNT = struct.Struct(">I")
+_PAIR = struct.Struct(">2d")
+
+
+def _normalize(value: Any) -> Any:
+    """Copy of `value` with every number as a float; adding 0.0 turns -0.0 into 0.0."""
+    kind = type(value)
+    if kind is float:
+        return value + 0.0
+    if kind is int or isinstance(value, Decimal):
+        return float(value) + 0.0
+    if kind is dict:
+        return {key: _normalize(item) for key, item in value.items()}
+    if kind is list or kind is tuple:
+        if all(type(item) is float or type(item) is int for item in value):
+            # Coordinates: the bulk of every payload.
+            return [float(item) + 0.0 for item in value]
+        return [_normalize(item) for item in value]
+    return value
+
+
+def content_digest(value: Any) -> bytes:
+    """SHA-256 of the canonical JSON of one value; list order is significant."""
+    canonical = json.dumps(_normalize(value), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).digest()
+
+
+def _number(value: Any) -> bool:
+    return type(value) is float or type(value) is int
+
+
+def _building_digest(feature: Any) -> Optional[bytes]:
+    """
+    SHA-256 of a single-polygon building feature, fed its id, elevation,
+    height and ring coordinates as packed float64s, without building a copy
+    of the feature. None when the feature has any other shape.
+    """
+    if type(feature) is not dict or feature.keys() != _FEATURE_KEYS or feature["type"] != "Feature":
+        return None
+    building_id, properties, geometry = feature["id"], feature["properties"], feature["geometry"]
+    if type(building_id) is not str or type(properties) is not dict or properties.keys() != _PROPERTY_KEYS:
+        return None
+    elevation, height = properties["elevation"], properties["height"]
+    if not (_number(elevation) and _number(height)):
+        return None
+    if type(geometry) is not dict or geometry.keys() != _GEOMETRY_KEYS or geometry["type"] != "Polygon":
+        return None
+    rings = geometry["coordinates"]
+    if type(rings) is not list:
+        return None
+
+    name = building_id.encode("utf-8")
+    parts = [b"building", _COUNT.pack(len(name)), name, _PAIR.pack(elevation + 0.0, height + 0.0),
+             _COUNT.pack(len(rings))]
+    try:
+        for ring in rings:
+            parts.append(_COUNT.pack(len(ring)))
+            # Unpacking rejects points that are not pairs; adding 0.0 rejects non-numbers.
+            parts.extend([_PAIR.pack(x + 0.0, y + 0.0) for x, y in ring])
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(b"".join(parts)).digest()
+
+
+def feature_digest(feature: Any) -> bytes:
+    """Digest of one feature, independent of key order and number spelling."""
+    digest = _building_digest(feature)
+    return digest if digest is not None else content_digest(feature)
+
+
+def canonical_task_id(data: Any) -> str:
+    """
+    Hex task id for a detection input. The top-level `features` list is
+    treated as a multiset: reordering it keeps the id, duplicating a feature
+    changes it.
+    """
+    digest = hashlib.sha256(HASH_VERSION)
+    features = data.get("features") if isinstance(data, dict) else None
+    if isinstance(features, list):
+        digest.update(content_digest({key: value for key, value in data.items() if key != "features"}))
+        feature_digests = sorted(feature_digest(feature) for feature in features)
+        digest.update(len(feature_digests).to_bytes(8, "big"))
+        for one in feature_digests:
+            digest.update(one)
+    else:
+        digest.update(content_digest(data))
+    return digest.hexdigest()
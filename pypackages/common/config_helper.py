@@ -1,7 +1,8 @@
 import os
+from functools import lru_cache
 from typing import Optional, Dict
 
-import boto3
+from pypackages.common import aws_clients
 
 SSM_PREFIX = "ssm://"
 SM_PREFIX = "sm://"
@@ -29,25 +30,23 @@ def resolve_value(value: str) -> str:
     return value
 
 def _get_ssm_client():
-    global _ssm_client
-    if _ssm_client is None:
-        _ssm_client = boto3.client("ssm", region_name=DEFAULT_AWS_REGION)
-    return _ssm_client
+    return aws_clients.client("ssm", region_name=DEFAULT_AWS_REGION)
 
 
 def _get_sm_client():
-    global _sm_client
-    if _sm_client is None:
-        _sm_client = boto3.client("secretsmanager")
-    return _sm_client
+    return aws_clients.client("secretsmanager")
 
 
+# Parameters and secrets are read once per process; a new value takes effect
+# on the next cold start.
+@lru_cache(maxsize=None)
 def _get_from_ssm(ssm_path: str):
     return _get_ssm_client().get_parameter(Name=ssm_path, WithDecryption=True)[
         "Parameter"
     ]["Value"]
 
 
+@lru_cache(maxsize=None)
 def _get_from_sm(sm_path: str):
     return _get_sm_client().get_secret_value(SecretId=sm_path)["SecretString"]
 
@@ -0,0 +1,167 @@
+"""
+In-process stand-ins for the AWS resources (and the Redis cache) the lambdas
+use, for tests and local runs. They implement only the calls this repository
+makes.
+"""
+import copy
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# DynamoDB rejects items larger than this.
+MAX_ITEM_BYTES = 400 * 1024
+
+
+def _item_size(item: Dict[str, Any]) -> int:
+    size = 0
+    for key, value in item.items():
+        size += len(key.encode("utf-8"))
+        if isinstance(value, (bytes, bytearray)):
+            size += len(value)
+        elif isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        else:
+            size += len(json.dumps(value, default=str))
+    return size
+
+
+class ConditionalCheckFailed(Exception):
+    """Shaped like the botocore ClientError DynamoDB raises for a failed condition."""
+
+    def __init__(self):
+        super().__init__("The conditional request failed")
+        self.response = {"Error": {"Code": "ConditionalCheckFailedException"}}
+
+
+class _BatchWriter:
+    def __init__(self, table: "InMemoryTable"):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def put_item(self, Item: Dict[str, Any]):
+        self.table.put_item(Item=Item)
+
+    def delete_item(self, Key: Dict[str, Any]):
+        self.table.delete_item(Key=Key)
+
+
+class InMemoryTable:
+    """Single-partition-key DynamoDB table, enforcing the 400 KB item limit."""
+
+    def __init__(self, key_name: str = "task_id"):
+        self.key_name = key_name
+        self.items: Dict[Any, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.reads = 0
+
+    def put_item(self, Item: Dict[str, Any], ConditionExpression: Optional[str] = None,
+                 ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+                 ExpressionAttributeValues: Optional[Dict[str, Any]] = None, **kwargs):
+        """
+        Supports two conditions: `attribute_not_exists(<key>)`, and
+        `<path> = <value>` with a dotted path of attribute names.
+        """
+        if _item_size(Item) > MAX_ITEM_BYTES:
+            raise ValueError("Item size has exceeded the maximum allowed size")
+        with self.lock:
+            current = self.items.get(Item[self.key_name])
+            if ConditionExpression == f"attribute_not_exists({self.key_name})":
+                if current is not None:
+                    raise ConditionalCheckFailed()
+            elif ConditionExpression is not None:
+                path, _, value = (part.strip() for part in ConditionExpression.partition("="))
+                if not value.startswith(":"):
+                    raise NotImplementedError(ConditionExpression)
+                names = ExpressionAttributeNames or {}
+                for name in path.split("."):
+                    current = current.get(names.get(name, name)) if isinstance(current, dict) else None
+                if current is None or current != (ExpressionAttributeValues or {})[value]:
+                    raise ConditionalCheckFailed()
+            self.writes += 1
+            self.items[Item[self.key_name]] = copy.deepcopy(Item)
+
+    def get_item(self, Key: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            self.reads += 1
+            item = self.items.get(Key[self.key_name])
+            return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def delete_item(self, Key: Dict[str, Any], **kwargs):
+        with self.lock:
+            self.items.pop(Key[self.key_name], None)
+
+    def batch_writer(self, overwrite_by_pkeys: Optional[list] = None) -> _BatchWriter:
+        return _BatchWriter(self)
+
+
+class InMemoryQueue:
+    """SQS client stand-in holding sent messages in a list."""
+
+    def __init__(self):
+        self.messages = []
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            message_id = str(self.sent)
+            self.sent += 1
+            self.messages.append({"messageId": message_id, "body": MessageBody})
+        return {"MessageId": message_id}
+
+    def drain(self, max_messages: int = 10) -> list:
+        """Remove and return up to `max_messages`, as SQS event records."""
+        with self.lock:
+            taken, self.messages = self.messages[:max_messages], self.messages[max_messages:]
+        return taken
+
+
+class InMemoryDynamoDB:
+    """`boto3.resource("dynamodb")` stand-in; tables are created on first use."""
+
+    def __init__(self, key_names: Optional[Dict[str, str]] = None):
+        self.key_names = key_names or {}
+        self.tables: Dict[str, InMemoryTable] = {}
+        self.lock = threading.Lock()
+
+    def Table(self, name: str) -> InMemoryTable:
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = InMemoryTable(self.key_names.get(name, "task_id"))
+            return self.tables[name]
+
+
+class InMemoryRedis:
+    """`redis.Redis` stand-in for byte values with expiry."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.values: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.values.get(name)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self.values[name]
+                return None
+            return value
+
+    def set(self, name: str, value: bytes, ex: Optional[int] = None, **kwargs) -> bool:
+        with self.lock:
+            self.values[name] = (bytes(value), self.clock() + ex if ex is not None else None)
+        return True
+
+    def delete(self, *names: str) -> int:
+        with self.lock:
+            return sum(1 for name in names if self.values.pop(name, None) is not None)
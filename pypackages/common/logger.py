@@ -1,11 +1,24 @@
+import io
 import json
 import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Union
 
 logger = logging.getLogger(__name__)
 
+# Set to profile instrumented code with cProfile: any value logs the top
+# functions, a directory path also writes a .prof file there.
+PROFILE_ENV = "CLASH_PROFILE"
+PROFILE_TOP_FUNCTIONS = 25
+
+# Only one cProfile profiler can be active at a time.
+_profile_lock = threading.Lock()
+
 def get_wb_root_loggers() -> List[str]:
     # The manager field is monkey patched in logging package.
     # noinspection PyUnresolvedReferences
@@ -60,4 +73,76 @@ def configure_lambda_logging(logger: Optional[logging.Logger] = None):
             format="[%(levelname)s] %(asctime)s - %(name)s - %(message)s"
         )
 
-    set_log_levels(logger)
\ No newline at end of file
+    set_log_levels(logger)
+
+
+class PipelineMetrics:
+    """
+    Stage durations and counters for one job, logged together as a single
+    JSON line so they can be queried (e.g. with CloudWatch Logs Insights)
+    without parsing free text.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages_ms: Dict[str, float] = {}
+        self.counters: Dict[str, Union[int, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the block; a stage entered more than once accumulates."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + elapsed
+
+    def count(self, name: str, value: Union[int, float]):
+        self.counters[name] = value
+
+    def as_dict(self, **fields) -> Dict:
+        return {
+            "metric": self.name,
+            **fields,
+            "stages_ms": {name: round(ms, 3) for name, ms in self.stages_ms.items()},
+            "total_ms": round(sum(self.stages_ms.values()), 3),
+            "counters": dict(self.counters),
+        }
+
+    def emit(self, target: Optional[logging.Logger] = None, **fields):
+        """Log the metrics, plus `fields` such as the task id, as one JSON line."""
+        (target or logger).info(json.dumps(self.as_dict(**fields), default=str))
+
+
+@contextmanager
+def profiled(label: str, target: Optional[logging.Logger] = None) -> Iterator[None]:
+    """
+    Profile the block with cProfile when the CLASH_PROFILE environment
+    variable is set, then log the slowest functions by cumulative time.
+    Without it, or while another block is being profiled, the block runs
+    as is.
+    """
+    destination = os.environ.get(PROFILE_ENV)
+    if not destination or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        (target or logger).info(f"Profile of {label}:\n{report.getvalue()}")
+        if os.path.isdir(destination):
+            safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)
+            profile.dump_stats(os.path.join(destination, f"{safe_label}.prof"))
+    finally:
+        _profile_lock.release()
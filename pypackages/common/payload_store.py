@@ -0,0 +1,205 @@
+"""
+Claim-check storage for task inputs and results too large to pass inline.
+
+A payload is gzip-compressed JSON in an object store (S3, or a local
+directory for tests and local runs). Only a reference travels on the queue
+or in DynamoDB:
+
+    {"key": "inputs/<task_id>.json.gz", "sha256": "<hex digest of the object>", "encoding": "gzip", "size": 1234}
+
+Readers stream and decompress the object and check its digest as they go,
+so a payload is never held in memory whole, compressed or not. Uploaded
+inputs may also be uncompressed (`"encoding": "identity"`), e.g. binary
+formats that compress their own contents, and may name their `format`
+(see detect_building_clash/binary_input.py; GeoJSON by default).
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import IO, BinaryIO, Dict, Iterator
+
+from pypackages.common import aws_clients
+
+ENCODING = "gzip"
+IDENTITY = "identity"
+ENCODINGS = (ENCODING, IDENTITY)
+# Formats of task inputs; binary ones are decoded by detect_building_clash/binary_input.py.
+FORMAT_GEOJSON = "geojson"
+FORMAT_PACKED = "packed"
+FORMAT_GEOPARQUET = "geoparquet"
+INPUT_FORMATS = (FORMAT_GEOJSON, FORMAT_PACKED, FORMAT_GEOPARQUET)
+# SQS rejects messages over 256 KB; larger task messages carry a reference instead.
+MAX_INLINE_MESSAGE_BYTES = 200 * 1024
+INPUT_PREFIX = "inputs/"
+UPLOAD_PREFIX = "uploads/"
+RESULT_PREFIX = "results/"
+# Lifetime of presigned upload and download URLs.
+URL_EXPIRY_SECONDS = 3600
+# Bytes read from the object store per call when streaming a payload.
+READ_CHUNK_BYTES = 1 << 20
+
+
+class LocalPayloadStore:
+    """Payloads as files under `directory`."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def _path(self, key: str) -> Path:
+        path = (self.directory / key).resolve()
+        if self.directory.resolve() not in path.parents:
+            raise ValueError(f"Invalid payload key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(path.name + ".tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def url(self, key: str) -> str:
+        return self._path(key).as_uri()
+
+    def upload_url(self, key: str) -> str:
+        return self._path(key).as_uri()
+
+
+class S3PayloadStore:
+    """Payloads as objects in an S3 bucket; the client is created on first use unless given."""
+
+    def __init__(self, bucket: str, client=None):
+        self.bucket = bucket
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else aws_clients.client("s3")
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=data, ContentType="application/json", ContentEncoding=ENCODING
+        )
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise KeyError(key) from None
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def url(self, key: str) -> str:
+        """Presigned GET; clients get gzip-encoded JSON."""
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=URL_EXPIRY_SECONDS
+        )
+
+    def upload_url(self, key: str) -> str:
+        """Presigned PUT for a client to upload a gzip-compressed input."""
+        return self.client.generate_presigned_url(
+            "put_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=URL_EXPIRY_SECONDS
+        )
+
+
+def put_payload(store, key: str, data: bytes) -> Dict:
+    """Compress and store `data`, returning its reference."""
+    compressed = gzip.compress(data, compresslevel=6, mtime=0)
+    store.put(key, compressed)
+    return {"key": key, "sha256": hashlib.sha256(compressed).hexdigest(), "encoding": ENCODING,
+            "size": len(compressed)}
+
+
+class _DigestReader(io.RawIOBase):
+    """Reads through a binary stream while hashing everything read."""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(min(len(buffer), READ_CHUNK_BYTES))
+        self.digest.update(data)
+        self.size += len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@contextmanager
+def open_payload(store, ref: Dict, binary: bool = False) -> Iterator[IO]:
+    """
+    Text stream (binary with `binary` set) over a payload, decompressed on
+    the fly. Once the caller is done the rest of the object is read and its
+    digest checked; a mismatch raises ValueError.
+    """
+    encoding = ref.get("encoding", ENCODING)
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unsupported payload encoding: {encoding}")
+    stream = store.open(ref["key"])
+    try:
+        raw = _DigestReader(stream)
+        data = io.BufferedReader(raw, READ_CHUNK_BYTES)
+        if encoding == ENCODING:
+            data = gzip.GzipFile(fileobj=data)
+        yield data if binary else io.TextIOWrapper(data, encoding="utf-8")
+        while raw.read(READ_CHUNK_BYTES):
+            pass
+        if "sha256" in ref and raw.digest.hexdigest() != ref["sha256"]:
+            raise ValueError(f"Payload {ref['key']} does not match its sha256")
+    finally:
+        stream.close()
+
+
+def read_payload(store, ref: Dict) -> str:
+    with open_payload(store, ref) as stream:
+        return stream.read()
+
+
+def offload_message(message: Dict, key: str, store, max_inline_bytes: int = MAX_INLINE_MESSAGE_BYTES) -> str:
+    """
+    Queue body for a task message: the message itself if it is small enough,
+    otherwise the message with its `input` moved to `key` in `store` and a
+    `payload` reference in its place.
+    """
+    body = json.dumps(message)
+    if store is None or len(body) <= max_inline_bytes:
+        return body
+    reference = {name: value for name, value in message.items() if name != "input"}
+    reference["payload"] = put_payload(store, key, json.dumps(message["input"]).encode("utf-8"))
+    return json.dumps(reference)
+
+
+@lru_cache(maxsize=None)
+def payload_store_from_env():
+    """
+    The payload store configured by PAYLOAD_BUCKET (S3) or CLASH_PAYLOAD_DIR
+    (a local directory), or None, in which case everything stays inline.
+    """
+    bucket = os.getenv("PAYLOAD_BUCKET")
+    if bucket:
+        return S3PayloadStore(bucket)
+    directory = os.getenv("CLASH_PAYLOAD_DIR")
+    if directory:
+        return LocalPayloadStore(directory)
+    return None
@@ -0,0 +1,197 @@
+import json
+import time
+import zlib
+from decimal import Decimal
+from typing import Any, Dict, NamedTuple, Optional
+
+from pypackages.common.payload_store import RESULT_PREFIX, put_payload, read_payload
+
+ENCODING = "zlib+json"
+
+STATUS_PENDING = "PENDING"
+STATUS_COMPLETE = "COMPLETE"
+STATUS_FAILED = "FAILED"
+
+# Leaves headroom under DynamoDB's 400 KB item limit for keys and attribute names.
+CHUNK_BYTES = 350 * 1024
+# Results larger than this (as JSON) go to the payload store, if there is one; Lambda responses are capped at 6 MB.
+RESULT_OFFLOAD_BYTES = 5 * 1024 * 1024
+
+
+def _json_default(value: Any):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dump_result(result: Dict) -> str:
+    return json.dumps(result, separators=(",", ":"), default=_json_default)
+
+
+def encode_result(result: Dict) -> bytes:
+    return zlib.compress(dump_result(result).encode("utf-8"))
+
+
+def decode_result(data: bytes) -> Dict:
+    return json.loads(zlib.decompress(data))
+
+
+def chunk_key(task_id: str, index: int) -> str:
+    return f"{task_id}#chunk#{index}"
+
+
+class StoredResult(NamedTuple):
+    """A finished result: its JSON when stored in DynamoDB, or the reference of its payload object."""
+    json: Optional[str] = None
+    payload: Optional[Dict] = None
+
+
+def _is_condition_failure(error: Exception) -> bool:
+    return getattr(error, "response", {}).get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+
+def _plain(value: Dict) -> Dict:
+    # boto3 returns DynamoDB numbers as Decimal.
+    return json.loads(json.dumps(value, default=_json_default))
+
+
+def _binary(value: Any) -> bytes:
+    # boto3 returns Binary attributes wrapped; local stand-ins return bytes.
+    return getattr(value, "value", value)
+
+
+class ResultStore:
+    """
+    Clash results stored as compressed JSON in a DynamoDB table keyed by `task_id`.
+
+    Results that fit in one item are stored inline in the `task_id` item.
+    Larger ones are split into chunk items (`<task_id>#chunk#<n>`), written in
+    a batch before the `task_id` manifest item, so a reader that finds the
+    manifest always finds every chunk.
+
+    With a `payload_store` (see payload_store.py), results over
+    `offload_bytes` of JSON are stored there instead, and the `task_id` item
+    only holds the payload's reference.
+
+    The `task_id` item also carries the job status: PENDING from submission,
+    COMPLETE once the result is written, FAILED if detection raised.
+    """
+
+    def __init__(self, table, chunk_bytes: int = CHUNK_BYTES, payload_store=None,
+                 offload_bytes: int = RESULT_OFFLOAD_BYTES):
+        self.table = table
+        self.chunk_bytes = chunk_bytes
+        self.payload_store = payload_store
+        self.offload_bytes = offload_bytes
+
+    def save(self, task_id: str, result: Dict):
+        self.save_json(task_id, dump_result(result))
+
+    def save_json(self, task_id: str, result_json: str):
+        """Store a result that is already serialized as JSON."""
+        if self.payload_store is not None and len(result_json) > self.offload_bytes:
+            payload = put_payload(self.payload_store, f"{RESULT_PREFIX}{task_id}.json.gz", result_json.encode("utf-8"))
+            self.table.put_item(Item={"task_id": task_id, "status": STATUS_COMPLETE, "payload": payload})
+            return
+
+        data = zlib.compress(result_json.encode("utf-8"))
+        if len(data) <= self.chunk_bytes:
+            self.table.put_item(Item={
+                "task_id": task_id, "status": STATUS_COMPLETE, "encoding": ENCODING, "chunks": 0, "data": data
+            })
+            return
+
+        chunks = [data[start:start + self.chunk_bytes] for start in range(0, len(data), self.chunk_bytes)]
+        with self.table.batch_writer() as batch:
+            for index, chunk in enumerate(chunks):
+                batch.put_item(Item={"task_id": chunk_key(task_id, index), "data": chunk})
+        self.table.put_item(Item={
+            "task_id": task_id, "status": STATUS_COMPLETE, "encoding": ENCODING, "chunks": len(chunks)
+        })
+
+    def mark_pending(self, task_id: str, overwrite: bool = False) -> bool:
+        """
+        Record a submitted task. Unless `overwrite` is set, nothing is written when
+        the task already has an item. Returns True if the task was recorded.
+        """
+        item = {"task_id": task_id, "status": STATUS_PENDING, "submitted_at": int(time.time())}
+        if overwrite:
+            self.table.put_item(Item=item)
+            return True
+        try:
+            self.table.put_item(Item=item, ConditionExpression="attribute_not_exists(task_id)")
+            return True
+        except Exception as e:
+            if _is_condition_failure(e):
+                return False
+            raise
+
+    def mark_failed(self, task_id: str, error: str):
+        self.table.put_item(Item={"task_id": task_id, "status": STATUS_FAILED, "error": error})
+
+    def status(self, task_id: str) -> Optional[Dict]:
+        """`{"status": ..., "error"?: ...}` for the task, or None if it was never submitted."""
+        item = self.table.get_item(Key={"task_id": task_id}).get("Item")
+        if not item:
+            return None
+        status = {"status": item.get("status", STATUS_COMPLETE)}
+        for key in ("error", "submitted_at"):
+            if key in item:
+                status[key] = item[key]
+        return status
+
+    def is_complete(self, task_id: str) -> bool:
+        """Whether a result is stored under `task_id`, by a strongly consistent read of its status only."""
+        item = self.table.get_item(
+            Key={"task_id": task_id}, ConsistentRead=True,
+            ProjectionExpression="#status", ExpressionAttributeNames={"#status": "status"},
+        ).get("Item")
+        return bool(item) and item.get("status", STATUS_COMPLETE) == STATUS_COMPLETE
+
+    def fetch(self, task_id: str, consistent: bool = False) -> Optional[Dict]:
+        """The stored result, or None when the task has not finished."""
+        result_json = self.fetch_json(task_id, consistent)
+        return json.loads(result_json) if result_json is not None else None
+
+    def fetch_json(self, task_id: str, consistent: bool = False) -> Optional[str]:
+        """The stored result as JSON text, ready to return without re-encoding."""
+        stored = self.locate(task_id, consistent)
+        if stored is None:
+            return None
+        if stored.payload is not None:
+            return read_payload(self.payload_store, stored.payload)
+        return stored.json
+
+    def locate(self, task_id: str, consistent: bool = False) -> Optional[StoredResult]:
+        """
+        The stored result, None when the task has not finished. Results in the
+        payload store are returned by reference, without reading them.
+        """
+        item = self.table.get_item(Key={"task_id": task_id}, ConsistentRead=consistent).get("Item")
+        if not item or item.get("status", STATUS_COMPLETE) != STATUS_COMPLETE:
+            return None
+        if "payload" in item:
+            return StoredResult(payload=_plain(item["payload"]))
+        if "result" in item:  # Items written before results were compressed.
+            return StoredResult(json=dump_result(item["result"]))
+        chunk_count = int(item.get("chunks", 0))
+        if chunk_count == 0:
+            return StoredResult(json=zlib.decompress(_binary(item["data"])).decode("utf-8"))
+
+        parts = []
+        for index in range(chunk_count):
+            chunk = self.table.get_item(Key={"task_id": chunk_key(task_id, index)}, ConsistentRead=True)
+            parts.append(_binary(chunk["Item"]["data"]))
+        return StoredResult(json=zlib.decompress(b"".join(parts)).decode("utf-8"))
+
+    def delete(self, task_id: str):
+        """Remove a stored result, manifest first so readers never find it without its chunks."""
+        item = self.table.get_item(Key={"task_id": task_id}, ConsistentRead=True).get("Item")
+        if not item:
+            return
+        self.table.delete_item(Key={"task_id": task_id})
+        chunk_count = int(item.get("chunks", 0))
+        if chunk_count:
+            with self.table.batch_writer() as batch:
+                for index in range(chunk_count):
+                    batch.delete_item(Key={"task_id": chunk_key(task_id, index)})
@@ -0,0 +1,39 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pypackages.common import aws_clients
+
+
+class TestAwsClients(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.session.client.side_effect = lambda name, **kwargs: object()
+        self.session.resource.side_effect = lambda name, **kwargs: object()
+        aws_clients.client.cache_clear()
+        aws_clients._local.__dict__.clear()
+        patcher = patch.object(aws_clients, "_session", return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(aws_clients.client.cache_clear)
+        self.addCleanup(aws_clients._local.__dict__.clear)
+
+    def test_clients_are_created_once_and_shared(self):
+        self.assertEqual(self.session.client.call_count, 0)
+        sqs = aws_clients.client("sqs")
+        self.assertIs(aws_clients.client("sqs"), sqs)
+        self.assertIsNot(aws_clients.client("sqs", region_name="us-east-1"), sqs)
+        self.assertEqual(self.session.client.call_count, 2)
+
+    def test_resources_are_per_thread(self):
+        main = aws_clients.resource("dynamodb")
+        self.assertIs(aws_clients.resource("dynamodb"), main)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(aws_clients.resource("dynamodb")))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], main)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pypackages.common.cache import LRUCache, RedisCache, TieredCache, cache_from_env
+from pypackages.common.local_aws import InMemoryRedis
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_entries_are_evicted_by_size(self):
+        cache = LRUCache(max_bytes=10, ttl_seconds=None)
+        cache.set("a", b"1234")
+        cache.set("b", b"1234")
+        self.assertEqual(cache.get("a"), b"1234")
+        cache.set("c", b"1234")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get_many(["a", "b", "c"]), [b"1234", None, b"1234"])
+        self.assertEqual((cache.size, cache.evictions), (8, 1))
+        cache.set("huge", b"x" * 11)
+        self.assertIsNone(cache.get("huge"))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        clock = Clock()
+        cache = LRUCache(ttl_seconds=10, clock=clock)
+        cache.set("a", object(), size=100)
+        cache.set("b", b"x", ttl_seconds=60)
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), b"x")
+        self.assertEqual(cache.size, 1)
+
+
+class TestTieredCache(unittest.TestCase):
+    def test_redis_hits_are_copied_to_the_local_tier(self):
+        clock = Clock()
+        redis = InMemoryRedis(clock)
+        shared = RedisCache(redis, ttl_seconds=30)
+        TieredCache(remote=shared).set("k", b"v", local=False)
+        local = LRUCache()
+        cache = TieredCache(local, shared)
+        self.assertEqual(cache.get("k"), b"v")
+        self.assertEqual(local.get("k"), b"v")
+        clock.now = 30
+        self.assertIsNone(redis.get("clash:k"))
+
+    def test_redis_errors_are_misses(self):
+        client = MagicMock()
+        client.get.side_effect = ConnectionError("down")
+        client.set.side_effect = ConnectionError("down")
+        cache = TieredCache(LRUCache(), RedisCache(client))
+        with self.assertLogs("pypackages.common.cache", "WARNING"):
+            self.assertIsNone(cache.get("k"))
+            cache.set("k", b"v")
+        self.assertEqual(cache.get("k"), b"v")
+
+    def test_local_tier_is_used_when_redis_cannot_be_set_up(self):
+        # None in sys.modules makes `import redis` raise ImportError, as in the API Lambda's zip.
+        with patch.dict(os.environ, {"REDIS_URL": "redis://cache:6379"}), patch.dict(sys.modules, {"redis": None}):
+            with self.assertLogs("pypackages.common.cache", "WARNING"):
+                cache = cache_from_env()
+        self.assertIsNone(cache.remote)
+        cache.set("k", b"v")
+        self.assertEqual(cache.get("k"), b"v")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import copy
+import hashlib
+import json
+import random
+import timeit
+import unittest
+
+from pypackages.common.canonical_hash import canonical_task_id, content_digest
+
+
+def model(count, seed=0):
+    rng = random.Random(seed)
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": f"b{n}",
+                "properties": {"elevation": rng.randint(0, 20), "height": rng.random() * 10},
+                "geometry": {"type": "Polygon",
+                             "coordinates": [[[rng.random() * 1000, rng.random() * 1000] for _ in range(5)]]},
+            }
+            for n in range(count)
+        ],
+    }
+
+
+class TestCanonicalHash(unittest.TestCase):
+    def test_feature_and_key_order_do_not_matter(self):
+        data = model(50)
+        shuffled = copy.deepcopy(data)
+        random.Random(1).shuffle(shuffled["features"])
+        reordered = json.loads(json.dumps(shuffled, sort_keys=True))
+        reordered = {key: reordered[key] for key in reversed(list(reordered))}
+        self.assertEqual(canonical_task_id(data), canonical_task_id(shuffled))
+        self.assertEqual(canonical_task_id(data), canonical_task_id(reordered))
+
+    def test_numbers_are_normalized(self):
+        self.assertEqual(content_digest([1, -0.0, {"h": 2}]), content_digest([1.0, 0, {"h": 2e0}]))
+        self.assertNotEqual(content_digest(1), content_digest(True))
+        self.assertNotEqual(content_digest(1), content_digest("1"))
+
+    def test_content_changes_change_the_id(self):
+        data = model(20)
+        base = canonical_task_id(data)
+
+        moved = copy.deepcopy(data)
+        moved["features"][3]["geometry"]["coordinates"][0][1][0] += 0.001
+        duplicated = copy.deepcopy(data)
+        duplicated["features"].append(copy.deepcopy(data["features"][0]))
+        reversed_ring = copy.deepcopy(data)
+        reversed_ring["features"][0]["geometry"]["coordinates"][0].reverse()
+        retyped = dict(data, type="GeometryCollection")
+
+        ids = {base} | {canonical_task_id(d) for d in (moved, duplicated, reversed_ring, retyped)}
+        self.assertEqual(len(ids), 5)
+
+    def test_building_numbers_are_normalized(self):
+        data = model(3)
+        rewritten = copy.deepcopy(data)
+        rewritten["features"][0]["properties"] = {"height": 4, "elevation": -0.0}
+        data["features"][0]["properties"] = {"elevation": 0, "height": 4.0}
+        ring = rewritten["features"][1]["geometry"]["coordinates"][0]
+        ring[0] = [int(ring[0][0]), ring[0][1]]
+        data["features"][1]["geometry"]["coordinates"][0][0][0] = float(int(ring[0][0]))
+        self.assertEqual(canonical_task_id(data), canonical_task_id(rewritten))
+
+    def test_features_of_other_shapes_are_hashed_whole(self):
+        data = model(3)
+        for extra in ({"name": "tower"}, {"elevation": "0"}):
+            changed = copy.deepcopy(data)
+            changed["features"][0]["properties"].update(extra)
+            self.assertNotEqual(canonical_task_id(data), canonical_task_id(changed))
+        three_d = copy.deepcopy(data)
+        three_d["features"][0]["geometry"]["coordinates"][0][0].append(0)
+        self.assertNotEqual(canonical_task_id(data), canonical_task_id(three_d))
+
+    def test_faster_than_hashing_the_sorted_json(self):
+        data = model(5000)
+
+        def sorted_json():
+            return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+        canonical = min(timeit.repeat(lambda: canonical_task_id(data), number=1, repeat=3))
+        baseline = min(timeit.repeat(sorted_json, number=1, repeat=3))
+        self.assertLess(canonical, baseline)
+
+    def test_inputs_without_features_are_hashed_whole(self):
+        self.assertEqual(canonical_task_id({"a": 1, "b": [1, 2]}), canonical_task_id({"b": [1.0, 2], "a": 1.0}))
+        self.assertNotEqual(canonical_task_id({"b": [1, 2]}), canonical_task_id({"b": [2, 1]}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pypackages.common import config_helper
+
+
+class TestConfigHelper(unittest.TestCase):
+    def setUp(self):
+        config_helper._get_from_ssm.cache_clear()
+        self.addCleanup(config_helper._get_from_ssm.cache_clear)
+        self.ssm = MagicMock()
+        self.ssm.get_parameter.return_value = {"Parameter": {"Value": "secret"}}
+        patcher = patch.object(config_helper.aws_clients, "client", return_value=self.ssm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parameters_are_looked_up_once(self):
+        with patch.dict(os.environ, {"REDIS_URL": "ssm:///clash/redis"}):
+            self.assertEqual(config_helper.resolve_env("REDIS_URL"), "secret")
+            self.assertEqual(config_helper.resolve_env("REDIS_URL"), "secret")
+        self.ssm.get_parameter.assert_called_once_with(Name="/clash/redis", WithDecryption=True)
+
+    def test_plain_values_and_missing_variables(self):
+        self.assertEqual(config_helper.resolve_value("plain"), "plain")
+        self.assertEqual(config_helper.resolve_env("CLASH_UNSET_VARIABLE", fallback_empty=True), "")
+        with self.assertRaises(LookupError):
+            config_helper.resolve_env("CLASH_UNSET_VARIABLE")
+        self.ssm.get_parameter.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pypackages.common.logger import PROFILE_ENV, PipelineMetrics, profiled
+
+test_logger = logging.getLogger("clash_test")
+
+
+class TestPipelineMetrics(unittest.TestCase):
+    def test_stages_and_counters_are_logged_as_one_json_line(self):
+        metrics = PipelineMetrics("job")
+        with metrics.stage("parse"):
+            pass
+        with self.assertRaises(RuntimeError):
+            with metrics.stage("detect"):
+                raise RuntimeError("boom")
+        with metrics.stage("parse"):
+            pass
+        metrics.count("features", 3)
+        with self.assertLogs(test_logger, logging.INFO) as logs:
+            metrics.emit(test_logger, task_id="t")
+        self.assertEqual(len(logs.records), 1)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["metric"], "job")
+        self.assertEqual(line["task_id"], "t")
+        self.assertEqual(sorted(line["stages_ms"]), ["detect", "parse"])
+        self.assertEqual(line["counters"], {"features": 3})
+
+
+class TestProfiled(unittest.TestCase):
+    def test_disabled_without_environment_variable(self):
+        with patch.dict(os.environ, clear=True), patch.object(test_logger, "info") as info:
+            with profiled("job", test_logger):
+                sum(range(10))
+        info.assert_not_called()
+
+    def test_profile_is_logged_and_written(self):
+        with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ, {PROFILE_ENV: directory}):
+            with self.assertLogs(test_logger, logging.INFO) as logs:
+                with profiled("task 1", test_logger):
+                    sorted(range(1000), reverse=True)
+            self.assertIn("function calls", logs.output[0])
+            self.assertEqual(os.listdir(directory), ["task_1.prof"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import tempfile
+import unittest
+
+from pypackages.common.payload_store import (
+    LocalPayloadStore,
+    offload_message,
+    open_payload,
+    put_payload,
+    read_payload,
+)
+
+
+class TestPayloadStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = LocalPayloadStore(directory.name)
+
+    def test_payload_round_trip(self):
+        data = json.dumps({"features": [{"id": n} for n in range(1000)]})
+        ref = put_payload(self.store, "inputs/task.json.gz", data.encode("utf-8"))
+        self.assertEqual(ref["encoding"], "gzip")
+        self.assertLess(ref["size"], len(data))
+        self.assertEqual(read_payload(self.store, ref), data)
+        with open_payload(self.store, ref) as stream:
+            self.assertEqual(stream.read(10), data[:10])
+
+    def test_corrupted_payload_is_rejected(self):
+        ref = put_payload(self.store, "inputs/task.json.gz", b'{"features": []}')
+        with self.assertRaises(ValueError):
+            read_payload(self.store, dict(ref, sha256="0" * 64))
+        with self.assertRaises(KeyError):
+            read_payload(self.store, dict(ref, key="inputs/missing.json.gz"))
+
+    def test_keys_stay_inside_the_store(self):
+        with self.assertRaises(ValueError):
+            self.store.put("../outside.json.gz", b"")
+
+    def test_only_large_messages_are_offloaded(self):
+        small = {"task_id": "t", "input": {"features": []}}
+        self.assertEqual(json.loads(offload_message(small, "inputs/t.json.gz", self.store)), small)
+
+        large = {"task_id": "t", "input": {"features": [{"id": "x" * 100}] * 100}}
+        body = json.loads(offload_message(large, "inputs/t.json.gz", self.store, max_inline_bytes=1000))
+        self.assertEqual(set(body), {"task_id", "payload"})
+        self.assertEqual(json.loads(read_payload(self.store, body["payload"])), large["input"])
+        self.assertEqual(json.loads(offload_message(large, "inputs/t.json.gz", None, max_inline_bytes=1000)), large)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import random
+import tempfile
+import unittest
+from decimal import Decimal
+
+from pypackages.common.local_aws import InMemoryTable
+from pypackages.common.payload_store import LocalPayloadStore
+from pypackages.common.result_storage import ResultStore, chunk_key
+
+
+def feature_collection(count, seed=0):
+    rng = random.Random(seed)
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"elevation": 2, "height": rng.random(), "buildings": [f"b{n}", f"b{n + 1}"]},
+                "geometry": {"type": "Polygon",
+                             "coordinates": [[[rng.random() * 1000, rng.random() * 1000] for _ in range(6)]]},
+            }
+            for n in range(count)
+        ],
+    }
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.table = InMemoryTable()
+        self.store = ResultStore(self.table)
+
+    def test_small_result_is_stored_inline(self):
+        result = feature_collection(3)
+        self.store.save("task", result)
+        self.assertEqual(list(self.table.items), ["task"])
+        self.assertEqual(self.store.fetch("task"), result)
+
+    def test_large_result_is_split_into_chunks(self):
+        result = feature_collection(20000)
+        self.store.save("task", result)
+        manifest = self.table.items["task"]
+        self.assertGreater(manifest["chunks"], 1)
+        self.assertIn(chunk_key("task", manifest["chunks"] - 1), self.table.items)
+        self.assertEqual(self.store.fetch("task"), result)
+
+    def test_json_is_returned_as_stored(self):
+        result_json = json.dumps(feature_collection(5000), separators=(",", ":"))
+        self.store.save_json("task", result_json)
+        self.assertGreater(self.table.items["task"]["chunks"], 1)
+        self.assertEqual(self.store.fetch_json("task"), result_json)
+
+    def test_result_over_item_limit_fails_without_chunking(self):
+        with self.assertRaises(ValueError):
+            ResultStore(self.table, chunk_bytes=10 ** 9).save("task", feature_collection(20000))
+
+    def test_decimals_are_written_as_numbers(self):
+        self.store.save("task", {"features": [{"elevation": Decimal("2"), "height": Decimal("1.5")}]})
+        self.assertEqual(self.store.fetch("task"), {"features": [{"elevation": 2, "height": 1.5}]})
+
+    def test_delete_removes_manifest_and_chunks(self):
+        self.store.save("task", feature_collection(20000))
+        self.store.mark_pending("other")
+        self.assertTrue(self.store.is_complete("task"))
+        self.assertFalse(self.store.is_complete("other"))
+        self.store.delete("task")
+        self.store.delete("unknown")
+        self.assertEqual(list(self.table.items), ["other"])
+        self.assertFalse(self.store.is_complete("task"))
+
+    def test_large_result_is_offloaded_to_the_payload_store(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = ResultStore(self.table, payload_store=LocalPayloadStore(directory.name), offload_bytes=10000)
+        small, large = feature_collection(3), feature_collection(1000)
+        store.save("small", small)
+        store.save("large", large)
+        self.assertIsNotNone(store.locate("small").json)
+        self.assertEqual(store.locate("large").payload["key"], "results/large.json.gz")
+        self.assertEqual(store.fetch("large"), large)
+        self.assertEqual(store.fetch("small"), small)
+
+    def test_missing_and_legacy_items(self):
+        self.assertIsNone(self.store.fetch("unknown"))
+        self.table.put_item(Item={"task_id": "old", "result": {"type": "FeatureCollection", "features": []}})
+        self.assertEqual(self.store.fetch("old"), {"type": "FeatureCollection", "features": []})
+
+
+if __name__ == '__main__':
+    unittest.main()
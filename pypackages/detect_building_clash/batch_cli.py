@@ -0,0 +1,188 @@
+"""
+Run clash detection over local GeoJSON files, without any AWS service.
+
+    python -m pypackages.detect_building_clash.batch_cli MODEL_OR_DIR [...] [-o clashes.ndjson] [-j JOBS]
+
+Each file holds one model, as a FeatureCollection or as a task message
+(`{"task_id": ..., "input": {...}}`), or in a binary format (*.packed,
+*.parquet, see binary_input.py). Directories are searched recursively for
+*.json, *.geojson, *.packed and *.parquet files. Models are processed concurrently in `JOBS`
+processes. Clashes are written as newline-delimited GeoJSON features, tagged
+with the model's path, a batch of candidate pairs at a time, so no model's
+clashes are ever held in memory at once. With one job they go straight to
+the output, so a model that fails during detection may leave part of its
+clashes there. With more, each process spools a model's clashes to a temporary
+file, which is copied to the output once the model is done, so models never
+interleave; a failed model's spool is discarded. A summary line per model
+goes to stderr. The exit status is 1 if any model failed.
+"""
+import argparse
+import codecs
+import json
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import IO, Iterator, List, NamedTuple, Optional, Sequence
+
+from pypackages.detect_building_clash.binary_input import BINARY_SUFFIXES, read_binary
+from pypackages.detect_building_clash.building_clash_detect_service import (
+    ENGINES,
+    ENGINE_BATCH,
+    BuildingClashDetectService,
+)
+from pypackages.detect_building_clash.footprint_store import FootprintStoreBuilder
+from pypackages.detect_building_clash.geojson_stream import ingest_message
+from pypackages.detect_building_clash.spatial_index import CANDIDATE_SEARCHES, CANDIDATE_SEARCH_3D
+
+MODEL_SUFFIXES = (".json", ".geojson") + tuple(BINARY_SUFFIXES)
+
+
+class ModelResult(NamedTuple):
+    path: str
+    buildings: int = 0
+    clashes: int = 0
+    seconds: float = 0.0
+    spool: Optional[str] = None
+    error: Optional[str] = None
+
+
+def find_models(paths: Sequence[str]) -> List[str]:
+    """Files named on the command line, plus model files found under directories, sorted per directory."""
+    models = []
+    for path in paths:
+        if not os.path.isdir(path):
+            models.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            models.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(MODEL_SUFFIXES))
+    return models
+
+
+@contextmanager
+def open_model(path: str) -> Iterator[IO[str]]:
+    """
+    Text stream over a model file. Regular files are memory-mapped, so the
+    parser reads straight from the page cache; anything that cannot be
+    mapped (empty files, pipes) is read normally.
+    """
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            mapped = None
+        if mapped is None:
+            yield codecs.getreader("utf-8")(f)
+            return
+        try:
+            yield codecs.getreader("utf-8")(mapped)
+        finally:
+            mapped.close()
+
+
+_service: Optional[BuildingClashDetectService] = None
+
+
+def _init_worker(candidate_search: str, engine: str):
+    global _service
+    _service = BuildingClashDetectService(candidate_search=candidate_search, engine=engine)
+
+
+def detect_model(path: str, output: IO[str]) -> ModelResult:
+    """Detect clashes in one model file, writing them to `output` as NDJSON lines while they are found."""
+    start = time.perf_counter()
+    try:
+        builder = FootprintStoreBuilder()
+        input_format = BINARY_SUFFIXES.get(os.path.splitext(path)[1])
+        if input_format is not None:
+            with open(path, "rb") as f:
+                builder.add_columns(read_binary(f.read(), input_format))
+        else:
+            with open_model(path) as stream:
+                ingest_message(stream, builder)
+        store = builder.build()
+        count = 0
+        for clashes in _service.iter_clashes(store):
+            features = _service.format_results(clashes)
+            output.writelines(json.dumps({"model": path, **feature}) + "\n" for feature in features)
+            count += len(clashes)
+        return ModelResult(path, len(store), count, time.perf_counter() - start)
+    except Exception as e:
+        return ModelResult(path, seconds=time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+
+
+def detect_model_to_spool(path: str, directory: str) -> ModelResult:
+    """detect_model into a temporary file in `directory`, whose name the result carries unless the model failed."""
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".ndjson", delete=False) as spool:
+        result = detect_model(path, spool)
+    if result.error:
+        os.unlink(spool.name)
+        return result
+    return result._replace(spool=spool.name)
+
+
+def run(models: Sequence[str], output: IO[str], jobs: int, candidate_search: str = CANDIDATE_SEARCH_3D,
+        engine: str = ENGINE_BATCH, log: IO[str] = sys.stderr) -> List[ModelResult]:
+    """Detect every model, writing clashes to `output` as they are found (one job) or as each model finishes."""
+    results = []
+
+    def report(result: ModelResult):
+        if result.error:
+            log.write(f"{result.path}: FAILED {result.error}\n")
+        else:
+            log.write(f"{result.path}: {result.buildings} buildings, {result.clashes} clashes, "
+                      f"{result.seconds:.2f} s\n")
+        results.append(result._replace(spool=None))
+
+    if jobs <= 1 or len(models) <= 1:
+        _init_worker(candidate_search, engine)
+        for path in models:
+            report(detect_model(path, output))
+            output.flush()
+        return results
+
+    with tempfile.TemporaryDirectory(prefix="clashes-") as directory, \
+            ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                initargs=(candidate_search, engine)) as pool:
+        futures = [pool.submit(detect_model_to_spool, path, directory) for path in models]
+        for future in as_completed(futures):
+            result = future.result()
+            if result.spool is not None:
+                with open(result.spool, encoding="utf-8") as spool:
+                    shutil.copyfileobj(spool, output)
+                output.flush()
+                os.unlink(result.spool)
+            report(result)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Detect building clashes in local GeoJSON models.")
+    parser.add_argument("paths", nargs="+", help="model files or directories holding them")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file (default: stdout)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="models processed at once (default: number of CPUs)")
+    parser.add_argument("--candidate-search", choices=CANDIDATE_SEARCHES, default=CANDIDATE_SEARCH_3D)
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE_BATCH)
+    args = parser.parse_args(argv)
+
+    models = find_models(args.paths)
+    start = time.perf_counter()
+    if args.output == "-":
+        results = run(models, sys.stdout, args.jobs, args.candidate_search, args.engine)
+    else:
+        with open(args.output, "w", encoding="utf-8") as output:
+            results = run(models, output, args.jobs, args.candidate_search, args.engine)
+    failed = sum(1 for result in results if result.error)
+    sys.stderr.write(f"{len(results)} models, {sum(r.clashes for r in results)} clashes, {failed} failed, "
+                     f"{time.perf_counter() - start:.2f} s\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
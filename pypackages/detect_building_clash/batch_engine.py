@@ -0,0 +1,242 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import shapely
+
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.models import ClashResult
+from pypackages.detect_building_clash.query import ClashQuery
+
+POLYGON = shapely.GeometryType.POLYGON
+MULTIPOLYGON = shapely.GeometryType.MULTIPOLYGON
+
+# Pairs handled per vectorized call; bounds the size of the temporary geometry arrays.
+DEFAULT_BATCH_SIZE = 4096
+# Smaller batches when only the first clash is wanted, so little work is wasted past it.
+FIRST_CLASH_BATCH_SIZE = 256
+
+
+def round_half_even_6(values: np.ndarray) -> np.ndarray:
+    """
+    Vectorized `round(x, 6)` that returns exactly what Python's `round` returns.
+
+    `rint(x * 1e6) / 1e6` is the correctly rounded result unless the scaled value
+    lies within rounding error of a .5 boundary (or is too large to hold an
+    exact integer); those few values fall back to `round`.
+    """
+    scaled = values * 1e6
+    result = np.rint(scaled) / 1e6
+    near_tie = ~(np.abs(scaled - np.floor(scaled) - 0.5) > 4 * np.abs(np.spacing(scaled)))
+    risky = near_tie | ~(np.abs(scaled) < 2.0 ** 52)
+    if risky.any():
+        result[risky] = [round(v, 6) for v in values[risky].tolist()]
+    return result
+
+
+def _largest_parts(multipolygons: np.ndarray) -> np.ndarray:
+    """
+    Pick the largest part of every MultiPolygon. Ties go to the first part, as
+    with `max(geoms, key=area)` in the scalar path.
+    """
+    parts, owner = shapely.get_parts(multipolygons, return_index=True)
+    areas = shapely.area(parts)
+    position = np.arange(len(parts))
+    order = np.lexsort((position, -areas, owner))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = owner[order][1:] != owner[order][:-1]
+    return parts[order[first]]
+
+
+def compute_clashes_batch(
+    store: FootprintStore, pairs: np.ndarray, batch_size: int = DEFAULT_BATCH_SIZE,
+    query: Optional[ClashQuery] = None,
+) -> List[ClashResult]:
+    """
+    Vectorized equivalent of running `calculate_overlap_and_metadata` over `pairs`.
+
+    Height overlap, intersection, area and orientation run as array operations
+    per batch; `ClashResult`s are only built for the pairs that clash. Pairs
+    of axis-aligned rectangles skip GEOS and are intersected by interval
+    arithmetic. The output is equal to the scalar path, in the same order.
+
+    The thresholds of `query` are checked against the height overlap and the
+    overlap of the bounding boxes first, so pairs that cannot reach them are
+    never intersected.
+    """
+    return compute_clashes_batch_with_pairs(store, pairs, batch_size, query)[1]
+
+
+def compute_clashes_batch_with_pairs(
+    store: FootprintStore, pairs: np.ndarray, batch_size: int = DEFAULT_BATCH_SIZE,
+    query: Optional[ClashQuery] = None,
+) -> Tuple[np.ndarray, List[ClashResult]]:
+    """Like compute_clashes_batch, but also returns the pair behind each result."""
+    clashing_pairs = [np.empty((0, 2), dtype=np.intp)]
+    results = []
+    for start in range(0, len(pairs), batch_size):
+        batch_pairs, batch_results = _compute_batch(store, pairs[start:start + batch_size], query)
+        clashing_pairs.append(batch_pairs)
+        results.extend(batch_results)
+    return np.concatenate(clashing_pairs), results
+
+
+def find_clashing_pairs(
+    store: FootprintStore, pairs: np.ndarray, query: Optional[ClashQuery] = None, first_only: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> np.ndarray:
+    """
+    The pairs of `pairs` that clash, in order, without building their clash
+    geometry. With `first_only` the search stops at the first clash found.
+    """
+    if first_only:
+        batch_size = min(batch_size, FIRST_CLASH_BATCH_SIZE)
+    clashing_pairs = [np.empty((0, 2), dtype=np.intp)]
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        rect_positions, general_positions, _ = _clashing_positions(store, batch, query)
+        positions = np.sort(np.concatenate([rect_positions, general_positions]))
+        if first_only and len(positions):
+            return batch[positions[:1]]
+        clashing_pairs.append(batch[positions])
+    return np.concatenate(clashing_pairs)
+
+
+def _clashing_positions(
+    store: FootprintStore, pairs: np.ndarray, query: Optional[ClashQuery]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Positions of the clashing pairs of rectangles, positions of the other
+    clashing pairs, and the GEOS intersections of the latter.
+    """
+    left, right = pairs[:, 0], pairs[:, 1]
+    overlap_height = np.minimum(store.tops[left], store.tops[right]) - np.maximum(
+        store.elevations[left], store.elevations[right]
+    )
+    keep = overlap_height > 0
+    min_area = 0.0
+    if query is not None:
+        keep &= overlap_height >= query.min_overlap_height
+        min_area = query.min_overlap_area
+        if min_area > 0:
+            # The overlap of two bounding boxes bounds the area the footprints can share.
+            bounds = shapely.bounds(store.polygons[left[keep]]), shapely.bounds(store.polygons[right[keep]])
+            keep[keep] = _box_overlap_area(*bounds) >= min_area
+    keep = np.flatnonzero(keep)
+
+    rectangle = store.rectangles[left[keep]] & store.rectangles[right[keep]]
+    rect_bounds = store.rect_bounds[left[keep[rectangle]]], store.rect_bounds[right[keep[rectangle]]]
+    rect_area = _box_overlap_area(*rect_bounds)
+    rect_positions = keep[rectangle][(rect_area > 0) & (rect_area >= min_area)]
+
+    positions = keep[~rectangle]
+    left, right = left[positions], right[positions]
+    touching = shapely.intersects(store.polygons[left], store.polygons[right])
+    positions, left, right = positions[touching], left[touching], right[touching]
+    intersections = shapely.intersection(store.polygons[left], store.polygons[right], grid_size=store.grid_size)
+    type_ids = shapely.get_type_id(intersections)
+    areas = shapely.area(intersections)
+    clashes = (areas > 0) & (areas >= min_area) & ((type_ids == POLYGON) | (type_ids == MULTIPOLYGON))
+    return rect_positions, positions[clashes], intersections[clashes]
+
+
+def _box_overlap_area(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Area shared by boxes given as (minx, miny, maxx, maxy) rows; 0 where they do not overlap."""
+    sides = np.minimum(first[:, 2:], second[:, 2:]) - np.maximum(first[:, :2], second[:, :2])
+    return np.clip(sides, 0, None).prod(axis=1)
+
+
+def _compute_batch(
+    store: FootprintStore, pairs: np.ndarray, query: Optional[ClashQuery] = None
+) -> Tuple[np.ndarray, List[ClashResult]]:
+    rect_positions, general_positions, intersections = _clashing_positions(store, pairs, query)
+    left, right = pairs[:, 0], pairs[:, 1]
+    overlap_elevation = np.maximum(store.elevations[left], store.elevations[right])
+    overlap_height = np.minimum(store.tops[left], store.tops[right]) - overlap_elevation
+
+    # Rectangle pairs whose rounded overlap collapses to a line keep GEOS's ring, so they go the general way,
+    # though still off the grid like every rectangle overlap.
+    exact = _rectangle_overlap_is_exact(store, pairs[rect_positions])
+    if not exact.all():
+        collapsed = rect_positions[~exact]
+        left_polygons, right_polygons = store.polygons[left[collapsed]], store.polygons[right[collapsed]]
+        general_positions = np.concatenate([general_positions, collapsed])
+        intersections = np.concatenate([intersections, shapely.intersection(left_polygons, right_polygons)])
+        rect_positions = rect_positions[exact]
+
+    rect_results = _results(store, pairs[rect_positions], overlap_elevation[rect_positions],
+                            overlap_height[rect_positions], _rectangle_rings(store, pairs[rect_positions]))
+    general_results = _results(store, pairs[general_positions], overlap_elevation[general_positions],
+                               overlap_height[general_positions], _polygon_rings(intersections))
+
+    positions = np.concatenate([rect_positions, general_positions])
+    order = np.argsort(positions, kind="stable").tolist()
+    results = rect_results + general_results
+    return pairs[positions[order]].reshape(-1, 2), [results[n] for n in order]
+
+
+def _rectangle_overlap_is_exact(store: FootprintStore, pairs: np.ndarray) -> np.ndarray:
+    """True where the overlap of the rectangle pair stays a rectangle of positive area once rounded to 6 decimals."""
+    left, right = pairs[:, 0], pairs[:, 1]
+    low = np.maximum(store.rect_bounds[left, :2], store.rect_bounds[right, :2])
+    high = np.minimum(store.rect_bounds[left, 2:], store.rect_bounds[right, 2:])
+    return (round_half_even_6(high) > round_half_even_6(low)).all(axis=1)
+
+
+def _rectangle_rings(store: FootprintStore, pairs: np.ndarray) -> List[List[Tuple[float, float]]]:
+    """
+    Overlap rings of rectangle pairs, exactly as GEOS would compute them: the
+    overlap of two rectangles is the rectangle between the larger lower and
+    the smaller upper bounds. Rings run counter-clockwise from the lower left
+    corner, which is already where start_at_lowest_point puts the start.
+    """
+    left, right = pairs[:, 0], pairs[:, 1]
+    low = np.maximum(store.rect_bounds[left, :2], store.rect_bounds[right, :2])
+    high = np.minimum(store.rect_bounds[left, 2:], store.rect_bounds[right, 2:])
+    x0, y0 = round_half_even_6(low).T.tolist()
+    x1, y1 = round_half_even_6(high).T.tolist()
+    return [
+        [(a, b), (c, b), (c, d), (a, d), (a, b)]
+        for a, b, c, d in zip(x0, y0, x1, y1)
+    ]
+
+
+def _polygon_rings(intersections: np.ndarray) -> List[List[Tuple[float, float]]]:
+    """Rounded, counter-clockwise outer ring of each intersection (of its largest part if it has several)."""
+    if len(intersections) == 0:
+        return []
+    multi = shapely.get_type_id(intersections) == MULTIPOLYGON
+    if multi.any():
+        intersections = intersections.copy()
+        intersections[multi] = _largest_parts(intersections[multi])
+    rings = shapely.get_exterior_ring(shapely.orient_polygons(intersections))
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    ring_starts = np.searchsorted(ring_index, np.arange(len(rings) + 1)).tolist()
+
+    coords = round_half_even_6(coords)
+    # First lowest, then leftmost point of every ring, as start_at_lowest_point picks it.
+    order = np.lexsort((np.arange(len(coords)), coords[:, 0], coords[:, 1], ring_index))
+    lowest = order[ring_starts[:-1]].tolist()
+    points = list(zip(coords[:, 0].tolist(), coords[:, 1].tolist()))
+    ring_points = []
+    for n, start in enumerate(lowest):
+        ring = points[ring_starts[n]:ring_starts[n + 1]]
+        if ring[0] != ring[-1]:
+            ring.append(ring[0])
+        offset = start - ring_starts[n]
+        ring_points.append(ring[offset:] + ring[1:offset + 1])
+    return ring_points
+
+
+def _results(
+    store: FootprintStore, pairs: np.ndarray, elevations: np.ndarray, heights: np.ndarray,
+    rings: List[List[Tuple[float, float]]],
+) -> List[ClashResult]:
+    return [
+        ClashResult(
+            elevation=elevation,
+            height=height,
+            building_ids=sorted([store.ids[i], store.ids[j]]),
+            geometry=ring,
+        )
+        for (i, j), elevation, height, ring in zip(pairs.tolist(), elevations.tolist(), heights.tolist(), rings)
+    ]
@@ -0,0 +1,203 @@
+"""
+Binary footprint inputs, decoded straight into the columns of a FootprintStore.
+
+Parsing JSON numbers dominates the ingest of large GeoJSON models. These
+formats carry the same fields as binary columns instead:
+
+- "packed": the layout below, written by `pack_footprints`. Every section is
+  a little-endian array starting at a multiple of 8 bytes, so elevations,
+  heights, offsets and coordinates are NumPy views of the input, not copies.
+
+      header   b"BCLP", u16 version, u16 geometry (0: coordinates, 1: WKB), u64 count
+      f8[count]        elevations
+      f8[count]        heights
+      i8[count + 1]    geometry offsets: in points for coordinates, in bytes for WKB
+      geometry         f8[2 * points] x, y pairs, or the concatenated WKB polygons
+      i8[count + 1]    id offsets, in bytes
+      ids              concatenated UTF-8 ids
+
+- "geoparquet": a GeoParquet file with WKB geometries and `id`, `elevation`
+  and `height` columns. Reading it requires pyarrow.
+
+As with GeoJSON, only the outer ring of each polygon is used.
+"""
+import io
+import json
+import struct
+from typing import NamedTuple, Sequence
+
+import numpy as np
+import shapely
+
+from pypackages.common.payload_store import FORMAT_GEOPARQUET, FORMAT_PACKED
+
+# Local model files in a binary format, by suffix.
+BINARY_SUFFIXES = {".packed": FORMAT_PACKED, ".parquet": FORMAT_GEOPARQUET}
+
+GEOMETRY_COORDS = 0
+GEOMETRY_WKB = 1
+
+PACKED_MAGIC = b"BCLP"
+PACKED_VERSION = 1
+_HEADER = struct.Struct("<4sHHQ")
+
+
+class FootprintColumns(NamedTuple):
+    """Footprints as parallel columns; ring `i` is `coords[offsets[i]:offsets[i + 1]]`."""
+    ids: np.ndarray
+    elevations: np.ndarray
+    heights: np.ndarray
+    coords: np.ndarray
+    offsets: np.ndarray
+
+
+class _Sections:
+    """Reads consecutive 8-byte aligned little-endian arrays from a buffer."""
+
+    def __init__(self, data):
+        self.data = memoryview(data).cast("B")
+        self.pos = _HEADER.size
+
+    def take(self, dtype: str, count: int) -> np.ndarray:
+        size = np.dtype(dtype).itemsize * count
+        if count < 0 or self.pos + size > len(self.data):
+            raise ValueError("Packed input is truncated")
+        array = np.frombuffer(self.data, dtype=dtype, count=count, offset=self.pos)
+        self.pos += -(-size // 8) * 8
+        return array
+
+
+def _check_offsets(offsets: np.ndarray, name: str):
+    if offsets[0] != 0 or (np.diff(offsets) < 0).any():
+        raise ValueError(f"Packed input has invalid {name} offsets")
+
+
+def read_packed(data) -> FootprintColumns:
+    """Columns of a packed input held in `data` (bytes, bytearray, mmap...), viewed rather than copied."""
+    if len(data) < _HEADER.size:
+        raise ValueError("Packed input is truncated")
+    magic, version, geometry, count = _HEADER.unpack_from(data)
+    if magic != PACKED_MAGIC:
+        raise ValueError("Not a packed footprint input")
+    if version != PACKED_VERSION:
+        raise ValueError(f"Unsupported packed input version: {version}")
+    sections = _Sections(data)
+    elevations = sections.take("<f8", count)
+    heights = sections.take("<f8", count)
+    geometry_offsets = sections.take("<i8", count + 1)
+    _check_offsets(geometry_offsets, "geometry")
+    if geometry == GEOMETRY_COORDS:
+        coords = sections.take("<f8", 2 * int(geometry_offsets[-1])).reshape(-1, 2)
+        offsets = geometry_offsets
+    elif geometry == GEOMETRY_WKB:
+        blob = memoryview(sections.take("u1", int(geometry_offsets[-1])))
+        bounds = geometry_offsets.tolist()
+        wkb = np.array([blob[start:end].tobytes() for start, end in zip(bounds[:-1], bounds[1:])], dtype=object)
+        coords, offsets = None, None
+    else:
+        raise ValueError(f"Unknown packed geometry encoding: {geometry}")
+    id_offsets = sections.take("<i8", count + 1)
+    _check_offsets(id_offsets, "id")
+    id_bytes = sections.take("u1", int(id_offsets[-1])).tobytes()
+    bounds = id_offsets.tolist()
+    ids = np.array([id_bytes[start:end].decode("utf-8") for start, end in zip(bounds[:-1], bounds[1:])],
+                   dtype=object)
+    if geometry == GEOMETRY_WKB:
+        coords, offsets = _outer_rings(ids, wkb)
+    return _checked(FootprintColumns(ids, elevations, heights, coords, offsets))
+
+
+def _outer_rings(ids: np.ndarray, wkb: np.ndarray):
+    """Coordinates and point offsets of the outer rings of WKB polygons."""
+    try:
+        polygons = shapely.from_wkb(wkb)
+    except shapely.errors.GEOSException as e:
+        raise ValueError(f"Invalid WKB geometry: {e}") from None
+    not_polygon = np.flatnonzero(shapely.get_type_id(polygons) != shapely.GeometryType.POLYGON)
+    if len(not_polygon):
+        raise ValueError(f"Invalid footprint for building {ids[not_polygon[0]]}: geometry must be a Polygon")
+    coords, index = shapely.get_coordinates(shapely.get_exterior_ring(polygons), return_index=True)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(index, minlength=len(polygons)))])
+    return coords, offsets
+
+
+def _checked(columns: FootprintColumns) -> FootprintColumns:
+    count = len(columns.ids)
+    if not len(columns.elevations) == len(columns.heights) == len(columns.offsets) - 1 == count:
+        raise ValueError("Footprint columns have different lengths")
+    for name, values in (("elevation", columns.elevations), ("height", columns.heights)):
+        bad = np.flatnonzero(~np.isfinite(values))
+        if len(bad):
+            raise ValueError(f"Feature {bad[0]}: '{name}' must be a finite number")
+    return columns
+
+
+def pack_footprints(ids: Sequence[str], elevations: Sequence[float], heights: Sequence[float],
+                    coords: np.ndarray, offsets: np.ndarray, geometry: int = GEOMETRY_COORDS) -> bytes:
+    """Packed input holding the given columns, with geometries as coordinates or as WKB."""
+    coords = np.asarray(coords, dtype="<f8").reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype="<i8")
+    sections = [np.asarray(elevations, dtype="<f8"), np.asarray(heights, dtype="<f8")]
+    if geometry == GEOMETRY_COORDS:
+        sections += [offsets, coords]
+    elif geometry == GEOMETRY_WKB:
+        rings = shapely.linearrings(coords, indices=np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)))
+        wkb = shapely.to_wkb(shapely.polygons(rings))
+        sections += [_byte_offsets(wkb), b"".join(wkb)]
+    else:
+        raise ValueError(f"Unknown packed geometry encoding: {geometry}")
+    encoded_ids = [building_id.encode("utf-8") for building_id in ids]
+    sections += [_byte_offsets(encoded_ids), b"".join(encoded_ids)]
+
+    parts = [_HEADER.pack(PACKED_MAGIC, PACKED_VERSION, geometry, len(encoded_ids))]
+    for section in sections:
+        data = section.tobytes() if isinstance(section, np.ndarray) else section
+        parts += [data, bytes(-len(data) % 8)]
+    return b"".join(parts)
+
+
+def _byte_offsets(values: Sequence[bytes]) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum([len(value) for value in values], dtype=np.int64)]).astype("<i8")
+
+
+def read_geoparquet(source) -> FootprintColumns:
+    """Columns of a GeoParquet file, a path or a binary file object; requires pyarrow."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("GeoParquet input requires pyarrow") from None
+    parquet = pq.ParquetFile(source)
+    geo = json.loads((parquet.schema_arrow.metadata or {}).get(b"geo", b"{}"))
+    column = geo.get("primary_column", "geometry")
+    encoding = geo.get("columns", {}).get(column, {}).get("encoding", "WKB")
+    if encoding.upper() != "WKB":
+        raise ValueError(f"Unsupported GeoParquet geometry encoding: {encoding}")
+    table = parquet.read(columns=["id", "elevation", "height", column])
+    ids = np.array(table.column("id").to_pylist(), dtype=object)
+    bad = next((n for n, building_id in enumerate(ids) if not isinstance(building_id, str)), None)
+    if bad is not None:
+        raise ValueError(f"Feature {bad}: 'id' must be a string")
+    coords, offsets = _outer_rings(ids, table.column(column).to_numpy())
+    return _checked(FootprintColumns(
+        ids,
+        _float_column(table, "elevation"),
+        _float_column(table, "height"),
+        coords,
+        offsets,
+    ))
+
+
+def _float_column(table, name: str) -> np.ndarray:
+    column = table.column(name)
+    if column.null_count:
+        raise ValueError(f"GeoParquet column '{name}' has missing values")
+    return column.to_numpy().astype(np.float64, copy=False)
+
+
+def read_binary(data, input_format: str) -> FootprintColumns:
+    """Columns of a binary input in `input_format`, from its bytes."""
+    if input_format == FORMAT_PACKED:
+        return read_packed(data)
+    if input_format == FORMAT_GEOPARQUET:
+        return read_geoparquet(io.BytesIO(data))
+    raise ValueError(f"Unsupported input format: {input_format}")
@@ -1,118 +1,518 @@
 import json
 import logging
 import math
-from decimal import Decimal
-from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 from shapely.geometry import Polygon, MultiPolygon
 from shapely.geometry.polygon import orient
-from pydantic import BaseModel, ValidationError
-import boto3
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table("BuildingClashResults")
+
+from pypackages.common import aws_clients
+from pypackages.common.cache import result_key, shared_cache
+from pypackages.common.logger import PipelineMetrics, profiled
+from pypackages.common.payload_store import FORMAT_GEOJSON, open_payload, payload_store_from_env
+from pypackages.common.result_storage import STATUS_COMPLETE, STATUS_FAILED, ResultStore, dump_result
+from pypackages.detect_building_clash.batch_engine import (
+    DEFAULT_BATCH_SIZE,
+    compute_clashes_batch,
+    compute_clashes_batch_with_pairs,
+    find_clashing_pairs,
+)
+from pypackages.detect_building_clash.binary_input import read_binary
+from pypackages.detect_building_clash.footprint_store import FootprintStore, FootprintStoreBuilder
+from pypackages.detect_building_clash.geojson_stream import ingest_message, read_feature
+from pypackages.detect_building_clash.incremental import detect_incremental, project_id_of
+from pypackages.detect_building_clash.models import ClashResult, start_at_lowest_point
+# Re-exports BuildingFeature lazily, as models.py does.
+from pypackages.detect_building_clash.models import __getattr__  # noqa: F401
+from pypackages.detect_building_clash.parallel import detect_parallel
+from pypackages.detect_building_clash.query import MODE_ANY, MODE_FULL, ClashQuery
+from pypackages.detect_building_clash.sharding import (
+    SHARD_FEATURES,
+    SHARD_MIN_FEATURES,
+    STATUS_SHARDED,
+    ShardQueue,
+    merge_partials,
+    owned_pairs,
+    plan_shards,
+    shard_key,
+    shard_messages,
+    shard_partial,
+)
+from pypackages.detect_building_clash.spatial_index import (
+    CANDIDATE_SEARCHES,
+    CANDIDATE_SEARCH_3D,
+    CANDIDATE_SEARCH_BRUTE_FORCE,
+    CANDIDATE_SEARCH_STRTREE,
+    CandidateStats,
+    brute_force_candidate_pairs,
+    candidate_pairs_3d,
+    strtree_candidate_pairs,
+)
+
+if TYPE_CHECKING:
+    from pypackages.detect_building_clash.input_model import BuildingFeature
+
+TABLE_NAME = "BuildingClashResults"
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+ENGINE_BATCH = "batch"
+ENGINE_SCALAR = "scalar"
+ENGINES = (ENGINE_BATCH, ENGINE_SCALAR)
+
+# Below this many buildings process start-up costs more than the tiles save.
+PARALLEL_MIN_FEATURES = 500
 
-@dataclass
-class ClashResult:
-    elevation: float
-    height: float
-    building_ids: List[str]
-    geometry: List[Tuple[float, float]]
+# Records with bodies up to this size are run concurrently within a batch.
+SMALL_JOB_BYTES = 64 * 1024
+BATCH_CONCURRENCY = 4
+# No record of a batch is started with less invocation time left than this,
+# or than the longest record of the batch took so far; the rest are retried.
+BATCH_DEADLINE_RESERVE_MS = 5000
+# The task queue's max_receive_count: SQS moves a message to the dead-letter
+# queue after this many receives, so only the last failed one marks its task FAILED.
+MAX_RECEIVE_COUNT = 3
 
 
-class BuildingFeature(BaseModel):
-    """Pydantic model for input validation"""
-    id: str
-    properties: Dict[str, float]
-    geometry: Dict[str, Any]
+def get_result_store() -> ResultStore:
+    return ResultStore(aws_clients.resource("dynamodb").Table(TABLE_NAME), payload_store=payload_store_from_env())
 
 
 class BuildingClashDetectService:
+    def __init__(
+        self,
+        candidate_search: str = CANDIDATE_SEARCH_3D,
+        engine: str = ENGINE_BATCH,
+        workers: int = 1,
+        project_states=None,
+        batch_concurrency: int = BATCH_CONCURRENCY,
+        geometry_cache=None,
+        grid_size: Optional[float] = None,
+        shard_queue: Optional[ShardQueue] = None,
+        shard_min_features: int = SHARD_MIN_FEATURES,
+        shard_features: int = SHARD_FEATURES,
+        payload_store=None,
+        project_indexes=None,
+    ):
+        """
+        `candidate_search` picks how pairs are chosen for exact intersection:
+        "3d" (default) only tests pairs that overlap vertically and whose
+        bounding boxes overlap, "strtree" only applies the bounding box test,
+        "brute_force" tests every pair and is kept for verification.
+
+        `engine` picks how candidate pairs are intersected: "batch" (default)
+        uses vectorized shapely calls, "scalar" calls
+        calculate_overlap_and_metadata pair by pair. Both give equal results.
+
+        `workers` > 1 splits large sites into spatial tiles detected in that many
+        processes with the "3d" search and "batch" engine; results are the same
+        as the serial path.
+
+        `project_states` (see incremental.py) enables incremental re-detection
+        for messages that carry a `project_id`: only pairs involving buildings
+        added or changed since the project's last run are recomputed.
+
+        `batch_concurrency` caps the threads execute_batch runs small records on.
+
+        `geometry_cache` (an LRUCache) keeps validated footprints by content
+        across tasks, so repeated submissions skip building them again.
+
+        `grid_size` snaps footprints that are not axis-aligned rectangles to a
+        grid of that spacing once, as they are validated, and intersections
+        are computed on the same grid. That makes GEOS's work cheaper and more
+        robust on noisy input, but moves clash coordinates by up to half the
+        grid size; the default (None) keeps full precision.
+
+        With a `shard_queue`, tasks of at least `shard_min_features` buildings
+        are split into spatial shards of about `shard_features` buildings,
+        queued as sub-tasks and merged by whichever worker finishes the last
+        one (see sharding.py). The merged result equals a single run's.
+
+        `payload_store` (see payload_store.py) holds the inputs of claim-check
+        messages; it defaults to the one configured by the environment.
+
+        `project_indexes` (a ProjectIndexStore, see project_index.py) stores
+        the footprints of every task that carries a `project_id`, so candidate
+        buildings can later be checked against the project's latest model.
+        """
+        if candidate_search not in CANDIDATE_SEARCHES:
+            raise ValueError(f"Unknown candidate search: {candidate_search}")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        self.candidate_search = candidate_search
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.project_states = project_states
+        self.batch_concurrency = max(1, batch_concurrency)
+        self.geometry_cache = geometry_cache
+        self.grid_size = grid_size
+        self.shard_queue = shard_queue
+        self.shard_min_features = shard_min_features
+        self.shard_features = shard_features
+        self.payload_store = payload_store
+        self.project_indexes = project_indexes
+        self._local = threading.local()
+
+    @property
+    def candidate_stats(self) -> Optional[CandidateStats]:
+        """Candidate search stats of the calling thread's last detection, if it searched."""
+        return getattr(self._local, "candidate_stats", None)
+
+    @candidate_stats.setter
+    def candidate_stats(self, stats: Optional[CandidateStats]):
+        self._local.candidate_stats = stats
+
     def execute(self, event: dict) -> Dict:
-        """Entry point for clash detection"""
+        """Entry point for clash detection of a single-record event"""
+        records = event.get("Records", [])
+        if len(records) != 1:
+            raise ValueError(f"Expected one record, got {len(records)}; use execute_batch")
+        return self.process_record(records[0])
+
+    def execute_batch(self, event: dict, context=None) -> Dict:
+        """
+        Entry point for an SQS batch. Every record is processed; small ones
+        concurrently on `batch_concurrency` threads (their time is mostly spent
+        parsing and waiting on DynamoDB), large ones one at a time so their
+        working sets don't pile up. Failed records are returned as
+        `batchItemFailures` so SQS retries only those messages. Claim-check
+        messages are short but only used for large inputs, so they count as large.
+
+        Invalid inputs (ValueError) are not retried: their task is marked
+        FAILED and the message acknowledged. Other errors leave the task
+        PENDING while SQS retries it, and mark it FAILED on its last receive. With the Lambda `context`,
+        records are no longer started near the invocation's deadline and are
+        reported as failures instead, to be retried by a later invocation.
+        """
+        records = event.get("Records", [])
+
+        def is_small(record: Dict) -> bool:
+            body = record.get("body", "")
+            return len(body) <= SMALL_JOB_BYTES and '"payload"' not in body
+
+        small = [r for r in records if is_small(r)]
+        large = [r for r in records if not is_small(r)]
+        failures = []
+        longest_ms = 0.0
+
+        def run(record: Dict) -> bool:
+            nonlocal longest_ms
+            if context is not None:
+                if context.get_remaining_time_in_millis() < max(BATCH_DEADLINE_RESERVE_MS, longest_ms):
+                    return False
+            start = time.perf_counter()
+            try:
+                self.process_record(record)
+                return True
+            except ValueError:
+                # Retrying cannot fix the input; process_record marked the task FAILED.
+                return True
+            except Exception:
+                return False
+            finally:
+                longest_ms = max(longest_ms, (time.perf_counter() - start) * 1000)
+
+        if len(small) > 1 and self.batch_concurrency > 1:
+            with ThreadPoolExecutor(max_workers=min(self.batch_concurrency, len(small))) as pool:
+                outcomes = list(pool.map(run, small))
+        else:
+            outcomes = [run(record) for record in small]
+        outcomes += [run(record) for record in large]
+
+        for record, succeeded in zip(small + large, outcomes):
+            if not succeeded:
+                failures.append({"itemIdentifier": record["messageId"]})
+        logger.info(f"Processed {len(records)} records, {len(failures)} failed")
+        return {"batchItemFailures": failures}
+
+    def process_record(self, record: Dict) -> Dict:
+        """
+        Detect clashes for one SQS record and store the result under its task id.
+        The task's `query` (see query.py) may ask for a summary instead of every
+        clash, or set overlap thresholds. Stage timings and counts are logged as
+        one metrics line per record.
+        """
+        task_id = None
+        # Filled while the body is parsed; the task id comes first, so failures to parse features are recorded.
+        message: Dict[str, Any] = {}
+        status = STATUS_FAILED
+        metrics = PipelineMetrics("clash_detection")
+        self.candidate_stats = None
         try:
-            record = event.get("Records", [])[0]
-            input_data = json.loads(record["body"])
+            with profiled("process_record", logger):
+                body = record["body"]
+                metrics.count("payload_bytes", len(body) if body.isascii() else len(body.encode("utf-8")))
+                builder = FootprintStoreBuilder()
+                with metrics.stage("parse"):
+                    ingest_message(body, builder, fields=message)
+                    if "payload" in message:
+                        message["input"] = self._ingest_payload(message["payload"], builder, metrics)
+                task_id = message.get("task_id")
+                query = ClashQuery.from_message(message)
+                with metrics.stage("validate"):
+                    store = builder.build(geometry_cache=self.geometry_cache, grid_size=self.grid_size)
+                metrics.count("features", len(store))
+                logger.info(f"Received task {task_id} with {len(store)} features")
 
-            logger.info(f"Received input data: {input_data}")
-            print(input_data)
+                project_id = project_id_of(message)
+                if project_id is not None and self.project_indexes is not None and message.get("shard") is None:
+                    with metrics.stage("index"):
+                        self.project_indexes.save(project_id, store, task_id=task_id)
 
-            data = input_data.get("input", input_data)
-            task_id = input_data.get("task_id", input_data)
+                if message.get("shard") is not None:
+                    result = self._process_shard(task_id, message["shard"], store, query, metrics)
+                    status = STATUS_COMPLETE
+                    return result
+                # Incremental detection keeps the whole model's state, so project tasks are never sharded.
+                incremental = (project_id is not None and self.project_states is not None
+                               and query.mode == MODE_FULL and not query.filtered)
+                if self.shard_queue is not None and not incremental and len(store) >= self.shard_min_features:
+                    with metrics.stage("plan"):
+                        shards = self._enqueue_shards(task_id, store, query)
+                    if shards:
+                        metrics.count("shards", shards)
+                        status = STATUS_SHARDED
+                        return {"task_id": task_id, "shards": shards}
 
-            validated_data = self._validate_input(data)
-            results = self._process_features(validated_data["features"])
-            self.save_result(task_id=task_id, result={
-                "type": "FeatureCollection",
-                "features": self.format_results(results)
-            })
-            print(self.format_results(results))
+                with metrics.stage("detect"):
+                    if query.mode != MODE_FULL:
+                        results = self._find_clashing_pairs(store, query)
+                    elif incremental:
+                        results = self._process_project(project_id, store)
+                    else:
+                        results = self._process_store(store, query)
+                if self.candidate_stats is not None:
+                    metrics.count("total_pairs", self.candidate_stats.total_pairs)
+                    metrics.count("candidate_pairs", self.candidate_stats.candidate_pairs)
+                metrics.count("clashes", len(results))
 
-            return {
-                "type": "FeatureCollection",
-                "features": self.format_results(results)
-            }
+                with metrics.stage("format"):
+                    if query.mode != MODE_FULL:
+                        result = self.summarize(store.ids, results, query)
+                    else:
+                        result = {
+                            "type": "FeatureCollection",
+                            "features": self.format_results(results)
+                        }
+                with metrics.stage("store"):
+                    self.save_result(task_id=task_id, result=result)
+                status = STATUS_COMPLETE
+                return result
 
-        except ValidationError as e:
-            logger.error(f"Validation error: {e.json()}")
-            raise ValueError("Invalid input format") from e
         except Exception as e:
             logger.error(f"Execution failed: {str(e)}", exc_info=True)
+            if task_id is None and isinstance(message.get("task_id"), str):
+                task_id = message["task_id"]
+            # A shard's task id is its parent's, whose status other shards and the reducer own.
+            if task_id is not None and message.get("shard") is None and _is_final(record, e):
+                self.save_failure(task_id, str(e))
             raise
+        finally:
+            metrics.emit(logger, task_id=task_id, status=status)
 
     def save_result(self, task_id: str, result: Dict):
-        table.put_item(Item={
-            "task_id": task_id,
-            "result": result
-        })
+        result_json = dump_result(result)
+        get_result_store().save_json(task_id, result_json)
+        # Shares the result with the API through Redis when it is configured.
+        shared_cache().set(result_key(task_id), result_json.encode("utf-8"), local=False)
 
-    def _validate_input(self, data: Dict) -> Dict:
+    def _ingest_payload(self, payload: Dict, builder: FootprintStoreBuilder, metrics: PipelineMetrics) -> Dict:
+        """
+        Stream a claim-check input from the payload store into `builder`;
+        returns its other fields. Binary inputs (see binary_input.py) are read
+        whole and handed to the builder as columns.
+        """
+        store = self.payload_store if self.payload_store is not None else payload_store_from_env()
+        if store is None:
+            raise ValueError("Task input is in a payload store, but none is configured")
+        metrics.count("payload_object_bytes", int(payload.get("size", 0)))
+        input_format = payload.get("format", FORMAT_GEOJSON)
+        if input_format == FORMAT_GEOJSON:
+            with open_payload(store, payload) as stream:
+                return ingest_message(stream, builder)
+        with open_payload(store, payload, binary=True) as stream:
+            data = stream.read()
+        builder.add_columns(read_binary(data, input_format))
+        return {}
+
+    def _enqueue_shards(self, task_id: str, store: FootprintStore, query: ClashQuery) -> int:
+        """Queue the shards of a large task; returns how many, 0 if it does not split."""
+        tiling, shards = plan_shards(store, self.shard_features)
+        if len(shards) < 2:
+            return 0
+        sent = self.shard_queue.send(shard_messages(task_id, store, query, tiling, shards))
+        logger.info(f"Split task {task_id} into {sent} shards")
+        return sent
+
+    def _process_shard(
+        self, task_id: str, shard: Dict, store: FootprintStore, query: ClashQuery, metrics: PipelineMetrics
+    ) -> Dict:
+        """Detect the pairs a shard owns, store them as a partial result and merge all partials if it was the last."""
+        with metrics.stage("detect"):
+            pairs = owned_pairs(store, shard, self._candidate_pairs(store))
+            if query.mode == MODE_FULL:
+                clashing, clashes = compute_clashes_batch_with_pairs(store, pairs, query=query)
+            else:
+                clashing, clashes = find_clashing_pairs(store, pairs, query, first_only=query.mode == MODE_ANY), None
+        metrics.count("clashes", len(clashing))
+        with metrics.stage("format"):
+            features = self.format_results(clashes) if clashes is not None else None
+            partial = shard_partial(store, shard, clashing, features)
+        with metrics.stage("store"):
+            get_result_store().save(shard_key(task_id, shard["index"]), partial)
+        with metrics.stage("reduce"):
+            self.reduce_shards(task_id, shard["count"], query)
+        return partial
+
+    def reduce_shards(self, task_id: str, shard_count: int, query: ClashQuery) -> Optional[Dict]:
+        """
+        Merge the partial results of a sharded task into its result once every
+        shard has stored one, then remove them. Returns None, and does
+        nothing, while a shard is still missing; several workers may merge
+        the same task concurrently, and they all store the same result.
+        """
+        results = get_result_store()
+        keys = [shard_key(task_id, index) for index in range(shard_count)]
+        if not all(results.is_complete(key) for key in keys):
+            return None
+        partials = [results.fetch(key, consistent=True) for key in keys]
+        if any(partial is None for partial in partials):
+            return None  # Another worker merged them first and is removing them.
+        pairs, ids, features = merge_partials(partials)
+        if query.mode == MODE_FULL:
+            result = {"type": "FeatureCollection", "features": features}
+        else:
+            result = self.summarize(ids, pairs, query)
+        self.save_result(task_id=task_id, result=result)
+        for key in keys:
+            results.delete(key)
+        logger.info(f"Merged {shard_count} shards of task {task_id}: {len(pairs)} clashes")
+        return result
+
+    def save_failure(self, task_id: str, error: str):
+        """Record a failure that will not be retried, so status lookups report it; resubmitting queues it again."""
+        try:
+            get_result_store().mark_failed(task_id, error)
+        except Exception:
+            logger.error(f"Could not record failure of task {task_id}", exc_info=True)
+
+    def _validate_input(self, data: Dict) -> FootprintStore:
+        """Validate already-parsed GeoJSON; execute streams the raw body instead."""
         if not isinstance(data.get("features"), list):
             raise ValueError("Missing 'features' array")
-        features = [BuildingFeature(**f) for f in data["features"]]
-        return {"features": features}
-
-    def get_polygon(self, feature: BuildingFeature) -> Polygon:
-        coords = feature.geometry["coordinates"][0]
-        return Polygon(coords)
-
-    def _process_features(self, features: List[BuildingFeature]) -> List[ClashResult]:
-        result_features = []
-        for i in range(len(features)):
-            for j in range(i + 1, len(features)):
-                clash = self.calculate_overlap_and_metadata(features[i], features[j])
+        builder = FootprintStoreBuilder()
+        for index, feature in enumerate(data["features"]):
+            builder.add(*read_feature(feature, index))
+        return builder.build(grid_size=self.grid_size)
+
+    def _process_project(self, project_id: str, store: FootprintStore) -> List[ClashResult]:
+        previous = self.project_states.load(project_id)
+        results, state, stats = detect_incremental(store, previous)
+        self.project_states.save(project_id, state)
+        logger.info(f"Incremental detection for project {project_id}: {stats}")
+        return results
+
+    def _candidate_pairs(self, store: FootprintStore):
+        total_pairs = len(store) * (len(store) - 1) // 2
+        if self.candidate_search == CANDIDATE_SEARCH_3D:
+            pairs, stats = candidate_pairs_3d(store.polygons, store.elevations, store.tops)
+        elif self.candidate_search == CANDIDATE_SEARCH_STRTREE:
+            pairs = strtree_candidate_pairs(store.polygons)
+            stats = CandidateStats(
+                strategy=CANDIDATE_SEARCH_STRTREE,
+                total_pairs=total_pairs,
+                envelope_pruned=total_pairs - len(pairs),
+                candidate_pairs=len(pairs),
+            )
+        else:
+            pairs = brute_force_candidate_pairs(len(store))
+            stats = CandidateStats(
+                strategy=CANDIDATE_SEARCH_BRUTE_FORCE,
+                total_pairs=total_pairs,
+                candidate_pairs=total_pairs,
+            )
+        self.candidate_stats = stats
+        logger.info(f"Candidate pairs: {stats}")
+        return pairs
+
+    def _process_features(self, features: List["BuildingFeature"]) -> List[ClashResult]:
+        return self._process_store(FootprintStore.from_features(features, grid_size=self.grid_size))
+
+    def _process_store(self, store: FootprintStore, query: Optional[ClashQuery] = None) -> List[ClashResult]:
+        if (
+            self.workers > 1
+            and len(store) >= PARALLEL_MIN_FEATURES
+            and self.candidate_search == CANDIDATE_SEARCH_3D
+            and self.engine == ENGINE_BATCH
+        ):
+            return detect_parallel(store, self.workers, query)
+
+        return [clash for chunk in self.iter_clashes(store, query) for clash in chunk]
+
+    def iter_clashes(self, store: FootprintStore, query: Optional[ClashQuery] = None) -> Iterator[List[ClashResult]]:
+        """
+        Clashes of the store in order, as one list per DEFAULT_BATCH_SIZE
+        candidate pairs, so callers can write them out as they are found.
+        Always serial, whatever `workers` is.
+        """
+        pairs = self._candidate_pairs(store)
+        for start in range(0, len(pairs), DEFAULT_BATCH_SIZE):
+            chunk = pairs[start:start + DEFAULT_BATCH_SIZE]
+            if self.engine == ENGINE_BATCH:
+                yield compute_clashes_batch(store, chunk, query=query)
+                continue
+            clashes = []
+            for i, j in chunk.tolist():
+                clash = self.calculate_overlap_and_metadata(store, i, j, query)
                 if clash:
-                    result_features.append(clash)
-        return result_features
+                    clashes.append(clash)
+            yield clashes
+
+    def _find_clashing_pairs(self, store: FootprintStore, query: ClashQuery) -> np.ndarray:
+        """Clashing pairs for the summary modes, which never build clash geometry (with either engine)."""
+        pairs = self._candidate_pairs(store)
+        return find_clashing_pairs(store, pairs, query, first_only=query.mode == MODE_ANY)
 
     def calculate_overlap_and_metadata(
-        self, f1: BuildingFeature, f2: BuildingFeature
+        self, store: FootprintStore, i: int, j: int, query: Optional[ClashQuery] = None
     ) -> Optional[ClashResult]:
-        poly1 = self.get_polygon(f1)
-        poly2 = self.get_polygon(f2)
-        intersection = poly1.intersection(poly2)
-
-        if not intersection.is_empty and intersection.area > 0:
-            elev1 = f1.properties["elevation"]
-            elev2 = f2.properties["elevation"]
-            height1 = f1.properties["height"]
-            height2 = f2.properties["height"]
+        """Clash between buildings `i` and `j` of the store, if any, and if it meets the query's thresholds."""
+        elev1 = float(store.elevations[i])
+        elev2 = float(store.elevations[j])
+        height1 = float(store.heights[i])
+        height2 = float(store.heights[j])
 
-            top1 = elev1 + height1
-            top2 = elev2 + height2
+        top1 = elev1 + height1
+        top2 = elev2 + height2
 
-            overlap_elevation = max(elev1, elev2)
-            overlap_top = min(top1, top2)
-            overlap_height = max(0, overlap_top - overlap_elevation)
+        overlap_elevation = max(elev1, elev2)
+        overlap_top = min(top1, top2)
+        overlap_height = max(0, overlap_top - overlap_elevation)
 
-            if overlap_height <= 0:
+        # Vertically disjoint pairs can never clash, so skip the 2D work for them.
+        if overlap_height <= 0:
+            return None
+        min_area = 0.0
+        if query is not None:
+            if overlap_height < query.min_overlap_height:
                 return None
+            min_area = query.min_overlap_area
+
+        poly1 = store.polygon(i)
+        poly2 = store.polygon(j)
+        if not poly1.intersects(poly2):
+            return None
+        # Rectangles are never snapped (see FootprintStore), nor are their overlaps, as in the batch engine.
+        both_rectangles = store.rectangles[i] and store.rectangles[j]
+        intersection = poly1.intersection(poly2, grid_size=None if both_rectangles else store.grid_size)
 
+        if not intersection.is_empty and intersection.area > 0 and intersection.area >= min_area:
             if intersection.geom_type == "Polygon":
                 coords = list(orient(intersection, sign=1.0).exterior.coords)
             elif intersection.geom_type == "MultiPolygon":
@@ -128,27 +528,30 @@ class BuildingClashDetectService:
             return ClashResult(
                 elevation=overlap_elevation,
                 height=overlap_height,
-                building_ids=sorted([f1.id, f2.id]),
-                geometry=cleaned_coords
+                building_ids=sorted([store.ids[i], store.ids[j]]),
+                geometry=start_at_lowest_point(cleaned_coords)
             )
 
         return None
 
     def rotate_ring_to_start(self,ring: List[Tuple[float, float]]) -> List[List[float]]:
         """Rotate the polygon ring so it always starts at the top-left-most point."""
-        min_index = min(range(len(ring)), key=lambda i: (ring[i][1], ring[i][0]))  # y (top), then x (left)
-        rotated = ring[min_index:] + ring[1:min_index + 1]  # Ensure it's closed by skipping the duplicate point
-        return [[int(x) if float(x).is_integer() else x, int(y) if float(y).is_integer() else y] for x, y in rotated]
+        return [[_plain_number(x), _plain_number(y)] for x, y in start_at_lowest_point(ring)]
 
     def format_results(self, clashes: List[ClashResult]) -> List[Dict]:
+        """
+        GeoJSON features for the clashes, built once per result. Values are
+        plain ints and floats, so the list serializes straight to JSON for
+        storage and for the API response.
+        """
         formatted = []
         for clash in clashes:
             rotated_coords = self.rotate_ring_to_start(clash.geometry)
             formatted.append({
                 "type": "Feature",
                 "properties": {
-                    "elevation": int(clash.elevation) if clash.elevation.is_integer() else clash.elevation,
-                    "height": int(clash.height) if clash.height.is_integer() else clash.height,
+                    "elevation": _plain_number(clash.elevation),
+                    "height": _plain_number(clash.height),
                     "buildings": clash.building_ids,
                 },
                 "geometry": {
@@ -156,16 +559,36 @@ class BuildingClashDetectService:
                     "coordinates": [rotated_coords]
                 }
             })
-        return self.convert_floats_to_decimal(formatted)
-
-    # Convert all float values to Decimal recursively
-    def convert_floats_to_decimal(self,d):
-        if isinstance(d, dict):
-            return {key: self.convert_floats_to_decimal(value) for key, value in d.items()}
-        elif isinstance(d, list):
-            return [self.convert_floats_to_decimal(item) for item in d]
-        elif isinstance(d, float):
-            return Decimal(str(d))  # Convert float to Decimal
-        else:
-            return d
+        return formatted
+
+
+    def summarize(self, ids, clashing_pairs: np.ndarray, query: ClashQuery) -> Dict:
+        """
+        Result of an "any" query (whether anything clashes, and the first pair
+        found) or a "count" query (the number of clashes, and per building how
+        many clashes it is part of). `ids` maps building indices to ids.
+        """
+        if query.mode == MODE_ANY:
+            result = {"type": "ClashSummary", "mode": MODE_ANY, "clash_found": len(clashing_pairs) > 0}
+            if len(clashing_pairs):
+                result["buildings"] = sorted(ids[i] for i in clashing_pairs[0].tolist())
+            return result
+        indices, counts = np.unique(clashing_pairs.ravel(), return_counts=True)
+        buildings: Dict[str, int] = {}
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            buildings[ids[index]] = buildings.get(ids[index], 0) + count
+        return {"type": "ClashSummary", "mode": query.mode, "clash_count": len(clashing_pairs), "buildings": buildings}
+
+
+def _is_final(record: Dict, error: Exception) -> bool:
+    """Whether a failed record will not be retried: invalid input, or its last receive from SQS."""
+    if isinstance(error, ValueError):
+        return True
+    # Records that did not come from SQS are never redelivered.
+    receives = int(record.get("attributes", {}).get("ApproximateReceiveCount", MAX_RECEIVE_COUNT))
+    return receives >= MAX_RECEIVE_COUNT
+
 
+def _plain_number(value: float):
+    """Whole numbers as ints, so 2.0 is written as 2."""
+    return int(value) if float(value).is_integer() else value
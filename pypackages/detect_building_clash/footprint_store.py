@@ -0,0 +1,230 @@
+import hashlib
+from array import array
+from itertools import chain
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+# Rough memory of one cached polygon beyond its coordinates (GEOS objects, prepared index).
+FOOTPRINT_OVERHEAD_BYTES = 512
+
+
+class FootprintStore:
+    """
+    Columnar footprints for one request.
+
+    Ids, elevations and heights are parallel arrays, and every outer ring lives
+    in one contiguous float64 `coords` buffer of shape (n_points, 2); ring `i`
+    is `coords[offsets[i]:offsets[i + 1]]`. Polygons are built once from that
+    buffer in a single vectorized call, validated and prepared, so
+    `intersects` checks against them are cheap and the costly `intersection`
+    only runs on pairs that actually touch.
+
+    Footprints that are axis-aligned rectangles are flagged in `rectangles`,
+    with their (minx, miny, maxx, maxy) in `rect_bounds`, so rectangle pairs
+    can be intersected by interval arithmetic instead of GEOS.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        elevations: Sequence[float],
+        heights: Sequence[float],
+        coords: np.ndarray,
+        offsets: np.ndarray,
+        polygons: Optional[np.ndarray] = None,
+        geometry_cache=None,
+        grid_size: Optional[float] = None,
+    ):
+        """
+        `geometry_cache` (an LRUCache, see pypackages/common/cache.py) keeps
+        validated polygons by ring content; footprints found there are not
+        built or validated again.
+
+        `grid_size` snaps every footprint but rectangles to a grid of that
+        spacing once validated; intersections of the store's polygons should
+        then use the same grid size.
+        """
+        self.ids = np.asarray(ids, dtype=object)
+        self.elevations = np.asarray(elevations, dtype=np.float64)
+        self.heights = np.asarray(heights, dtype=np.float64)
+        self.tops = self.elevations + self.heights
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.grid_size = grid_size
+        self.rectangles, self.rect_bounds = self._find_rectangles()
+        if polygons is None:
+            polygons = self._build_polygons() if geometry_cache is None else self._cached_polygons(geometry_cache)
+        self.polygons = polygons
+        shapely.prepare(self.polygons)
+
+    @classmethod
+    def from_features(cls, features: Sequence, grid_size: Optional[float] = None) -> "FootprintStore":
+        """Store for a list of BuildingFeature models."""
+        builder = FootprintStoreBuilder()
+        for f in features:
+            builder.add(f.id, f.properties["elevation"], f.properties["height"], f.geometry["coordinates"][0])
+        return builder.build(grid_size=grid_size)
+
+    def _invalid(self, index: int, reason: str) -> ValueError:
+        return ValueError(f"Invalid footprint for building {self.ids[index]}: {reason}")
+
+    def _find_rectangles(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mask of the rings that are axis-aligned rectangles of positive area,
+        closed or not, and the bounds of each (NaN for other rings).
+        """
+        sizes = np.diff(self.offsets)
+        rectangles = np.zeros(len(sizes), dtype=bool)
+        bounds = np.full((len(sizes), 4), np.nan)
+        candidates = np.flatnonzero((sizes == 4) | (sizes == 5))
+        if len(candidates) == 0:
+            return rectangles, bounds
+        starts = self.offsets[candidates]
+        corners = self.coords[starts[:, None] + np.arange(4)]
+        closed = (self.coords[starts] == self.coords[self.offsets[candidates + 1] - 1]).all(axis=1)
+        following = np.roll(corners, -1, axis=1)
+        same_x = corners[:, :, 0] == following[:, :, 0]
+        same_y = corners[:, :, 1] == following[:, :, 1]
+        # Edges alternate between horizontal and vertical, starting with either.
+        alternating = (same_y[:, 0] & same_x[:, 1] & same_y[:, 2] & same_x[:, 3]) | (
+            same_x[:, 0] & same_y[:, 1] & same_x[:, 2] & same_y[:, 3]
+        )
+        low, high = corners.min(axis=1), corners.max(axis=1)
+        found = alternating & (closed == (sizes[candidates] == 5)) & (high > low).all(axis=1)
+        rectangles[candidates[found]] = True
+        bounds[candidates[found]] = np.concatenate([low, high], axis=1)[found]
+        return rectangles, bounds
+
+    def _build_polygons(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Validated polygons for the rings at `indices` (default: all of them)."""
+        coords, offsets = self.coords, self.offsets
+        if indices is None:
+            indices = np.arange(len(offsets) - 1)
+        else:
+            sizes = np.diff(offsets)[indices]
+            offsets = np.concatenate([[0], np.cumsum(sizes)])
+            coords = coords[np.repeat(self.offsets[:-1][indices] - offsets[:-1], sizes) + np.arange(offsets[-1])]
+        sizes = np.diff(offsets)
+        if len(sizes) == 0:
+            return np.empty(0, dtype=object)
+        too_short = np.flatnonzero(sizes < 3)
+        if len(too_short):
+            raise self._invalid(indices[too_short[0]], "a ring requires at least 3 coordinates")
+        starts, ends = offsets[:-1], offsets[1:] - 1
+        closed = (coords[starts] == coords[ends]).all(axis=1)
+        too_short = np.flatnonzero(sizes + ~closed < 4)
+        if len(too_short):
+            raise self._invalid(indices[too_short[0]], "a ring requires at least 4 coordinates")
+        finite = np.logical_and.reduceat(np.isfinite(coords).all(axis=1), starts)
+        if not finite.all():
+            raise self._invalid(indices[np.flatnonzero(~finite)[0]], "non-finite coordinates")
+
+        rings = shapely.linearrings(coords, indices=np.repeat(np.arange(len(sizes)), sizes))
+        polygons = shapely.polygons(rings)
+        invalid = np.flatnonzero(~shapely.is_valid(polygons))
+        if len(invalid):
+            raise self._invalid(indices[invalid[0]], shapely.is_valid_reason(polygons[invalid[0]]))
+        if self.grid_size:
+            snap = ~self.rectangles[indices]
+            polygons[snap] = shapely.set_precision(polygons[snap], self.grid_size)
+        return polygons
+
+    def _cached_polygons(self, cache) -> np.ndarray:
+        prefix = f"footprint:{self.grid_size}:" if self.grid_size else "footprint:"
+        keys = [
+            prefix + hashlib.blake2b(self.ring(i).tobytes(), digest_size=16).hexdigest()
+            for i in range(len(self))
+        ]
+        polygons = np.empty(len(keys), dtype=object)
+        polygons[:] = cache.get_many(keys)
+        missing = np.flatnonzero(np.equal(polygons, None))
+        if len(missing):
+            polygons[missing] = self._build_polygons(missing)
+            shapely.prepare(polygons[missing])
+            sizes = np.diff(self.offsets)[missing]
+            for i, size in zip(missing.tolist(), sizes.tolist()):
+                cache.set(keys[i], polygons[i], size=FOOTPRINT_OVERHEAD_BYTES + 16 * size)
+        return polygons
+
+    def subset(self, indices: np.ndarray) -> "FootprintStore":
+        """Store holding only `indices`, in that order. Polygons are shared, not rebuilt."""
+        sizes = np.diff(self.offsets)[indices]
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        points = np.repeat(self.offsets[:-1][indices] - offsets[:-1], sizes) + np.arange(offsets[-1])
+        return FootprintStore(
+            self.ids[indices],
+            self.elevations[indices],
+            self.heights[indices],
+            self.coords[points],
+            offsets,
+            polygons=self.polygons[indices],
+            grid_size=self.grid_size,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def polygon(self, index: int) -> Polygon:
+        return self.polygons[index]
+
+    def ring(self, index: int) -> np.ndarray:
+        """View (not a copy) of the outer ring of building `index`."""
+        return self.coords[self.offsets[index]:self.offsets[index + 1]]
+
+
+class FootprintStoreBuilder:
+    """
+    Appends footprints one at a time, e.g. from a streaming parser, straight
+    into compact typed buffers; `build` wraps them as a FootprintStore without
+    copying the coordinates. Inputs decoded into whole columns (see
+    binary_input.py) are taken with `add_columns` instead.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.elevations = array("d")
+        self.heights = array("d")
+        self.coords = array("d")
+        self.offsets = array("q", [0])
+        self.columns = None
+
+    def add(self, building_id: str, elevation: float, height: float, ring: List):
+        if self.columns is not None:
+            raise ValueError("Footprints cannot be added to a builder holding columns")
+        start = len(self.coords)
+        try:
+            self.coords.extend(chain.from_iterable(ring))
+            if len(self.coords) - start != 2 * len(ring):
+                raise TypeError("ring points must be [x, y]")
+        except TypeError:
+            del self.coords[start:]
+            raise ValueError(f"Invalid footprint for building {building_id}: ring must be a list of [x, y]")
+        self.ids.append(building_id)
+        self.elevations.append(elevation)
+        self.heights.append(height)
+        self.offsets.append(len(self.coords) // 2)
+
+    def add_columns(self, columns):
+        """Take a whole input as FootprintColumns, kept as they are; the builder must be empty."""
+        if len(self):
+            raise ValueError("Columns can only be added to an empty builder")
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns.ids) if self.columns is not None else len(self.ids)
+
+    def build(self, geometry_cache=None, grid_size: Optional[float] = None) -> FootprintStore:
+        if self.columns is not None:
+            return FootprintStore(*self.columns, geometry_cache=geometry_cache, grid_size=grid_size)
+        return FootprintStore(
+            self.ids,
+            np.frombuffer(self.elevations, dtype=np.float64),
+            np.frombuffer(self.heights, dtype=np.float64),
+            np.frombuffer(self.coords, dtype=np.float64),
+            np.frombuffer(self.offsets, dtype=np.int64),
+            geometry_cache=geometry_cache,
+            grid_size=grid_size,
+        )
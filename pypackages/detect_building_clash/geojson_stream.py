@@ -0,0 +1,176 @@
+import json
+from typing import Any, Dict, List, Optional, TextIO, Tuple, Union
+
+# Characters read per refill when parsing from a file-like object.
+READ_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class _JsonReader:
+    """
+    Cursor over JSON text that is either a complete string or a text stream.
+
+    Values are decoded one at a time with the C scanner behind `raw_decode`;
+    when reading from a stream the buffer is refilled whenever a value runs
+    past its end, so only the value being decoded is held in memory.
+    """
+
+    def __init__(self, source: Union[str, TextIO]):
+        if isinstance(source, str):
+            self.buffer, self.stream = source, None
+        else:
+            self.buffer, self.stream = "", source
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        if self.stream is None:
+            return False
+        chunk = self.stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            self.stream = None
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or "" at the end of input."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} of the input JSON")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number ending exactly at the buffer edge may continue in the next chunk.
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Iterate the keys of an object; the caller must consume each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError("Object keys must be strings")
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def items(self):
+        """Iterate the elements of an array, decoding each one on demand."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def _number(value: Any, name: str, index: int) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Feature {index}: '{name}' must be a number")
+    return float(value)
+
+
+def read_feature(feature: Any, index: int) -> Tuple[str, float, float, List]:
+    """Validate the fields detection uses and return (id, elevation, height, outer ring)."""
+    if not isinstance(feature, dict):
+        raise ValueError(f"Feature {index} must be an object")
+    building_id = feature.get("id")
+    if not isinstance(building_id, str):
+        raise ValueError(f"Feature {index}: 'id' must be a string")
+    properties = feature.get("properties")
+    if not isinstance(properties, dict):
+        raise ValueError(f"Feature {index}: missing 'properties'")
+    geometry = feature.get("geometry")
+    coordinates = geometry.get("coordinates") if isinstance(geometry, dict) else None
+    if not isinstance(coordinates, list) or not coordinates or not isinstance(coordinates[0], list):
+        raise ValueError(f"Feature {index}: missing polygon 'coordinates'")
+    return (
+        building_id,
+        _number(properties.get("elevation"), "elevation", index),
+        _number(properties.get("height"), "height", index),
+        coordinates[0],
+    )
+
+
+def _stream_features(reader: _JsonReader, sink) -> int:
+    count = 0
+    for feature in reader.items():
+        sink.add(*read_feature(feature, count))
+        count += 1
+    return count
+
+
+def _walk_object(
+    reader: _JsonReader, sink, allow_input: bool, fields: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, Any], bool]:
+    fields = {} if fields is None else fields
+    found = False
+    for key in reader.members():
+        if key == "features" and reader.peek() == "[":
+            _stream_features(reader, sink)
+            found = True
+        elif key == "input" and allow_input and reader.peek() == "{":
+            fields["input"], nested_found = _walk_object(reader, sink, allow_input=False)
+            found = found or nested_found
+        else:
+            fields[key] = reader.value()
+    return fields, found
+
+
+def ingest_message(source: Union[str, TextIO], sink, fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Stream a task message into `sink`, calling `sink.add(id, elevation, height, ring)`
+    once per feature, and return the message's other fields (task id, options).
+
+    Accepts `{"task_id": ..., "input": {"features": [...]}}` as well as a bare
+    FeatureCollection. Only one feature is decoded at a time; the feature list
+    itself is never materialized. A claim-check message, whose input is in a
+    payload object (`{"task_id": ..., "payload": {...}}`), has no features;
+    its fields are returned for the caller to ingest the payload.
+
+    Top-level fields are stored in `fields`, if given, as soon as they are
+    read, so a caller still knows the task id when a later feature is invalid.
+    """
+    reader = _JsonReader(source)
+    if reader.peek() != "{":
+        raise ValueError("Input must be a JSON object")
+    fields, found = _walk_object(reader, sink, allow_input=True, fields=fields)
+    if reader.peek() != "":
+        raise ValueError("Unexpected data after the input JSON")
+    if not found and not isinstance(fields.get("payload"), dict):
+        raise ValueError("Missing 'features' array")
+    return fields
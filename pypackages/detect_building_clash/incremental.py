@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from shapely import STRtree
+
+from pypackages.common.result_storage import CHUNK_BYTES
+from pypackages.detect_building_clash.batch_engine import compute_clashes_batch_with_pairs
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.models import ClashResult
+from pypackages.detect_building_clash.spatial_index import candidate_pairs_3d, vertical_overlap_mask
+
+logger = logging.getLogger(__name__)
+
+# (id of the building earlier in the input, id of the later one, clash)
+StoredClash = Tuple[str, str, ClashResult]
+
+
+@dataclass
+class ProjectState:
+    """What a project looked like after its last detection run."""
+    feature_hashes: Dict[str, str]
+    clashes: List[StoredClash] = field(default_factory=list)
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(json.dumps({
+            "feature_hashes": self.feature_hashes,
+            "clashes": [[first, second, asdict(clash)] for first, second, clash in self.clashes],
+        }).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ProjectState":
+        raw = json.loads(zlib.decompress(data))
+        clashes = []
+        for first, second, clash in raw["clashes"]:
+            clash["geometry"] = [tuple(point) for point in clash["geometry"]]
+            clashes.append((first, second, ClashResult(**clash)))
+        return cls(feature_hashes=raw["feature_hashes"], clashes=clashes)
+
+
+@dataclass
+class IncrementalStats:
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    reused_clashes: int = 0
+    recomputed_pairs: int = 0
+    full_run: bool = False
+
+
+def project_id_of(message: Dict) -> Optional[str]:
+    """
+    Project of a task message, whose state is kept between runs: set on the
+    message itself, or on its input as the API queues a submission.
+    """
+    task_input = message.get("input")
+    project_id = task_input.get("project_id") if isinstance(task_input, dict) else None
+    return project_id if project_id is not None else message.get("project_id")
+
+
+class InMemoryProjectStateStore:
+    """Keeps project states for the lifetime of the process; for tests and local runs."""
+
+    def __init__(self):
+        self.states: Dict[str, bytes] = {}
+
+    def load(self, project_id: str) -> Optional[ProjectState]:
+        data = self.states.get(project_id)
+        return ProjectState.from_bytes(data) if data is not None else None
+
+    def save(self, project_id: str, state: ProjectState):
+        self.states[project_id] = state.to_bytes()
+
+
+def _binary(value) -> bytes:
+    # boto3 returns Binary attributes wrapped; local stand-ins return bytes.
+    return getattr(value, "value", value)
+
+
+def state_chunk_key(project_id: str, version: str, index: int) -> str:
+    return f"{project_id}#state#{version}#{index}"
+
+
+class DynamoDBProjectStateStore:
+    """
+    Project states as compressed items keyed by `project_id`. States larger
+    than `chunk_bytes`, which dense projects of a few thousand buildings
+    reach, are split into chunk items as ResultStore splits results. Chunk
+    keys carry a version, the hash of the state, and the `project_id` item is
+    written after its chunks and before the previous version's are deleted,
+    so a reader never mixes chunks of two states.
+    """
+
+    def __init__(self, table, chunk_bytes: int = CHUNK_BYTES):
+        self.table = table
+        self.chunk_bytes = chunk_bytes
+
+    def load(self, project_id: str) -> Optional[ProjectState]:
+        item = self.table.get_item(Key={"project_id": project_id}, ConsistentRead=True).get("Item")
+        if not item:
+            return None
+        chunk_count = int(item.get("chunks", 0))
+        if chunk_count == 0:
+            return ProjectState.from_bytes(_binary(item["state"]))
+        parts = []
+        for index in range(chunk_count):
+            key = state_chunk_key(project_id, item["version"], index)
+            parts.append(_binary(self.table.get_item(Key={"project_id": key}, ConsistentRead=True)["Item"]["state"]))
+        return ProjectState.from_bytes(b"".join(parts))
+
+    def save(self, project_id: str, state: ProjectState):
+        previous = self.table.get_item(Key={"project_id": project_id}, ConsistentRead=True).get("Item") or {}
+        data = state.to_bytes()
+        version = None
+        if len(data) <= self.chunk_bytes:
+            self.table.put_item(Item={"project_id": project_id, "chunks": 0, "state": data})
+        else:
+            version = hashlib.sha256(data).hexdigest()[:16]
+            chunks = [data[start:start + self.chunk_bytes] for start in range(0, len(data), self.chunk_bytes)]
+            with self.table.batch_writer() as batch:
+                for index, chunk in enumerate(chunks):
+                    batch.put_item(Item={"project_id": state_chunk_key(project_id, version, index), "state": chunk})
+            self.table.put_item(Item={"project_id": project_id, "chunks": len(chunks), "version": version})
+        previous_chunks = int(previous.get("chunks", 0))
+        if previous_chunks and previous["version"] != version:
+            with self.table.batch_writer() as batch:
+                for index in range(previous_chunks):
+                    batch.delete_item(Key={"project_id": state_chunk_key(project_id, previous["version"], index)})
+
+
+def feature_hashes(store: FootprintStore) -> List[str]:
+    """Content hash per building over its elevation, height and outer ring."""
+    hashes = []
+    for i in range(len(store)):
+        digest = hashlib.sha256(store.ring(i).tobytes())
+        digest.update(np.array([store.elevations[i], store.heights[i]]).tobytes())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def _dirty_pairs(store: FootprintStore, dirty: np.ndarray) -> np.ndarray:
+    """Candidate i<j pairs, sorted, that involve at least one dirty building."""
+    if len(dirty) == 0 or len(store) < 2:
+        return np.empty((0, 2), dtype=np.intp)
+    tree = STRtree(store.polygons)
+    query, hits = tree.query(store.polygons[dirty])
+    left, right = dirty[query], hits
+    keep = left != right
+    left, right = left[keep], right[keep]
+    pairs = np.unique(np.stack([np.minimum(left, right), np.maximum(left, right)], axis=1), axis=0)
+    return pairs[vertical_overlap_mask(pairs[:, 0], pairs[:, 1], store.elevations, store.tops)]
+
+
+def _clashes_for(store: FootprintStore, pairs: np.ndarray) -> List[StoredClash]:
+    clashing, clashes = compute_clashes_batch_with_pairs(store, pairs)
+    return [(store.ids[i], store.ids[j], clash) for (i, j), clash in zip(clashing.tolist(), clashes)]
+
+
+def detect_incremental(
+    store: FootprintStore, previous: Optional[ProjectState]
+) -> Tuple[List[ClashResult], ProjectState, IncrementalStats]:
+    """
+    Re-detect a project against its previous state.
+
+    Clashes between two unchanged buildings are reused; only pairs that
+    involve an added or changed building (or whose input order flipped, which
+    can change the intersection's vertex order) are recomputed. The merged
+    result is ordered like a full run over `store`, so it equals one.
+    """
+    hashes = feature_hashes(store)
+    ids = store.ids.tolist()
+    index = {building_id: i for i, building_id in enumerate(ids)}
+    stats = IncrementalStats()
+
+    if previous is None or len(index) != len(ids):
+        if previous is not None:
+            logger.warning("Duplicate building ids; running full detection")
+        stats.full_run = True
+        pairs, _ = candidate_pairs_3d(store.polygons, store.elevations, store.tops)
+        stats.recomputed_pairs = len(pairs)
+        clashes = _clashes_for(store, pairs)
+    else:
+        old = previous.feature_hashes
+        dirty_ids = {b for b, h in zip(ids, hashes) if old.get(b) != h}
+        stats.added = sum(1 for b in dirty_ids if b not in old)
+        stats.changed = len(dirty_ids) - stats.added
+        stats.removed = sum(1 for b in old if b not in index)
+
+        reused, flipped = [], []
+        for first, second, clash in previous.clashes:
+            if first in dirty_ids or second in dirty_ids or first not in index or second not in index:
+                continue
+            if index[first] < index[second]:
+                reused.append((first, second, clash))
+            else:
+                flipped.append((index[second], index[first]))
+        stats.reused_clashes = len(reused)
+
+        dirty = np.array(sorted(index[b] for b in dirty_ids), dtype=np.intp)
+        pairs = _dirty_pairs(store, dirty)
+        if flipped:
+            pairs = np.unique(np.concatenate([pairs, np.array(flipped, dtype=np.intp)]), axis=0)
+        stats.recomputed_pairs = len(pairs)
+        clashes = reused + _clashes_for(store, pairs)
+        clashes.sort(key=lambda c: (index[c[0]], index[c[1]]))
+
+    state = ProjectState(feature_hashes=dict(zip(ids, hashes)), clashes=clashes)
+    return [clash for _, _, clash in clashes], state, stats
@@ -0,0 +1,10 @@
+from typing import Any, Dict
+
+from pydantic import BaseModel
+
+
+class BuildingFeature(BaseModel):
+    """Pydantic model for input validation"""
+    id: str
+    properties: Dict[str, float]
+    geometry: Dict[str, Any]
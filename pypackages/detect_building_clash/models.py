@@ -0,0 +1,30 @@
+from dataclasses import dataclass
+from typing import List, Tuple
+
+
+@dataclass
+class ClashResult:
+    elevation: float
+    height: float
+    building_ids: List[str]
+    geometry: List[Tuple[float, float]]
+
+
+def start_at_lowest_point(ring: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """
+    Rotate a closed ring to start (and end) at its lowest, then leftmost,
+    point. Every engine emits clash rings in this form, so results do not
+    depend on where GEOS happened to start the intersection's ring.
+    """
+    min_index = min(range(len(ring)), key=lambda i: (ring[i][1], ring[i][0]))
+    return ring[min_index:] + ring[1:min_index + 1]
+
+
+def __getattr__(name: str):
+    # pydantic takes ~100 ms to import and the streaming detection path never
+    # uses it, so BuildingFeature is loaded on first access.
+    if name == "BuildingFeature":
+        from pypackages.detect_building_clash.input_model import BuildingFeature
+
+        return BuildingFeature
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,183 @@
+import logging
+import math
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import shapely
+
+from pypackages.detect_building_clash.batch_engine import compute_clashes_batch_with_pairs
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.models import ClashResult
+from pypackages.detect_building_clash.query import ClashQuery
+from pypackages.detect_building_clash.spatial_index import candidate_pairs_3d
+
+logger = logging.getLogger(__name__)
+
+# More tiles than workers so one dense tile does not leave the other workers idle.
+TILES_PER_WORKER = 4
+
+IndexedClash = Tuple[int, int, ClashResult]
+
+
+class SiteTiling:
+    """
+    Regular grid over the site's bounding box.
+
+    A building belongs to every tile its bounding box touches (the halo), and a
+    pair is owned by the single tile holding the lower-left corner of the
+    overlap of the two bounding boxes. Both buildings of an overlapping pair
+    always belong to that tile, so every pair is found exactly once.
+    """
+
+    def __init__(self, bounds: np.ndarray, tile_count: int):
+        self.bounds = bounds
+        side = max(1, math.ceil(math.sqrt(tile_count)))
+        self.columns = self.rows = side
+        self.min_x, self.min_y = bounds[:, 0].min(), bounds[:, 1].min()
+        self.width = max((bounds[:, 2].max() - self.min_x) / side, np.finfo(float).tiny)
+        self.height = max((bounds[:, 3].max() - self.min_y) / side, np.finfo(float).tiny)
+
+    @classmethod
+    def from_grid(cls, grid: Dict) -> "SiteTiling":
+        """Tiling on a grid returned by `grid()`, e.g. in another process; it holds no buildings."""
+        tiling = cls.__new__(cls)
+        tiling.bounds = None
+        tiling.columns = tiling.rows = grid["side"]
+        tiling.min_x, tiling.min_y = grid["origin"]
+        tiling.width, tiling.height = grid["cell"]
+        return tiling
+
+    def grid(self) -> Dict:
+        """JSON-serializable grid of the tiling."""
+        return {
+            "side": self.columns,
+            "origin": [float(self.min_x), float(self.min_y)],
+            "cell": [float(self.width), float(self.height)],
+        }
+
+    def _column(self, x: np.ndarray) -> np.ndarray:
+        return np.clip(((x - self.min_x) // self.width).astype(np.intp), 0, self.columns - 1)
+
+    def _row(self, y: np.ndarray) -> np.ndarray:
+        return np.clip(((y - self.min_y) // self.height).astype(np.intp), 0, self.rows - 1)
+
+    def tile_of(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return self._row(y) * self.columns + self._column(x)
+
+    def members(self) -> List[np.ndarray]:
+        """Sorted building indices per tile, halo included."""
+        first_col, last_col = self._column(self.bounds[:, 0]), self._column(self.bounds[:, 2])
+        first_row, last_row = self._row(self.bounds[:, 1]), self._row(self.bounds[:, 3])
+        tiles: List[List[int]] = [[] for _ in range(self.rows * self.columns)]
+        for index in range(len(self.bounds)):
+            for row in range(first_row[index], last_row[index] + 1):
+                for column in range(first_col[index], last_col[index] + 1):
+                    tiles[row * self.columns + column].append(index)
+        return [np.asarray(t, dtype=np.intp) for t in tiles]
+
+    def owned(self, tile: int, left: np.ndarray, right: np.ndarray, bounds: Optional[np.ndarray] = None) -> np.ndarray:
+        """True where `tile` owns the pair of building indices, into `bounds` (default: the site's)."""
+        bounds = self.bounds if bounds is None else bounds
+        x = np.maximum(bounds[left, 0], bounds[right, 0])
+        y = np.maximum(bounds[left, 1], bounds[right, 1])
+        return self.tile_of(x, y) == tile
+
+
+def detect_tile(
+    tiling: SiteTiling, tile: int, members: np.ndarray, store: FootprintStore, query: Optional[ClashQuery] = None
+) -> List[IndexedClash]:
+    """Clashes owned by `tile`, keyed by the global indices of the two buildings."""
+    local = store.subset(members)
+    pairs, _ = candidate_pairs_3d(local.polygons, local.elevations, local.tops)
+    pairs = pairs[tiling.owned(tile, members[pairs[:, 0]], members[pairs[:, 1]])]
+    clashing, clashes = compute_clashes_batch_with_pairs(local, pairs, query=query)
+    return [
+        (int(members[i]), int(members[j]), clash)
+        for (i, j), clash in zip(clashing.tolist(), clashes)
+    ]
+
+
+def _worker(connection, tiling: SiteTiling, jobs: List[Tuple[int, np.ndarray]], store: FootprintStore,
+            query: Optional[ClashQuery]):
+    try:
+        found = []
+        for tile, members in jobs:
+            found.extend(detect_tile(tiling, tile, members, store, query))
+        connection.send(("ok", found))
+    except Exception as e:  # Surface the failure in the parent instead of hanging it.
+        connection.send(("error", repr(e)))
+    finally:
+        connection.close()
+
+
+def _balance(tiles: List[np.ndarray], workers: int) -> List[List[Tuple[int, np.ndarray]]]:
+    """Greedy longest-first assignment, using members² as the cost of a tile."""
+    queues: List[List[Tuple[int, np.ndarray]]] = [[] for _ in range(workers)]
+    load = [0] * workers
+    for tile in sorted(range(len(tiles)), key=lambda t: -len(tiles[t])):
+        if len(tiles[tile]) < 2:
+            continue
+        target = load.index(min(load))
+        queues[target].append((tile, tiles[tile]))
+        load[target] += len(tiles[tile]) ** 2
+    return [q for q in queues if q]
+
+
+def detect_parallel(store: FootprintStore, workers: int, query: Optional[ClashQuery] = None) -> List[ClashResult]:
+    """
+    Split the site into tiles, detect each tile in a separate process and merge
+    the clashes in brute-force (i, j) order, so the result equals the serial path.
+
+    Uses plain processes and pipes rather than a pool, as AWS Lambda has no
+    /dev/shm for the semaphores a pool needs. If processes cannot be started
+    at all the tiles run in-process.
+    """
+    if len(store) < 2:
+        return []
+    tiling = SiteTiling(shapely.bounds(store.polygons), workers * TILES_PER_WORKER)
+    queues = _balance(tiling.members(), workers)
+
+    found: List[IndexedClash] = []
+    processes, receivers, sender = [], [], None
+    try:
+        for jobs in queues:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            receivers.append(receiver)
+            process = multiprocessing.Process(target=_worker, args=(sender, tiling, jobs, store, query))
+            process.start()
+            processes.append(process)
+            sender.close()
+            sender = None
+    except OSError as e:
+        logger.warning(f"Could not start worker processes, detecting tiles in-process: {e}")
+        if sender is not None:
+            sender.close()
+        for receiver in receivers:
+            receiver.close()
+        # Joined so the terminated processes do not linger as zombies.
+        for process in processes:
+            process.terminate()
+            process.join()
+        for jobs in queues:
+            for tile, members in jobs:
+                found.extend(detect_tile(tiling, tile, members, store, query))
+    else:
+        errors = []
+        for process, receiver in zip(processes, receivers):
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                status, payload = "error", "worker exited without a result"
+            finally:
+                receiver.close()
+            process.join()
+            if status == "ok":
+                found.extend(payload)
+            else:
+                errors.append(payload)
+        if errors:
+            raise RuntimeError(f"Parallel clash detection failed: {'; '.join(errors)}")
+
+    found.sort(key=lambda item: (item[0], item[1]))
+    return [clash for _, _, clash in found]
@@ -0,0 +1,176 @@
+"""
+Persistent per-project spatial index, to check a few candidate buildings
+against a project's stored model without re-running the whole model.
+
+The worker stores the footprints of every task submitted with a
+`project_id` (see ProjectIndexStore). A check finds the stored buildings a
+candidate's bounding box touches with an STRtree, in O(log n + k), and
+intersects only those pairs, with the same engine, and so the same
+semantics, as a detection run.
+"""
+import logging
+import uuid
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from shapely import STRtree
+
+from pypackages.common.cache import LRUCache
+from pypackages.common.payload_store import open_payload, put_payload
+from pypackages.common.result_storage import _is_condition_failure
+from pypackages.detect_building_clash.batch_engine import compute_clashes_batch_with_pairs
+from pypackages.detect_building_clash.binary_input import pack_footprints, read_packed
+from pypackages.detect_building_clash.footprint_store import FOOTPRINT_OVERHEAD_BYTES, FootprintStore
+from pypackages.detect_building_clash.models import ClashResult
+from pypackages.detect_building_clash.query import ClashQuery
+
+logger = logging.getLogger(__name__)
+
+PROJECT_PREFIX = "projects/"
+# Memory for the indexes kept warm between checks.
+INDEX_CACHE_BYTES = 256 * 1024 * 1024
+# Concurrent saves of a project retry writing its index item this many times.
+SAVE_ATTEMPTS = 5
+
+
+def index_key(project_id: str) -> str:
+    """Key of a project's index item in the project table."""
+    return f"{project_id}#index"
+
+
+class CheckResult(NamedTuple):
+    """
+    Clashes of a check, each between a candidate and a stored building, in
+    that order. `pairs` index `ids`, for ClashQuery summaries.
+    """
+    ids: np.ndarray
+    pairs: np.ndarray
+    clashes: List[ClashResult]
+
+
+class ProjectIndex:
+    """A project's footprints with an STRtree over them."""
+
+    def __init__(self, store: FootprintStore):
+        self.store = store
+        self.tree = STRtree(store.polygons)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def check(self, candidates: FootprintStore, query: Optional[ClashQuery] = None) -> CheckResult:
+        """
+        Clashes of `candidates` with the stored buildings, ordered by
+        candidate, then stored building. A candidate with the id of a stored
+        building stands in for it, so the two are not checked against each
+        other; candidates are not checked against one another.
+        """
+        candidate, hit = self.tree.query(candidates.polygons)
+        keep = candidates.ids[candidate] != self.store.ids[hit]
+        candidate, hit = candidate[keep], hit[keep]
+        # As vertical_overlap_mask, across the two stores.
+        keep = np.minimum(candidates.tops[candidate], self.store.tops[hit]) > np.maximum(
+            candidates.elevations[candidate], self.store.elevations[hit])
+        candidate, hit = candidate[keep], hit[keep]
+
+        # One store of the candidates followed by the buildings they may hit,
+        # so pairs are (candidate, building) with i < j as in a detection run.
+        buildings, position = np.unique(hit, return_inverse=True)
+        combined = _concat(candidates, self.store.subset(buildings))
+        order = np.lexsort((hit, candidate))
+        pairs = np.stack([candidate, len(candidates) + position.ravel()], axis=1)[order].astype(np.intp)
+        clashing, clashes = compute_clashes_batch_with_pairs(combined, pairs, query=query)
+        return CheckResult(combined.ids, clashing, clashes)
+
+
+def _concat(first: FootprintStore, second: FootprintStore) -> FootprintStore:
+    """`first` then `second` as one store, sharing their polygons."""
+    return FootprintStore(
+        np.concatenate([first.ids, second.ids]),
+        np.concatenate([first.elevations, second.elevations]),
+        np.concatenate([first.heights, second.heights]),
+        np.concatenate([first.coords, second.coords]),
+        np.concatenate([first.offsets, second.offsets[1:] + first.offsets[-1]]),
+        polygons=np.concatenate([first.polygons, second.polygons]),
+        grid_size=first.grid_size,
+    )
+
+
+class ProjectIndexStore:
+    """
+    Project footprints in the packed format (see binary_input.py), as objects
+    in a payload store, under a `<project_id>#index` item of the project
+    table holding their reference. Loaded indexes are kept in `cache` and
+    reused while the item names an object with the same content, so a warm
+    check costs one item read.
+    """
+
+    def __init__(self, table, payload_store, cache: Optional[LRUCache] = None, grid_size: Optional[float] = None):
+        self.table = table
+        self.payload_store = payload_store
+        self.cache = cache if cache is not None else LRUCache(INDEX_CACHE_BYTES, ttl_seconds=None)
+        self.grid_size = grid_size
+
+    def _ref(self, project_id: str) -> Optional[Dict]:
+        item = self.table.get_item(Key={"project_id": index_key(project_id)}, ConsistentRead=True).get("Item")
+        return item["index"] if item else None
+
+    def save(self, project_id: str, store: FootprintStore, task_id: Optional[str] = None):
+        """
+        Store the project's footprints, replacing its previous ones, as those
+        of task `task_id`. Every save writes a new object, and the item is
+        only replaced if it still names the object read before; the save that
+        replaced a reference then deletes its object. A concurrent save can
+        therefore never delete the object the item names.
+        """
+        data = pack_footprints(store.ids, store.elevations, store.heights, store.coords, store.offsets)
+        ref = put_payload(self.payload_store, f"{PROJECT_PREFIX}{project_id}/{uuid.uuid4().hex}.packed.gz", data)
+        item = {"project_id": index_key(project_id), "index": ref, "buildings": len(store)}
+        if task_id is not None:
+            # Read by the API, which only requeues a project's task when it is not the latest.
+            item["task_id"] = task_id
+        for _ in range(SAVE_ATTEMPTS):
+            previous = self._ref(project_id)
+            if previous is None:
+                condition = {"ConditionExpression": "attribute_not_exists(project_id)"}
+            else:
+                condition = {
+                    "ConditionExpression": "#index.#key = :key",
+                    "ExpressionAttributeNames": {"#index": "index", "#key": "key"},
+                    "ExpressionAttributeValues": {":key": previous["key"]},
+                }
+            try:
+                self.table.put_item(Item=item, **condition)
+            except Exception as e:
+                if not _is_condition_failure(e):
+                    raise
+                continue
+            if previous is not None:
+                self.payload_store.delete(previous["key"])
+            return
+        self.payload_store.delete(ref["key"])
+        raise RuntimeError(f"Index of project {project_id} kept changing; not saved")
+
+    def load(self, project_id: str) -> Optional[ProjectIndex]:
+        """The project's index, None if nothing was stored for it."""
+        ref = self._ref(project_id)
+        if ref is None:
+            return None
+        cached = self.cache.get(project_id)
+        if cached is not None and cached[0] == ref["sha256"]:
+            return cached[1]
+        try:
+            columns = self._read(ref)
+        except KeyError:
+            # Replaced between reading the reference and the object.
+            ref = self._ref(project_id)
+            columns = self._read(ref)
+        index = ProjectIndex(FootprintStore(*columns, grid_size=self.grid_size))
+        size = index.store.coords.nbytes + FOOTPRINT_OVERHEAD_BYTES * len(index)
+        self.cache.set(project_id, (ref["sha256"], index), size=size)
+        logger.info(f"Loaded the index of project {project_id}: {len(index)} buildings")
+        return index
+
+    def _read(self, ref: Dict):
+        with open_payload(self.payload_store, ref, binary=True) as stream:
+            return read_packed(stream.read())
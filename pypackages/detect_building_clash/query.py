@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from typing import Any, Dict
+
+MODE_FULL = "full"
+MODE_ANY = "any"
+MODE_COUNT = "count"
+MODES = (MODE_FULL, MODE_ANY, MODE_COUNT)
+
+
+@dataclass(frozen=True)
+class ClashQuery:
+    """
+    What a task asks for, from the optional `query` object of its input:
+
+    - `mode`: "full" (default) returns every clash as a GeoJSON feature,
+      "any" stops at the first clash found, "count" returns clash counts per
+      building without building any clash geometry
+    - `min_overlap_area`, `min_overlap_height`: only overlaps at least this
+      large count as clashes. The area is that of the whole intersection of
+      the two footprints.
+    """
+    mode: str = MODE_FULL
+    min_overlap_area: float = 0.0
+    min_overlap_height: float = 0.0
+
+    @property
+    def filtered(self) -> bool:
+        return self.min_overlap_area > 0 or self.min_overlap_height > 0
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> "ClashQuery":
+        """
+        Query of a task message, read from its input or else the message
+        itself (a bare FeatureCollection, or a binary input's task).
+        """
+        task_input = message.get("input")
+        options = task_input.get("query") if isinstance(task_input, dict) else None
+        if options is None:
+            options = message.get("query")
+        if options is None:
+            return cls()
+        if not isinstance(options, dict):
+            raise ValueError("'query' must be an object")
+        mode = options.get("mode", MODE_FULL)
+        if mode not in MODES:
+            raise ValueError(f"Unknown query mode: {mode}")
+        return cls(
+            mode=mode,
+            min_overlap_area=_threshold(options, "min_overlap_area"),
+            min_overlap_height=_threshold(options, "min_overlap_height"),
+        )
+
+
+def _threshold(options: Dict[str, Any], name: str) -> float:
+    value = options.get(name, 0)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value >= 0:
+        raise ValueError(f"Query '{name}' must be a non-negative number")
+    return float(value)
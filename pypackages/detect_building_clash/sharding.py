@@ -0,0 +1,125 @@
+"""
+Map-reduce execution of sites too large for one worker invocation.
+
+The worker that receives such a task only plans it: the site is cut into
+spatial shards, the tiles of a SiteTiling, each holding every building whose
+bounding box touches the tile, and every shard is queued as a sub-task under
+the task's id. A shard detects only the pairs its tile owns (see SiteTiling),
+so every pair is detected by exactly one shard, and stores what it found as a
+partial result. The worker that stores the last partial merges all of them,
+in the order of a single run, into the task's result.
+"""
+import dataclasses
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import shapely
+
+from pypackages.common import aws_clients
+from pypackages.common.payload_store import INPUT_PREFIX, offload_message
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.parallel import SiteTiling
+from pypackages.detect_building_clash.query import ClashQuery
+
+# Sites with fewer buildings are detected in one invocation.
+SHARD_MIN_FEATURES = 20000
+# Buildings per shard the planner aims for, halo excluded.
+SHARD_FEATURES = 5000
+# Metrics status of a task that was planned and handed to its shards.
+STATUS_SHARDED = "SHARDED"
+
+Shard = Tuple[int, np.ndarray]
+
+
+def shard_key(task_id: str, index: int) -> str:
+    return f"{task_id}#shard#{index}"
+
+
+class ShardQueue:
+    """
+    SQS queue shard sub-tasks are sent to; the client is created on first use
+    unless given. With a `payload_store`, shards too large for a message
+    travel as claim checks (see payload_store.py).
+    """
+
+    def __init__(self, queue_url: str, client=None, payload_store=None):
+        self.queue_url = queue_url
+        self.client = client
+        self.payload_store = payload_store
+
+    def send(self, messages: Iterable[Dict]) -> int:
+        client = self.client if self.client is not None else aws_clients.client("sqs")
+        sent = 0
+        for message in messages:
+            key = f"{INPUT_PREFIX}{message['task_id']}/shard-{message['shard']['index']}.json.gz"
+            client.send_message(QueueUrl=self.queue_url, MessageBody=offload_message(message, key, self.payload_store))
+            sent += 1
+        return sent
+
+
+def plan_shards(store: FootprintStore, shard_features: int = SHARD_FEATURES) -> Tuple[SiteTiling, List[Shard]]:
+    """Tiling of the site and the (tile, members) shards worth detecting, i.e. holding a possible pair."""
+    tiling = SiteTiling(shapely.bounds(store.polygons), math.ceil(len(store) / shard_features))
+    shards = [(tile, members) for tile, members in enumerate(tiling.members()) if len(members) >= 2]
+    return tiling, shards
+
+
+def shard_messages(
+    task_id: str, store: FootprintStore, query: ClashQuery, tiling: SiteTiling, shards: List[Shard]
+) -> Iterator[Dict]:
+    """Task message of every shard, carrying its buildings and their indices in the whole site."""
+    grid = tiling.grid()
+    for index, (tile, members) in enumerate(shards):
+        features = [
+            {
+                "type": "Feature",
+                "id": store.ids[i],
+                "properties": {"elevation": float(store.elevations[i]), "height": float(store.heights[i])},
+                "geometry": {"type": "Polygon", "coordinates": [store.ring(i).tolist()]},
+            }
+            for i in members.tolist()
+        ]
+        yield {
+            "task_id": task_id,
+            "shard": {"index": index, "count": len(shards), "tile": tile, "grid": grid, "indices": members.tolist()},
+            "input": {"query": dataclasses.asdict(query), "features": features},
+        }
+
+
+def owned_pairs(store: FootprintStore, shard: Dict, pairs: np.ndarray) -> np.ndarray:
+    """The pairs of a shard's store that its tile owns."""
+    tiling = SiteTiling.from_grid(shard["grid"])
+    owned = tiling.owned(shard["tile"], pairs[:, 0], pairs[:, 1], bounds=shapely.bounds(store.polygons))
+    return pairs[owned]
+
+
+def shard_partial(store: FootprintStore, shard: Dict, clashing_pairs: np.ndarray,
+                  features: Optional[List[Dict]] = None) -> Dict:
+    """Partial result of a shard: its clashing pairs as site indices, their ids and, for full queries, features."""
+    indices = np.asarray(shard["indices"], dtype=np.intp)
+    return {
+        "pairs": indices[clashing_pairs].tolist(),
+        "ids": store.ids[clashing_pairs].tolist(),
+        "features": features,
+    }
+
+
+def merge_partials(partials: List[Dict]) -> Tuple[np.ndarray, Dict[int, str], Optional[List[Dict]]]:
+    """
+    Clashing pairs of all shards in (i, j) order, as a single run finds them,
+    with each pair kept once; the id of every building index involved; and
+    the features, if the partials carry them.
+    """
+    entries = {}
+    for partial in partials:
+        features = partial.get("features")
+        for n, (pair, ids) in enumerate(zip(partial["pairs"], partial["ids"])):
+            entries[tuple(pair)] = (ids, features[n] if features is not None else None)
+    order = sorted(entries)
+    ids = {}
+    for i, j in order:
+        ids[i], ids[j] = entries[(i, j)][0]
+    pairs = np.array(order, dtype=np.intp).reshape(-1, 2)
+    features = [entries[pair][1] for pair in order] if all(p.get("features") is not None for p in partials) else None
+    return pairs, ids, features
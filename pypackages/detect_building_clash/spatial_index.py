@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from typing import Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry.base import BaseGeometry
+
+CANDIDATE_SEARCH_3D = "3d"
+CANDIDATE_SEARCH_STRTREE = "strtree"
+CANDIDATE_SEARCH_BRUTE_FORCE = "brute_force"
+CANDIDATE_SEARCHES = (CANDIDATE_SEARCH_3D, CANDIDATE_SEARCH_STRTREE, CANDIDATE_SEARCH_BRUTE_FORCE)
+
+# Enumerate the elevation sweep directly while it yields at most this many
+# vertically overlapping pairs per building; denser (e.g. flat) sites go
+# through the STRtree first since the sweep would degrade towards O(n²).
+SWEEP_PAIRS_PER_BUILDING = 32
+
+
+@dataclass
+class CandidateStats:
+    """How many of the possible pairs each filter stage removed."""
+    strategy: str
+    total_pairs: int
+    vertical_pruned: int = 0
+    envelope_pruned: int = 0
+    candidate_pairs: int = 0
+
+
+def _sorted_pairs(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Normalise to i<j and sort like the brute-force loop."""
+    pairs = np.stack([np.minimum(left, right), np.maximum(left, right)], axis=1).astype(np.intp)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return pairs[order]
+
+
+def brute_force_candidate_pairs(count: int) -> np.ndarray:
+    """Every i<j pair, in row-major order. Kept for verifying the indexed search."""
+    i, j = np.triu_indices(count, k=1)
+    return np.stack([i, j], axis=1).astype(np.intp)
+
+
+def strtree_candidate_pairs(geometries: Sequence[BaseGeometry]) -> np.ndarray:
+    """
+    Return the i<j pairs whose bounding boxes overlap, sorted like the brute-force
+    loop so downstream results come out in the same order.
+
+    Pairs whose envelopes are disjoint cannot have an intersection with positive
+    area, so skipping them never changes the clash set.
+    """
+    if len(geometries) < 2:
+        return np.empty((0, 2), dtype=np.intp)
+
+    tree = STRtree(geometries)
+    left, right = tree.query(geometries)
+    keep = left < right
+    return _sorted_pairs(left[keep], right[keep])
+
+
+def vertical_overlap_mask(
+    left: np.ndarray, right: np.ndarray, bottoms: np.ndarray, tops: np.ndarray
+) -> np.ndarray:
+    """True where the [bottom, top] intervals of the two buildings overlap with positive height."""
+    return np.minimum(tops[left], tops[right]) > np.maximum(bottoms[left], bottoms[right])
+
+
+def envelope_overlap_mask(left: np.ndarray, right: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """True where the 2D bounding boxes touch or overlap, matching the STRtree predicate."""
+    return (
+        (bounds[left, 0] <= bounds[right, 2])
+        & (bounds[right, 0] <= bounds[left, 2])
+        & (bounds[left, 1] <= bounds[right, 3])
+        & (bounds[right, 1] <= bounds[left, 3])
+    )
+
+
+def _elevation_sweep(bottoms: np.ndarray, tops: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort the intervals by bottom and, for each building, find the run of later
+    buildings whose bottom lies below its top. Returns the sort order and the
+    [start, end) window of every building within it.
+    """
+    order = np.argsort(bottoms, kind="stable")
+    sorted_bottoms = bottoms[order]
+    starts = np.arange(1, len(order) + 1)
+    ends = np.maximum(np.searchsorted(sorted_bottoms, tops[order], side="left"), starts)
+    return order, starts, ends
+
+
+def candidate_pairs_3d(
+    geometries: Sequence[BaseGeometry], bottoms: np.ndarray, tops: np.ndarray
+) -> Tuple[np.ndarray, CandidateStats]:
+    """
+    Return the i<j pairs that overlap both vertically and in 2D envelope, sorted
+    like the brute-force loop, plus counters for what each stage pruned.
+
+    The elevation sweep runs first when it is selective enough; otherwise the
+    STRtree envelope query runs first and the vertical test is applied to its
+    output. Either way the surviving pairs are the same.
+    """
+    count = len(geometries)
+    stats = CandidateStats(strategy="sweep", total_pairs=count * (count - 1) // 2)
+    if count < 2:
+        return np.empty((0, 2), dtype=np.intp), stats
+
+    order, starts, ends = _elevation_sweep(bottoms, tops)
+    windows = ends - starts
+    swept = int(windows.sum())
+
+    if swept <= SWEEP_PAIRS_PER_BUILDING * count:
+        left = np.repeat(order, windows)
+        offsets = np.arange(swept) - np.repeat(np.cumsum(windows) - windows, windows)
+        right = order[np.repeat(starts, windows) + offsets]
+        vertical = vertical_overlap_mask(left, right, bottoms, tops)
+        left, right = left[vertical], right[vertical]
+        stats.vertical_pruned = stats.total_pairs - len(left)
+
+        envelope = envelope_overlap_mask(left, right, shapely.bounds(geometries))
+        left, right = left[envelope], right[envelope]
+        stats.envelope_pruned = len(envelope) - len(left)
+        pairs = _sorted_pairs(left, right)
+    else:
+        stats.strategy = "strtree"
+        pairs = strtree_candidate_pairs(geometries)
+        stats.envelope_pruned = stats.total_pairs - len(pairs)
+        vertical = vertical_overlap_mask(pairs[:, 0], pairs[:, 1], bottoms, tops)
+        pairs = pairs[vertical]
+        stats.vertical_pruned = len(vertical) - len(pairs)
+
+    stats.candidate_pairs = len(pairs)
+    return pairs, stats
@@ -0,0 +1,83 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pypackages.detect_building_clash import batch_cli, building_clash_detect_service, geojson_stream
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+
+class TestBatchCli(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.models = {}
+        for name, seed in (("a.json", 1), ("nested/b.geojson", 2)):
+            features = random_features(60, seed=seed)
+            features[0] = features[0].model_copy(update={"id": "bâtiment_ü"})
+            path = os.path.join(self.directory.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"type": "FeatureCollection", "features": [f.model_dump() for f in features]}, f,
+                          ensure_ascii=False)
+            self.models[path] = features
+        self.broken = os.path.join(self.directory.name, "broken.json")
+        with open(self.broken, "w") as f:
+            f.write('{"features": [')
+        with open(os.path.join(self.directory.name, "notes.txt"), "w") as f:
+            f.write("not a model")
+
+    def expected_lines(self):
+        service = BuildingClashDetectService()
+        lines = []
+        for path, features in self.models.items():
+            clashes = service._process_store(FootprintStore.from_features(features))
+            lines += [{"model": path, **feature} for feature in service.format_results(clashes)]
+        return lines
+
+    def test_directories_are_searched_and_clashes_written_as_ndjson(self):
+        models = batch_cli.find_models([self.directory.name])
+        a, b = self.models
+        self.assertEqual(models, [a, self.broken, b])
+        output, log = io.StringIO(), io.StringIO()
+        with patch.object(geojson_stream, "READ_CHUNK_SIZE", 7):
+            results = batch_cli.run(models, output, jobs=1, log=log)
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()], self.expected_lines())
+        self.assertEqual([r.error is not None for r in results], [False, True, False])
+        self.assertIn("broken.json: FAILED", log.getvalue())
+
+    def test_clashes_are_written_while_a_model_is_detected(self):
+        class Recording(io.StringIO):
+            batches = 0
+
+            def writelines(self, lines):
+                self.batches += 1
+                super().writelines(lines)
+
+        output = Recording()
+        with patch.object(building_clash_detect_service, "DEFAULT_BATCH_SIZE", 5):
+            batch_cli.run(list(self.models), output, jobs=1, log=io.StringIO())
+        self.assertGreater(output.batches, 2 * len(self.models))
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()], self.expected_lines())
+
+    def test_models_run_concurrently(self):
+        output = io.StringIO()
+        results = batch_cli.run(list(self.models), output, jobs=2, log=io.StringIO())
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        key = lambda line: (line["model"], line["properties"]["buildings"])
+        self.assertEqual(sorted(lines, key=key), sorted(self.expected_lines(), key=key))
+        self.assertEqual(sorted(r.path for r in results), sorted(self.models))
+
+    def test_exit_status_reports_failures(self):
+        output = os.path.join(self.directory.name, "out.ndjson")
+        with patch("sys.stderr", io.StringIO()):
+            self.assertEqual(batch_cli.main([*self.models, "-j", "1", "-o", output]), 0)
+            self.assertEqual(batch_cli.main([self.broken, "-o", output]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import math
+import random
+import unittest
+
+import numpy as np
+
+from pypackages.detect_building_clash.batch_engine import round_half_even_6
+from pypackages.detect_building_clash.building_clash_detect_service import (
+    BuildingClashDetectService,
+    BuildingFeature,
+)
+from pypackages.detect_building_clash.models import start_at_lowest_point
+
+
+def star_feature(building_id, rng):
+    """Irregular concave footprint with non-round coordinates."""
+    cx, cy = rng.uniform(0, 100), rng.uniform(0, 100)
+    points = []
+    for k in range(12):
+        angle = 2 * math.pi * k / 12
+        radius = rng.uniform(3, 15) if k % 2 else rng.uniform(10, 20)
+        points.append([cx + radius * math.cos(angle), cy + radius * math.sin(angle)])
+    points.append(points[0])
+    return BuildingFeature(
+        id=building_id,
+        properties={"elevation": rng.uniform(0, 10), "height": rng.uniform(1, 10)},
+        geometry={"type": "Polygon", "coordinates": [points]},
+    )
+
+
+def rectangle_feature(building_id, rng):
+    """Axis-aligned rectangle with any start corner and winding, on integer or fractional coordinates."""
+    if rng.random() < 0.5:
+        x, y, w, h = rng.randint(0, 30), rng.randint(0, 30), rng.randint(1, 8), rng.randint(1, 8)
+    else:
+        x, y, w, h = rng.uniform(0, 30), rng.uniform(0, 30), rng.uniform(1e-7, 8), rng.uniform(1e-7, 8)
+    points = [[x, y], [x + w, y], [x + w, y + h], [x, y + h]]
+    start = rng.randrange(4)
+    points = points[start:] + points[:start]
+    if rng.random() < 0.5:
+        points.reverse()
+    points.append(points[0])
+    return BuildingFeature(
+        id=building_id,
+        properties={"elevation": rng.uniform(0, 2), "height": rng.uniform(1, 5)},
+        geometry={"type": "Polygon", "coordinates": [points]},
+    )
+
+
+class TestBatchEngine(unittest.TestCase):
+    def assert_engines_agree(self, features, grid_size=None):
+        scalar = BuildingClashDetectService(engine="scalar", grid_size=grid_size)._process_features(features)
+        batch = BuildingClashDetectService(engine="batch", grid_size=grid_size)._process_features(features)
+        self.assertEqual(batch, scalar)
+        for b, s in zip(batch, scalar):
+            self.assertEqual(type(b.elevation), type(s.elevation))
+            self.assertEqual(type(b.height), type(s.height))
+        return batch
+
+    def test_matches_scalar_on_concave_footprints(self):
+        rng = random.Random(11)
+        features = [star_feature(f"building_{n}", rng) for n in range(120)]
+        self.assertGreater(len(self.assert_engines_agree(features)), 0)
+
+    def test_rectangle_fast_path_matches_geos(self):
+        rng = random.Random(5)
+        features = [rectangle_feature(f"building_{n}", rng) for n in range(300)]
+        features += [star_feature(f"star_{n}", rng) for n in range(20)]
+        clashes = self.assert_engines_agree(features)
+        self.assertGreater(len(clashes), 100)
+        for clash in clashes:
+            self.assertEqual(clash.geometry, start_at_lowest_point(clash.geometry))
+
+    def test_rectangle_overlap_thinner_than_rounding_uses_geos(self):
+        ring = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+        sliver = [[2, 9.9999998], [8, 9.9999998], [8, 12], [2, 12], [2, 9.9999998]]
+        features = [
+            BuildingFeature(id="a", properties={"elevation": 0, "height": 4},
+                            geometry={"type": "Polygon", "coordinates": [ring]}),
+            BuildingFeature(id="b", properties={"elevation": 0, "height": 4},
+                            geometry={"type": "Polygon", "coordinates": [list(reversed(sliver))]}),
+        ]
+        clashes = self.assert_engines_agree(features)
+        self.assertEqual(len(clashes), 1)
+        self.assertEqual({point[1] for point in clashes[0].geometry}, {10.0})
+
+    def test_grid_size_snaps_clash_coordinates(self):
+        rng = random.Random(3)
+        features = [star_feature(f"building_{n}", rng) for n in range(40)]
+        for engine in ("batch", "scalar"):
+            clashes = BuildingClashDetectService(engine=engine, grid_size=0.01)._process_features(features)
+            self.assertGreater(len(clashes), 0)
+            for clash in clashes:
+                for x, y in clash.geometry:
+                    self.assertAlmostEqual(x * 100, round(x * 100), places=6)
+                    self.assertAlmostEqual(y * 100, round(y * 100), places=6)
+
+    def test_engines_agree_with_a_grid_size(self):
+        rng = random.Random(8)
+        features = [rectangle_feature(f"building_{n}", rng) for n in range(200)]
+        features += [star_feature(f"star_{n}", rng) for n in range(20)]
+        features.append(BuildingFeature(
+            id="sliver", properties={"elevation": 0, "height": 10},
+            geometry={"type": "Polygon", "coordinates": [[[5, 5], [5.00037, 5], [5.00037, 9], [5, 9], [5, 5]]]},
+        ))
+        self.assertGreater(len(self.assert_engines_agree(features, grid_size=0.01)), 100)
+
+    def test_multipolygon_keeps_largest_part(self):
+        u_shape = [[0, 0], [30, 0], [30, 20], [20, 20], [20, 5], [10, 5], [10, 20], [0, 20], [0, 0]]
+        bar = [[-5, 10], [35, 10], [35, 18], [-5, 18], [-5, 10]]
+        features = [
+            BuildingFeature(id="u", properties={"elevation": 0, "height": 10},
+                            geometry={"type": "Polygon", "coordinates": [u_shape]}),
+            BuildingFeature(id="bar", properties={"elevation": 5, "height": 10},
+                            geometry={"type": "Polygon", "coordinates": [bar]}),
+        ]
+        clashes = self.assert_engines_agree(features)
+        self.assertEqual(len(clashes), 1)
+        self.assertEqual(clashes[0].building_ids, ["bar", "u"])
+        self.assertEqual(clashes[0].height, 5)
+
+    def test_touching_and_stacked_buildings_do_not_clash(self):
+        ring = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+        neighbour = [[10, 0], [20, 0], [20, 10], [10, 10], [10, 0]]
+        features = [
+            BuildingFeature(id="a", properties={"elevation": 0, "height": 4},
+                            geometry={"type": "Polygon", "coordinates": [ring]}),
+            BuildingFeature(id="b", properties={"elevation": 4, "height": 4},
+                            geometry={"type": "Polygon", "coordinates": [ring]}),
+            BuildingFeature(id="c", properties={"elevation": 0, "height": 4},
+                            geometry={"type": "Polygon", "coordinates": [neighbour]}),
+        ]
+        self.assertEqual(self.assert_engines_agree(features), [])
+
+    def test_vectorized_rounding_matches_builtin_round(self):
+        rng = random.Random(2)
+        values = [rng.randint(-10 ** 9, 10 ** 9) / 1e6 + 5e-7 for _ in range(20000)]
+        values += [rng.uniform(-1e5, 1e5) for _ in range(20000)]
+        values += [0.0, -0.0, 2.675, -1e-7, 1e300]
+        rounded = round_half_even_6(np.array(values)).tolist()
+        self.assertEqual([repr(v) for v in rounded], [repr(round(v, 6)) for v in values])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from pypackages.common.local_aws import InMemoryTable
+from pypackages.common.payload_store import LocalPayloadStore, offload_message
+from pypackages.common.result_storage import STATUS_COMPLETE, STATUS_FAILED, STATUS_PENDING, ResultStore
+from pypackages.detect_building_clash import building_clash_detect_service
+from pypackages.detect_building_clash.building_clash_detect_service import (
+    SMALL_JOB_BYTES,
+    BuildingClashDetectService,
+)
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+
+def record(message_id, task_id, features):
+    body = {"task_id": task_id, "input": {"features": [f.model_dump() for f in features]}}
+    return {"messageId": message_id, "body": json.dumps(body)}
+
+
+class TestBatchProcessing(unittest.TestCase):
+    def setUp(self):
+        self.results = ResultStore(InMemoryTable())
+        patcher = patch.object(building_clash_detect_service, "get_result_store", return_value=self.results)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_every_record_is_processed_and_failures_reported(self):
+        records = [record(f"m{i}", f"t{i}", random_features(30, seed=i)) for i in range(5)]
+        large = record("m-large", "t-large", random_features(600, seed=9))
+        self.assertGreater(len(large["body"]), SMALL_JOB_BYTES)
+        records.insert(2, large)
+        bad = random_features(3)
+        bad[1].geometry["coordinates"] = [[[0, 0], [10, 10], [10, 0], [0, 10], [0, 0]]]
+        records.insert(4, record("m-bad", "t-bad", bad))
+
+        response = BuildingClashDetectService().execute_batch({"Records": records})
+
+        # Invalid input is recorded as FAILED and acknowledged, not retried.
+        self.assertEqual(response, {"batchItemFailures": []})
+        self.assertEqual(self.results.status("t-bad")["status"], STATUS_FAILED)
+        service = BuildingClashDetectService()
+        for r in records:
+            if r["messageId"] == "m-bad":
+                continue
+            task_id = json.loads(r["body"])["task_id"]
+            self.assertEqual(self.results.fetch(task_id), service.process_record(r))
+
+    def test_parse_errors_mark_the_task_failed(self):
+        self.results.mark_pending("t-parse")
+        bad = json.loads(record("m", "t-parse", random_features(5))["body"])
+        bad["input"]["features"][3]["properties"]["elevation"] = "x"
+        records = [{"messageId": "m", "body": json.dumps(bad)}]
+        response = BuildingClashDetectService().execute_batch({"Records": records})
+        self.assertEqual(response, {"batchItemFailures": []})
+        status = self.results.status("t-parse")
+        self.assertEqual(status["status"], STATUS_FAILED)
+        self.assertIn("elevation", status["error"])
+
+    def test_transient_errors_and_records_past_the_deadline_are_retried(self):
+        records = [record(f"m{i}", f"t{i}", random_features(20, seed=i)) for i in range(3)]
+        with patch.object(self.results, "save_json", side_effect=[None, RuntimeError("throttled"), None]):
+            response = BuildingClashDetectService(batch_concurrency=1).execute_batch({"Records": records})
+        self.assertEqual(response, {"batchItemFailures": [{"itemIdentifier": "m1"}]})
+
+        records = [record(f"d{i}", f"late{i}", random_features(20, seed=i)) for i in range(3)]
+        context = Mock()
+        context.get_remaining_time_in_millis.side_effect = [60000, 1000, 1000]
+        response = BuildingClashDetectService(batch_concurrency=1).execute_batch({"Records": records}, context)
+        self.assertEqual(response, {"batchItemFailures": [{"itemIdentifier": "d1"}, {"itemIdentifier": "d2"}]})
+        self.assertIsNotNone(self.results.fetch("late0"))
+        self.assertIsNone(self.results.status("late1"))
+
+    def test_transient_errors_mark_the_task_failed_on_the_last_receive(self):
+        service = BuildingClashDetectService()
+        self.results.mark_pending("t")
+        retried = record("m", "t", random_features(10))
+        for receives, expected in (("1", STATUS_PENDING), ("2", STATUS_PENDING), ("3", STATUS_FAILED)):
+            retried["attributes"] = {"ApproximateReceiveCount": receives}
+            with patch.object(self.results, "save_json", side_effect=RuntimeError("throttled")):
+                response = service.execute_batch({"Records": [retried]})
+            self.assertEqual(response, {"batchItemFailures": [{"itemIdentifier": "m"}]})
+            self.assertEqual(self.results.status("t")["status"], expected)
+
+    def test_shard_failures_leave_the_parent_task_alone(self):
+        self.results.save("parent", {"type": "FeatureCollection", "features": []})
+        body = json.loads(record("m", "parent", random_features(10))["body"])
+        body["shard"] = {"index": 0, "count": 2}
+        shard = {"messageId": "m", "body": json.dumps(body), "attributes": {"ApproximateReceiveCount": "3"}}
+        with patch.object(BuildingClashDetectService, "_process_shard", side_effect=RuntimeError("throttled")):
+            response = BuildingClashDetectService().execute_batch({"Records": [shard]})
+        self.assertEqual(response, {"batchItemFailures": [{"itemIdentifier": "m"}]})
+        self.assertEqual(self.results.status("parent")["status"], STATUS_COMPLETE)
+
+    def test_claim_check_input_is_read_from_the_payload_store(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        payloads = LocalPayloadStore(directory.name)
+        inline = record("m0", "t0", random_features(200, seed=3))
+        body = offload_message(json.loads(inline["body"]), "inputs/t-ref.json.gz", payloads, max_inline_bytes=0)
+        claim_check = {"messageId": "m1", "body": body.replace('"t0"', '"t-ref"')}
+        self.assertIn("payload", json.loads(claim_check["body"]))
+
+        service = BuildingClashDetectService(payload_store=payloads)
+        self.assertEqual(service.execute_batch({"Records": [inline, claim_check]}), {"batchItemFailures": []})
+        self.assertEqual(self.results.fetch("t-ref"), self.results.fetch("t0"))
+
+        with self.assertRaises(ValueError):
+            BuildingClashDetectService(payload_store=payloads).process_record(
+                {"messageId": "m2", "body": body.replace('"sha256": "', '"sha256": "0')}
+            )
+
+    def test_each_record_logs_its_metrics(self):
+        bad = random_features(3)
+        bad[0].geometry["coordinates"] = [[[0, 0], [10, 10], [10, 0], [0, 10], [0, 0]]]
+        records = [record("m0", "t0", random_features(40)), record("m1", "t1", bad)]
+        logger_name = building_clash_detect_service.logger.name
+        with self.assertLogs(logger_name, "INFO") as logs:
+            BuildingClashDetectService().execute_batch({"Records": records})
+        lines = [json.loads(r.getMessage()) for r in logs.records if r.getMessage().startswith('{"metric"')]
+        by_task = {line["task_id"]: line for line in lines}
+        self.assertEqual(by_task["t0"]["status"], "COMPLETE")
+        self.assertEqual(set(by_task["t0"]["stages_ms"]), {"parse", "validate", "detect", "format", "store"})
+        self.assertEqual(by_task["t0"]["counters"]["features"], 40)
+        self.assertGreater(by_task["t0"]["counters"]["candidate_pairs"], 0)
+        self.assertEqual(by_task["t1"]["status"], "FAILED")
+
+    def test_execute_rejects_multi_record_events(self):
+        records = [record("a", "a", random_features(5)), record("b", "b", random_features(5))]
+        with self.assertRaises(ValueError):
+            BuildingClashDetectService().execute({"Records": records})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import hashlib
+import io
+import json
+import os
+import random
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import shapely
+
+from pypackages.common.local_aws import InMemoryTable
+from pypackages.common.payload_store import LocalPayloadStore
+from pypackages.common.result_storage import ResultStore
+from pypackages.detect_building_clash import batch_cli, building_clash_detect_service
+from pypackages.detect_building_clash.binary_input import (
+    GEOMETRY_COORDS,
+    GEOMETRY_WKB,
+    pack_footprints,
+    read_geoparquet,
+    read_packed,
+)
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStore, FootprintStoreBuilder
+from pypackages.detect_building_clash.test.test_batch_engine import star_feature
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def pack_store(store, geometry=GEOMETRY_COORDS):
+    return pack_footprints(store.ids, store.elevations, store.heights, store.coords, store.offsets, geometry)
+
+
+class TestBinaryInput(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        self.features = random_features(150, seed=5) + [star_feature(f"stär_{n}", rng) for n in range(40)]
+        self.store = FootprintStore.from_features(self.features)
+
+    def from_columns(self, columns):
+        builder = FootprintStoreBuilder()
+        builder.add_columns(columns)
+        return builder.build()
+
+    def test_packed_coordinates_are_views_of_the_input(self):
+        data = pack_store(self.store)
+        columns = read_packed(data)
+        self.assertEqual(columns.ids.tolist(), self.store.ids.tolist())
+        np.testing.assert_array_equal(columns.coords, self.store.coords)
+        np.testing.assert_array_equal(columns.offsets, self.store.offsets)
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        for column in (columns.elevations, columns.heights, columns.coords, columns.offsets):
+            self.assertTrue(np.shares_memory(column, buffer))
+        self.assertTrue(np.shares_memory(self.from_columns(columns).coords, buffer))
+
+    def test_wkb_geometries_give_the_same_clashes(self):
+        service = BuildingClashDetectService()
+        expected = service._process_store(self.store)
+        self.assertGreater(len(expected), 0)
+        for geometry in (GEOMETRY_COORDS, GEOMETRY_WKB):
+            with self.subTest(geometry=geometry):
+                store = self.from_columns(read_packed(pack_store(self.store, geometry)))
+                self.assertEqual(service._process_store(store), expected)
+
+    def test_bad_inputs_are_rejected(self):
+        data = pack_store(self.store, GEOMETRY_WKB)
+        square = [[0, 0], [1, 0], [1, 1], [0, 0]]
+        line = shapely.to_wkb(shapely.LineString([(0, 0), (1, 1)]))
+        sections = [np.zeros(2), np.array([0, len(line)]), line, np.array([0, 1]), b"a"]
+        cases = {
+            "truncated": data[:-100],
+            "magic": b"XXXX" + data[4:],
+            "nan height": pack_footprints(["a"], [0], [np.nan], square, [0, 4]),
+            "not a polygon": b"".join(
+                [struct.pack("<4sHHQ", b"BCLP", 1, GEOMETRY_WKB, 1)]
+                + [part + bytes(-len(part) % 8) for part in (np.asarray(section).tobytes() for section in sections)]
+            ),
+        }
+        for name, case in cases.items():
+            with self.subTest(name), self.assertRaises(ValueError):
+                read_packed(case)
+
+    def test_binary_claim_check_input(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        payloads = LocalPayloadStore(directory.name)
+        data = pack_store(self.store)
+        payloads.put("uploads/model", data)
+        payload = {"key": "uploads/model", "sha256": hashlib.sha256(data).hexdigest(), "encoding": "identity",
+                   "format": "packed"}
+        body = {"task_id": "binary", "payload": payload, "query": {"mode": "count"}}
+        results = ResultStore(InMemoryTable())
+        with patch.object(building_clash_detect_service, "get_result_store", return_value=results):
+            result = BuildingClashDetectService(payload_store=payloads).process_record(
+                {"messageId": "m", "body": json.dumps(body)})
+        service = BuildingClashDetectService()
+        self.assertEqual(result["clash_count"], len(service._process_store(self.store)))
+        self.assertEqual(results.fetch("binary"), result)
+
+    def test_batch_cli_reads_packed_models(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "model.packed")
+        with open(path, "wb") as f:
+            f.write(pack_store(self.store, GEOMETRY_WKB))
+        self.assertEqual(batch_cli.find_models([directory.name]), [path])
+        batch_cli._init_worker(batch_cli.CANDIDATE_SEARCH_3D, batch_cli.ENGINE_BATCH)
+        output = io.StringIO()
+        result = batch_cli.detect_model(path, output)
+        self.assertIsNone(result.error)
+        self.assertEqual(result.clashes, len(BuildingClashDetectService()._process_store(self.store)))
+        self.assertEqual(len(output.getvalue().splitlines()), result.clashes)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_geoparquet(self):
+        import pyarrow.parquet as pq
+
+        wkb = shapely.to_wkb(self.store.polygons)
+        table = pyarrow.table({
+            "id": self.store.ids.tolist(),
+            "elevation": self.store.elevations,
+            "height": self.store.heights,
+            "geometry": pyarrow.array(wkb.tolist(), type=pyarrow.binary()),
+        }).replace_schema_metadata({"geo": json.dumps({
+            "version": "1.0.0", "primary_column": "geometry",
+            "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Polygon"]}},
+        })})
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "model.parquet")
+        pq.write_table(table, path)
+        service = BuildingClashDetectService()
+        store = self.from_columns(read_geoparquet(path))
+        self.assertEqual(service._process_store(store), service._process_store(self.store))
+
+
+if __name__ == '__main__':
+    unittest.main()
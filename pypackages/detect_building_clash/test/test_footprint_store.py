@@ -0,0 +1,125 @@
+import unittest
+
+import numpy as np
+import shapely
+
+from pypackages.common.cache import LRUCache
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingFeature
+from pypackages.detect_building_clash.footprint_store import FootprintStore, FootprintStoreBuilder
+
+
+def feature(building_id, ring, elevation=0, height=4):
+    return BuildingFeature(
+        id=building_id,
+        properties={"elevation": elevation, "height": height},
+        geometry={"type": "Polygon", "coordinates": [ring]},
+    )
+
+
+class TestFootprintStore(unittest.TestCase):
+    def test_polygons_are_built_once_and_prepared(self):
+        store = FootprintStore.from_features([
+            feature("a", [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]),
+            feature("b", [[5, 5], [15, 5], [15, 15], [5, 15], [5, 5]]),
+        ])
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.ids.tolist(), ["a", "b"])
+        self.assertTrue(shapely.is_prepared(store.polygons).all())
+        self.assertIs(store.polygon(0), store.polygon(0))
+        self.assertEqual(store.polygon(1).area, 100)
+
+    def test_rings_share_one_contiguous_buffer(self):
+        builder = FootprintStoreBuilder()
+        builder.add("a", 0.0, 4.0, [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+        builder.add("b", 2.0, 3.0, [[5, 5], [15, 5], [15, 15], [5, 5]])
+        builder.add("c", 1.0, 1.0, [[20, 20], [30, 20], [30, 30]])
+        store = builder.build()
+        self.assertEqual(store.coords.shape, (12, 2))
+        self.assertEqual(store.offsets.tolist(), [0, 5, 9, 12])
+        self.assertTrue(store.coords.flags.c_contiguous)
+        self.assertTrue(np.shares_memory(store.ring(1), store.coords))
+        self.assertEqual(store.ring(1).tolist(), [[5, 5], [15, 5], [15, 15], [5, 5]])
+        self.assertEqual(store.tops.tolist(), [4.0, 5.0, 2.0])
+        # Unclosed rings are closed like shapely.Polygon does.
+        self.assertEqual(store.polygon(2).area, 50)
+
+        subset = store.subset(np.array([2, 0]))
+        self.assertEqual(subset.ids.tolist(), ["c", "a"])
+        self.assertEqual(subset.ring(0).tolist(), store.ring(2).tolist())
+        self.assertEqual(subset.ring(1).tolist(), store.ring(0).tolist())
+        self.assertIs(subset.polygon(1), store.polygon(0))
+
+    def test_malformed_ring_is_rejected_and_rolled_back(self):
+        builder = FootprintStoreBuilder()
+        with self.assertRaises(ValueError):
+            builder.add("bad", 0.0, 1.0, [[0, 0, 1], [1, 0], [1, 1], [0, 0]])
+        with self.assertRaises(ValueError):
+            builder.add("bad", 0.0, 1.0, [0, 0, 1, 1])
+        self.assertEqual(len(builder), 0)
+        self.assertEqual(len(builder.coords), 0)
+
+    def test_geometry_cache_reuses_validated_footprints(self):
+        cache = LRUCache(ttl_seconds=None)
+        rings = [[[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]], [[5, 5], [15, 5], [15, 15], [5, 5]]]
+        first = FootprintStore.from_features([feature("a", rings[0]), feature("b", rings[1])])
+        builder = FootprintStoreBuilder()
+        builder.add("a", 0.0, 4.0, rings[0])
+        builder.add("b", 0.0, 4.0, rings[1])
+        cached = builder.build(geometry_cache=cache)
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(shapely.equals(cached.polygons, first.polygons).all())
+
+        builder = FootprintStoreBuilder()
+        builder.add("c", 1.0, 2.0, [[20, 20], [30, 20], [30, 30], [20, 20]])
+        builder.add("b2", 3.0, 1.0, rings[1])
+        store = builder.build(geometry_cache=cache)
+        self.assertIs(store.polygon(1), cached.polygon(1))
+        self.assertEqual(store.polygon(0).area, 50)
+        self.assertEqual((cache.hits, len(cache)), (1, 3))
+
+        bowtie = [[0, 0], [10, 10], [10, 0], [0, 10], [0, 0]]
+        builder = FootprintStoreBuilder()
+        builder.add("a", 0.0, 1.0, rings[0])
+        builder.add("bad", 0.0, 1.0, bowtie)
+        with self.assertRaisesRegex(ValueError, "building bad"):
+            builder.build(geometry_cache=cache)
+
+    def test_axis_aligned_rectangles_are_flagged(self):
+        builder = FootprintStoreBuilder()
+        builder.add("closed", 0.0, 1.0, [[0, 0], [10, 0], [10, 5], [0, 5], [0, 0]])
+        builder.add("clockwise_open", 0.0, 1.0, [[3, 9], [3, 2], [1, 2], [1, 9]])
+        builder.add("rotated", 0.0, 1.0, [[0, 0], [10, 10], [0, 20], [-10, 10], [0, 0]])
+        builder.add("triangle", 0.0, 1.0, [[5, 5], [15, 5], [15, 15], [5, 5]])
+        builder.add("l_shape", 0.0, 1.0, [[0, 0], [4, 0], [4, 2], [2, 2], [2, 4], [0, 4], [0, 0]])
+        store = builder.build()
+        self.assertEqual(store.rectangles.tolist(), [True, True, False, False, False])
+        self.assertEqual(store.rect_bounds[:2].tolist(), [[0, 0, 10, 5], [1, 2, 3, 9]])
+        self.assertTrue(np.isnan(store.rect_bounds[2:]).all())
+        self.assertEqual(store.subset(np.array([1, 2])).rectangles.tolist(), [True, False])
+
+    def test_grid_size_snaps_all_but_rectangles(self):
+        builder = FootprintStoreBuilder()
+        builder.add("rect", 0.0, 1.0, [[0.1234, 0], [1, 0], [1, 1], [0.1234, 1], [0.1234, 0]])
+        builder.add("triangle", 0.0, 1.0, [[0.1234, 0], [1, 0], [1, 1], [0.1234, 0]])
+        store = builder.build(grid_size=0.01)
+        self.assertEqual(shapely.get_coordinates(store.polygon(0))[0].tolist(), [0.1234, 0])
+        self.assertAlmostEqual(shapely.get_coordinates(store.polygon(1))[:, 0].min(), 0.12)
+        self.assertEqual(store.subset(np.array([1])).grid_size, 0.01)
+
+    def test_empty_store(self):
+        store = FootprintStoreBuilder().build()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.polygons.shape, (0,))
+
+    def test_self_intersecting_footprint_is_rejected(self):
+        bowtie = [[0, 0], [10, 10], [10, 0], [0, 10], [0, 0]]
+        with self.assertRaisesRegex(ValueError, "building bad"):
+            FootprintStore.from_features([feature("bad", bowtie)])
+
+    def test_degenerate_footprint_is_rejected(self):
+        with self.assertRaises(ValueError):
+            FootprintStore.from_features([feature("bad", [[0, 0], [1, 1]])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStoreBuilder
+from pypackages.detect_building_clash.geojson_stream import ingest_message
+
+SAMPLE_FEATURES = [
+    {
+        "type": "Feature",
+        "id": "building_0",
+        "properties": {"height": 4, "elevation": 0, "name": "ignored"},
+        "geometry": {"type": "Polygon", "coordinates": [[[20, 0], [20, 60], [0, 60], [0, 0], [20, 0]]]},
+    },
+    {
+        "type": "Feature",
+        "id": "building_1",
+        "properties": {"height": 4.5, "elevation": 2},
+        "geometry": {"type": "Polygon", "coordinates": [[[60, 60], [0, 60], [0, 40], [60, 40], [60, 60]]]},
+    },
+]
+
+
+class RecordingSink:
+    def __init__(self):
+        self.features = []
+
+    def add(self, building_id, elevation, height, ring):
+        self.features.append((building_id, elevation, height, ring))
+
+
+class TestGeoJsonStream(unittest.TestCase):
+    def test_task_message_from_string(self):
+        body = json.dumps({"task_id": "abc", "input": {"type": "FeatureCollection", "features": SAMPLE_FEATURES}})
+        sink = RecordingSink()
+        fields = ingest_message(body, sink)
+        self.assertEqual(fields, {"task_id": "abc", "input": {"type": "FeatureCollection"}})
+        self.assertEqual([f[:3] for f in sink.features], [("building_0", 0.0, 4.0), ("building_1", 2.0, 4.5)])
+        self.assertEqual(sink.features[1][3][0], [60, 60])
+
+    @patch("pypackages.detect_building_clash.geojson_stream.READ_CHUNK_SIZE", 7)
+    def test_stream_refills_across_chunk_boundaries(self):
+        body = json.dumps({"features": SAMPLE_FEATURES, "task_id": "x", "version": 12345}, indent=2)
+        from_stream, from_string = RecordingSink(), RecordingSink()
+        fields = ingest_message(io.StringIO(body), from_stream)
+        self.assertEqual(fields, ingest_message(body, from_string))
+        self.assertEqual(fields["version"], 12345)
+        self.assertEqual(from_stream.features, from_string.features)
+
+    def test_rejects_bad_input(self):
+        for body in ['{"task_id": "x", "input": {}}', '[]', '{"features": [1]}',
+                     '{"features": [{"id": 1, "properties": {}, "geometry": {}}]}',
+                     '{"features": []} trailing']:
+            with self.assertRaises(ValueError, msg=body):
+                ingest_message(body, RecordingSink())
+
+    def test_builder_validates_footprints(self):
+        feature = dict(SAMPLE_FEATURES[0], geometry={"type": "Polygon", "coordinates": [[[0, 0], [1, 1]]]})
+        builder = FootprintStoreBuilder()
+        ingest_message(json.dumps({"features": [feature]}), builder)
+        with self.assertRaisesRegex(ValueError, "building_0"):
+            builder.build()
+
+    def test_scalar_engine_runs_on_streamed_input(self):
+        event = {"Records": [{"body": json.dumps({"task_id": "t", "input": {"features": SAMPLE_FEATURES}})}]}
+        with patch.object(BuildingClashDetectService, "save_result"):
+            batch = BuildingClashDetectService().execute(event)
+            scalar = BuildingClashDetectService(engine="scalar").execute(event)
+        self.assertEqual(batch, scalar)
+        self.assertEqual(len(batch["features"]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
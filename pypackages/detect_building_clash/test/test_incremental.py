@@ -0,0 +1,114 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from pypackages.detect_building_clash.building_clash_detect_service import (
+    BuildingClashDetectService,
+    BuildingFeature,
+)
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.common.local_aws import InMemoryTable
+from pypackages.detect_building_clash.incremental import (
+    DynamoDBProjectStateStore,
+    InMemoryProjectStateStore,
+    ProjectState,
+    detect_incremental,
+    project_id_of,
+)
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+
+def overlapping_grid(count, step=9):
+    """10 x 10 footprints `step` apart, so each overlaps its eight neighbours."""
+    side = int(count ** 0.5) + 1
+    features = []
+    for n in range(count):
+        x, y = (n % side) * step, (n // side) * step
+        features.append(BuildingFeature(
+            id=f"b{n}", properties={"elevation": 0, "height": 10},
+            geometry={"type": "Polygon", "coordinates": [[[x, y], [x + 10, y], [x + 10, y + 10], [x, y + 10], [x, y]]]},
+        ))
+    return features
+
+
+def moved(feature, dx):
+    ring = [[x + dx, y] for x, y in feature.geometry["coordinates"][0]]
+    return BuildingFeature(id=feature.id, properties=feature.properties,
+                           geometry={"type": "Polygon", "coordinates": [ring]})
+
+
+class TestIncrementalDetection(unittest.TestCase):
+    def setUp(self):
+        self.features = random_features(400, seed=5)
+        _, self.state, stats = detect_incremental(FootprintStore.from_features(self.features), None)
+        self.assertTrue(stats.full_run)
+
+    def assert_matches_full_run(self, revised):
+        store = FootprintStore.from_features(revised)
+        previous = ProjectState.from_bytes(self.state.to_bytes())
+        results, _, stats = detect_incremental(store, previous)
+        self.assertEqual(results, BuildingClashDetectService()._process_store(store))
+        return stats
+
+    def test_unchanged_model_recomputes_nothing(self):
+        stats = self.assert_matches_full_run(self.features)
+        self.assertEqual(stats.recomputed_pairs, 0)
+        self.assertEqual(stats.reused_clashes, len(self.state.clashes))
+
+    def test_edit_recomputes_only_affected_pairs(self):
+        revised = list(self.features)
+        revised[10] = moved(revised[10], 7.5)
+        revised[200] = moved(revised[200], -3)
+        del revised[50]
+        revised.append(BuildingFeature(id="new", properties={"elevation": 0, "height": 10},
+                                       geometry={"type": "Polygon",
+                                                 "coordinates": [[[0, 0], [90, 0], [90, 90], [0, 0]]]}))
+        stats = self.assert_matches_full_run(revised)
+        self.assertEqual((stats.added, stats.changed, stats.removed), (1, 2, 1))
+        self.assertLess(stats.recomputed_pairs, 200)
+
+    def test_reordered_input_matches_full_run(self):
+        revised = list(reversed(self.features))
+        self.assert_matches_full_run(revised)
+
+    def test_execute_keeps_state_per_project(self):
+        states = InMemoryProjectStateStore()
+        service = BuildingClashDetectService(project_states=states)
+        features = [f.model_dump() for f in self.features]
+
+        def event(project_features):
+            body = {"task_id": "t", "project_id": "campus", "input": {"features": project_features}}
+            return {"Records": [{"body": json.dumps(body)}]}
+
+        with patch.object(BuildingClashDetectService, "save_result"):
+            first = service.execute(event(features))
+            features[3]["properties"]["elevation"] = 100
+            second = service.execute(event(features))
+            full = BuildingClashDetectService().execute(event(features))
+        self.assertIn("campus", states.states)
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, full)
+
+    def test_project_is_read_from_the_message_or_its_input(self):
+        self.assertEqual(project_id_of({"task_id": "t", "project_id": "campus", "input": {}}), "campus")
+        self.assertEqual(project_id_of({"task_id": "t", "input": {"project_id": "campus"}}), "campus")
+        self.assertIsNone(project_id_of({"task_id": "t", "input": {"features": []}}))
+        self.assertIsNone(project_id_of({"task_id": "t", "payload": {"key": "uploads/x"}}))
+
+    def test_large_states_are_chunked_under_the_item_limit(self):
+        table = InMemoryTable("project_id")
+        states = DynamoDBProjectStateStore(table)
+        _, large, _ = detect_incremental(FootprintStore.from_features(overlapping_grid(5000)), None)
+        self.assertGreater(len(large.to_bytes()), 400 * 1024)
+
+        states.save("campus", large)
+        self.assertEqual(states.load("campus"), large)
+        self.assertGreater(len(table.items), 1)
+
+        states.save("campus", self.state)
+        self.assertEqual(list(table.items), ["campus"])
+        self.assertEqual(states.load("campus"), self.state)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import multiprocessing
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import shapely
+
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.parallel import SiteTiling, detect_parallel
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+
+class TestParallelDetection(unittest.TestCase):
+    def setUp(self):
+        self.features = random_features(600, seed=21)
+        self.serial = BuildingClashDetectService()._process_features(self.features)
+
+    def test_parallel_matches_serial(self):
+        parallel = BuildingClashDetectService(workers=3)._process_features(self.features)
+        self.assertGreater(len(self.serial), 0)
+        self.assertEqual(parallel, self.serial)
+
+    def test_falls_back_in_process_when_processes_cannot_start(self):
+        store = FootprintStore.from_features(self.features)
+        with patch("multiprocessing.Process.start", side_effect=OSError("no /dev/shm")):
+            self.assertEqual(detect_parallel(store, workers=4), self.serial)
+
+    def test_started_processes_and_pipes_are_cleaned_up_on_fallback(self):
+        store = FootprintStore.from_features(self.features)
+        start, pipe = multiprocessing.Process.start, multiprocessing.Pipe
+        started, connections = [], []
+
+        def start_two(process):
+            if len(started) == 2:
+                raise OSError("too many processes")
+            start(process)
+            started.append(process)
+
+        def tracked_pipe(duplex):
+            pair = pipe(duplex)
+            connections.extend(pair)
+            return pair
+
+        with patch("multiprocessing.Process.start", start_two), patch("multiprocessing.Pipe", tracked_pipe):
+            self.assertEqual(detect_parallel(store, workers=4), self.serial)
+        self.assertEqual(len(started), 2)
+        self.assertTrue(all(process.exitcode is not None for process in started))
+        self.assertTrue(all(connection.closed for connection in connections))
+
+    def test_every_overlapping_pair_is_owned_by_exactly_one_tile(self):
+        store = FootprintStore.from_features(self.features)
+        tiling = SiteTiling(shapely.bounds(store.polygons), tile_count=9)
+        members = tiling.members()
+        owners = {}
+        for tile, tile_members in enumerate(members):
+            left, right = np.triu_indices(len(tile_members), k=1)
+            left, right = tile_members[left], tile_members[right]
+            for i, j in zip(left[tiling.owned(tile, left, right)], right[tiling.owned(tile, left, right)]):
+                owners.setdefault((int(i), int(j)), []).append(tile)
+        self.assertTrue(all(len(tiles) == 1 for tiles in owners.values()))
+        for clash_pair in {tuple(c.building_ids) for c in self.serial}:
+            i, j = sorted(store.ids.tolist().index(b) for b in clash_pair)
+            self.assertIn((i, j), owners)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pypackages.common.local_aws import InMemoryTable
+from pypackages.common.payload_store import LocalPayloadStore
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.project_index import ProjectIndex, ProjectIndexStore, index_key
+from pypackages.detect_building_clash.query import ClashQuery
+from pypackages.detect_building_clash.test.test_incremental import moved
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+
+class TestProjectIndex(unittest.TestCase):
+    def setUp(self):
+        self.features = random_features(300, seed=11)
+        self.index = ProjectIndex(FootprintStore.from_features(self.features[:-5]))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.payloads = LocalPayloadStore(directory.name)
+        self.table = InMemoryTable("project_id")
+        self.indexes = ProjectIndexStore(self.table, self.payloads)
+
+    def test_check_matches_the_clashes_of_a_full_run(self):
+        service = BuildingClashDetectService()
+        candidates = FootprintStore.from_features(self.features[-5:])
+        result = self.index.check(candidates)
+        self.assertGreater(len(result.clashes), 0)
+        self.assertTrue(all(pair[0] < len(candidates) <= pair[1] for pair in result.pairs.tolist()))
+
+        full = service._process_store(FootprintStore.from_features(self.features))
+        names = {f.id for f in self.features[-5:]}
+        expected = [clash for clash in full if len(names & set(clash.building_ids)) == 1]
+        self.assertEqual(sorted(service.format_results(result.clashes), key=json.dumps),
+                         sorted(service.format_results(expected), key=json.dumps))
+
+        summary = service.summarize(result.ids, result.pairs, ClashQuery(mode="count"))
+        self.assertEqual(summary["clash_count"], len(expected))
+
+    def test_candidate_stands_in_for_the_building_with_its_id(self):
+        candidate = moved(self.features[0], 0.5)
+        result = self.index.check(FootprintStore.from_features([candidate]))
+        self.assertNotIn([candidate.id, candidate.id], [clash.building_ids for clash in result.clashes])
+
+        far = moved(self.features[0], 10000)
+        self.assertEqual(self.index.check(FootprintStore.from_features([far])).clashes, [])
+
+    def test_saved_index_is_loaded_and_kept_warm(self):
+        self.assertIsNone(self.indexes.load("campus"))
+        store = FootprintStore.from_features(self.features)
+        self.indexes.save("campus", store)
+        self.assertEqual(self.table.items[index_key("campus")]["buildings"], len(store))
+
+        loaded = self.indexes.load("campus")
+        self.assertEqual(loaded.store.ids.tolist(), store.ids.tolist())
+        self.assertIs(self.indexes.load("campus"), loaded)
+
+        first_key = self.table.items[index_key("campus")]["index"]["key"]
+        self.indexes.save("campus", FootprintStore.from_features(self.features[:100]))
+        reloaded = self.indexes.load("campus")
+        self.assertIsNot(reloaded, loaded)
+        self.assertEqual(len(reloaded), 100)
+        with self.assertRaises(KeyError):
+            self.payloads.open(first_key)
+
+    def test_concurrent_saves_never_delete_the_named_object(self):
+        self.indexes.save("campus", FootprintStore.from_features(self.features[:10]))
+        put_item = self.table.put_item
+        concurrent = [FootprintStore.from_features(self.features[:20])]
+
+        def interleaved(**kwargs):
+            # Another save completes between this one reading the reference and writing the item.
+            if concurrent:
+                self.indexes.save("campus", concurrent.pop())
+            put_item(**kwargs)
+
+        with patch.object(self.table, "put_item", side_effect=interleaved):
+            self.indexes.save("campus", FootprintStore.from_features(self.features[:30]))
+        self.assertEqual(len(self.indexes.load("campus")), 30)
+        # The objects of both replaced saves are gone.
+        self.assertEqual(len([path for path in self.payloads.directory.rglob("*") if path.is_file()]), 1)
+
+    def test_worker_stores_the_index_of_project_tasks(self):
+        service = BuildingClashDetectService(project_indexes=self.indexes)
+        body = {"task_id": "t", "project_id": "campus", "input": {"features": [f.model_dump() for f in self.features]}}
+        with patch.object(BuildingClashDetectService, "save_result"):
+            service.execute({"Records": [{"body": json.dumps(body)}]})
+            del body["project_id"]
+            body["task_id"] = "t2"
+            service.execute({"Records": [{"body": json.dumps(body)}]})
+            self.assertEqual(list(self.table.items), [index_key("campus")])
+            self.assertEqual(self.table.items[index_key("campus")]["task_id"], "t")
+            self.assertEqual(len(self.indexes.load("campus")), len(self.features))
+
+            # As the API queues it, with the project on the submitted input.
+            body["input"] = {"project_id": "campus", "features": body["input"]["features"][:50]}
+            service.execute({"Records": [{"body": json.dumps(body)}]})
+        self.assertEqual(len(self.indexes.load("campus")), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import random
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+import shapely
+
+from pypackages.common.local_aws import InMemoryTable
+from pypackages.common.result_storage import ResultStore
+from pypackages.detect_building_clash import building_clash_detect_service
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.footprint_store import FootprintStore
+from pypackages.detect_building_clash.query import ClashQuery
+from pypackages.detect_building_clash.test.test_batch_engine import star_feature
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+
+def mixed_features():
+    rng = random.Random(4)
+    return random_features(150, seed=4) + [star_feature(f"star_{n}", rng) for n in range(60)]
+
+
+class TestClashQuery(unittest.TestCase):
+    def test_query_is_read_from_the_task_input(self):
+        message = {"task_id": "t", "input": {"query": {"mode": "count", "min_overlap_area": 2}}}
+        self.assertEqual(ClashQuery.from_message(message), ClashQuery("count", 2.0, 0.0))
+        self.assertEqual(ClashQuery.from_message({"query": {"mode": "any"}}).mode, "any")
+        self.assertEqual(ClashQuery.from_message({"task_id": "t", "input": {}}), ClashQuery())
+
+    def test_invalid_queries_are_rejected(self):
+        for query in ({"mode": "all"}, {"min_overlap_area": -1}, {"min_overlap_height": "2"}, [1]):
+            with self.subTest(query=query), self.assertRaises(ValueError):
+                ClashQuery.from_message({"query": query})
+
+    def test_thresholds_match_filtering_the_full_result(self):
+        features = mixed_features()
+        store = FootprintStore.from_features(features)
+        query = ClashQuery(min_overlap_area=15, min_overlap_height=3)
+        full = BuildingClashDetectService()._process_features(features)
+        index = {building_id: i for i, building_id in enumerate(store.ids.tolist())}
+
+        def qualifies(clash):
+            i, j = sorted(index[b] for b in clash.building_ids)
+            overlap = shapely.intersection(store.polygon(i), store.polygon(j))
+            return clash.height >= 3 and shapely.area(overlap) >= 15
+
+        expected = [clash for clash in full if qualifies(clash)]
+        self.assertTrue(0 < len(expected) < len(full))
+        for engine in ("batch", "scalar"):
+            with self.subTest(engine=engine):
+                service = BuildingClashDetectService(engine=engine)
+                self.assertEqual(service._process_store(store, query), expected)
+
+    def test_count_and_any_agree_with_full_detection(self):
+        features = mixed_features()
+        store = FootprintStore.from_features(features)
+        service = BuildingClashDetectService()
+        full = service._process_store(store)
+
+        count_query, any_query = ClashQuery("count"), ClashQuery("any")
+        count = service.summarize(store.ids, service._find_clashing_pairs(store, count_query), count_query)
+        self.assertEqual(count["clash_count"], len(full))
+        self.assertEqual(count["buildings"], dict(Counter(b for clash in full for b in clash.building_ids)))
+
+        found = service.summarize(store.ids, service._find_clashing_pairs(store, any_query), any_query)
+        self.assertEqual(found, {"type": "ClashSummary", "mode": "any", "clash_found": True,
+                                 "buildings": full[0].building_ids})
+
+    def test_summary_results_are_stored(self):
+        results = ResultStore(InMemoryTable())
+        far_apart = [f.model_dump() for f in random_features(2)]
+        far_apart[1]["geometry"]["coordinates"] = [[[900, 900], [910, 900], [910, 910], [900, 910], [900, 900]]]
+        body = {"task_id": "t-any", "input": {"features": far_apart, "query": {"mode": "any"}}}
+        with patch.object(building_clash_detect_service, "get_result_store", return_value=results):
+            BuildingClashDetectService().process_record({"messageId": "m", "body": json.dumps(body)})
+        self.assertEqual(results.fetch("t-any"), {"type": "ClashSummary", "mode": "any", "clash_found": False})
+
+
+if __name__ == '__main__':
+    unittest.main()
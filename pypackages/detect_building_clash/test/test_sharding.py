@@ -0,0 +1,108 @@
+import functools
+import json
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pypackages.common.local_aws import InMemoryQueue, InMemoryTable
+from pypackages.common.payload_store import LocalPayloadStore, offload_message
+from pypackages.common.result_storage import STATUS_COMPLETE, ResultStore
+from pypackages.detect_building_clash import building_clash_detect_service, sharding
+from pypackages.detect_building_clash.building_clash_detect_service import BuildingClashDetectService
+from pypackages.detect_building_clash.incremental import InMemoryProjectStateStore
+from pypackages.detect_building_clash.sharding import ShardQueue, shard_key
+from pypackages.detect_building_clash.test.test_batch_engine import star_feature
+from pypackages.detect_building_clash.test.test_spatial_index import random_features
+
+
+def task_record(task_id, features, query=None):
+    task_input = {"features": features}
+    if query is not None:
+        task_input["query"] = query
+    return {"messageId": task_id, "body": json.dumps({"task_id": task_id, "input": task_input})}
+
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        self.results = ResultStore(InMemoryTable())
+        patcher = patch.object(building_clash_detect_service, "get_result_store", return_value=self.results)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = InMemoryQueue()
+        self.service = BuildingClashDetectService(
+            shard_queue=ShardQueue("local-queue", self.queue), shard_min_features=100, shard_features=60
+        )
+        rng = random.Random(8)
+        features = random_features(400, seed=8) + [star_feature(f"star_{n}", rng) for n in range(100)]
+        self.features = [f.model_dump() for f in features]
+
+    def run_queue(self):
+        while self.queue.messages:
+            response = self.service.execute_batch({"Records": self.queue.drain()})
+            self.assertEqual(response, {"batchItemFailures": []})
+
+    def single_run(self, record):
+        with patch.object(building_clash_detect_service, "get_result_store",
+                          return_value=ResultStore(InMemoryTable())):
+            return BuildingClashDetectService().process_record(record)
+
+    def test_sharded_result_equals_a_single_run(self):
+        for query in (None, {"mode": "count"}, {"mode": "any"}, {"min_overlap_area": 10}):
+            with self.subTest(query=query):
+                record = task_record(f"task-{query}", self.features, query)
+                planned = self.service.process_record(record)
+                self.assertGreater(planned["shards"], 1)
+                self.assertIsNone(self.results.fetch(record["messageId"]))
+
+                self.run_queue()
+
+                expected = self.single_run(record)
+                self.assertEqual(self.results.fetch(record["messageId"]), expected)
+                self.assertEqual(self.results.status(record["messageId"])["status"], STATUS_COMPLETE)
+                for index in range(planned["shards"]):
+                    self.assertIsNone(self.results.status(shard_key(record["messageId"], index)))
+
+    def test_redelivered_shards_are_merged_once(self):
+        record = task_record("task", self.features)
+        self.service.process_record(record)
+        shards = list(self.queue.messages)
+        self.queue.messages.extend(shards[:2])
+        self.run_queue()
+        result = self.results.fetch("task")
+        self.assertGreater(len(result["features"]), 0)
+        self.assertEqual(result, self.single_run(record))
+
+    def test_large_shards_travel_as_claim_checks(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        payloads = LocalPayloadStore(directory.name)
+        self.service.shard_queue.payload_store = payloads
+        self.service.payload_store = payloads
+        record = task_record("task", self.features)
+        with patch.object(sharding, "offload_message", functools.partial(offload_message, max_inline_bytes=0)):
+            self.service.process_record(record)
+        self.assertTrue(all("payload" in json.loads(m["body"]) for m in self.queue.messages))
+        self.run_queue()
+        self.assertEqual(self.results.fetch("task"), self.single_run(record))
+
+    def test_small_tasks_are_not_sharded(self):
+        record = task_record("small", self.features[:50])
+        result = self.service.process_record(record)
+        self.assertEqual(self.queue.messages, [])
+        self.assertEqual(self.results.fetch("small"), result)
+
+    def test_project_tasks_are_detected_incrementally_not_sharded(self):
+        self.service.project_states = InMemoryProjectStateStore()
+        record = task_record("project", self.features)
+        body = json.loads(record["body"])
+        body["project_id"] = "campus"
+        record["body"] = json.dumps(body)
+        result = self.service.process_record(record)
+        self.assertEqual(self.queue.messages, [])
+        self.assertIn("campus", self.service.project_states.states)
+        self.assertEqual(result, self.single_run(task_record("project", self.features)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from pypackages.detect_building_clash.building_clash_detect_service import (
+    BuildingClashDetectService,
+    BuildingFeature,
+)
+from pypackages.detect_building_clash.spatial_index import (
+    brute_force_candidate_pairs,
+    candidate_pairs_3d,
+    strtree_candidate_pairs,
+)
+from shapely.geometry import box
+
+
+def random_features(count, seed=7):
+    rng = random.Random(seed)
+    features = []
+    for n in range(count):
+        x, y = rng.uniform(0, 200), rng.uniform(0, 200)
+        w, h = rng.uniform(5, 30), rng.uniform(5, 30)
+        features.append(BuildingFeature(
+            id=f"building_{n}",
+            properties={"elevation": rng.choice([0, 2, 5, 10]), "height": rng.choice([3, 4, 8])},
+            geometry={
+                "type": "Polygon",
+                "coordinates": [[[x, y], [x + w, y], [x + w, y + h], [x, y + h], [x, y]]],
+            },
+        ))
+    return features
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def test_strtree_pairs_are_sorted_subset_of_brute_force(self):
+        geoms = [box(0, 0, 10, 10), box(50, 50, 60, 60), box(5, 5, 15, 15), box(9, 9, 55, 55)]
+        pairs = strtree_candidate_pairs(geoms)
+        self.assertEqual(pairs.tolist(), [[0, 2], [0, 3], [1, 3], [2, 3]])
+        brute = {tuple(p) for p in brute_force_candidate_pairs(len(geoms)).tolist()}
+        self.assertTrue({tuple(p) for p in pairs.tolist()} <= brute)
+
+    def test_fewer_than_two_geometries(self):
+        self.assertEqual(strtree_candidate_pairs([box(0, 0, 1, 1)]).shape, (0, 2))
+        self.assertEqual(brute_force_candidate_pairs(1).shape, (0, 2))
+
+    def test_strtree_matches_brute_force_results(self):
+        features = random_features(150)
+        indexed = BuildingClashDetectService(candidate_search="strtree")._process_features(features)
+        brute = BuildingClashDetectService(candidate_search="brute_force")._process_features(features)
+        self.assertGreater(len(brute), 0)
+        self.assertEqual(indexed, brute)
+
+    def test_3d_search_prunes_vertically_disjoint_pairs(self):
+        # A podium with a tower on top, a basement below and a separate building.
+        geoms = [box(0, 0, 50, 50), box(10, 10, 20, 20), box(0, 0, 50, 50), box(100, 100, 110, 110)]
+        bottoms = np.array([0.0, 10.0, -5.0, 0.0])
+        tops = np.array([10.0, 60.0, 0.0, 10.0])
+        pairs, stats = candidate_pairs_3d(geoms, bottoms, tops)
+        self.assertEqual(pairs.tolist(), [])
+        self.assertEqual(stats.total_pairs, 6)
+        self.assertEqual(stats.vertical_pruned + stats.envelope_pruned, 6)
+
+        bottoms[1] = 5.0
+        pairs, stats = candidate_pairs_3d(geoms, bottoms, tops)
+        self.assertEqual(pairs.tolist(), [[0, 1]])
+        self.assertEqual(stats.candidate_pairs, 1)
+
+    def test_3d_search_matches_brute_force_on_both_strategies(self):
+        features = random_features(300, seed=3)
+        brute = BuildingClashDetectService(candidate_search="brute_force")._process_features(features)
+        for pairs_per_building in (0, 1000):
+            with patch("pypackages.detect_building_clash.spatial_index.SWEEP_PAIRS_PER_BUILDING",
+                       pairs_per_building):
+                service = BuildingClashDetectService(candidate_search="3d")
+                self.assertEqual(service._process_features(features), brute)
+                stats = service.candidate_stats
+                self.assertEqual(stats.strategy, "strtree" if pairs_per_building == 0 else "sweep")
+                self.assertEqual(stats.total_pairs - stats.vertical_pruned - stats.envelope_pruned,
+                                 stats.candidate_pairs)
+
+    def test_unknown_candidate_search(self):
+        with self.assertRaises(ValueError):
+            BuildingClashDetectService(candidate_search="quadtree")
+
+
+if __name__ == '__main__':
+    unittest.main()